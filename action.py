@@ -1,8 +1,32 @@
-import argparse, datetime, json, os, sys, pprint, re, subprocess, requests, platform, psutil, traceback, threading, time
+import argparse, datetime, functools, json, os, sys, pprint, re, subprocess, psutil, tempfile, traceback, threading, time, uuid
 from enum import Enum
-from google.cloud import storage
-
-REQUEST_TIMEOUT = 60 * 5
+from check_prompt_status import ComfyApiClient, NodeExecutionProfile, PromptExecutionError, free_server, get_output_filenames, interrupt_server
+from gcs_uploader import GcsUploader
+from log_shipper import LOG_SEGMENT_SIZE, LogShipper
+from api_reporter import DEFAULT_SPOOL_PATH, PAYLOAD_ENCODINGS, PayloadReporter
+from resource_sampler import ResourceSamples
+from benchmark import run_benchmark
+from workflow_scheduler import LINUX_ONLY_WORKFLOWS, select_workflows
+from cli_output import run_comfy_cli
+from instance_pool import ComfyInstance, launch_instance, parse_devices, run_sharded, stop_instances, wait_until_ready
+from process_accounting import ProcessTreeAccounting
+from golden_compare import GoldenComparer
+from results_store import DEFAULT_RESULTS_DB, ResultsStore
+from result_cache import DEFAULT_RESULT_CACHE_DIR, ResultCache
+from run_watchdog import BUDGET_HISTORY_RUNS, RunWatchdog, workflow_budget
+import tracing
+from tracing import span, tracer
+import gpu_metrics
+from gpu_metrics import GPU_METRICS_BACKENDS
+from machine_stats import MachineStatsCollector, get_comfy_process, get_gpu_name, get_vramtotal
+
+WORKFLOW_TIMEOUT = 600 # 10min timeout for workflow
+# comfy-cli and the API wait get this much longer than the budget, so the watchdog aborts first and reports why
+TIMEOUT_GRACE = 30
+# How long the model prefetch gets to notice it should stop and write its final report
+PREFETCH_STOP_TIMEOUT = 30
+# Extra input benchmark runs add to every node, ComfyUI ignores inputs a node does not declare
+BENCHMARK_NONCE_INPUT = "benchmark_nonce"
 
 # Reference: https://github.com/Comfy-Org/registry-backend/blob/main/openapi.yml#L2031
 class WfRunStatus(Enum):
@@ -10,96 +34,104 @@ class WfRunStatus(Enum):
     Failed = "WorkflowRunStatusFailed"
     Completed = "WorkflowRunStatusCompleted"
 
-def get_comfy_process():
-    comfy_processes = []
-    process_list = list(psutil.process_iter(['pid', 'exe', 'cmdline']))
-    python_processes = [proc for proc in process_list if proc.info['exe'] is not None and 'python' in proc.info['exe'].lower()]
-    for process in python_processes:
-        cmdline = process.info['cmdline']
-        if cmdline and 'main.py' in ' '.join(cmdline):
-            comfy_processes.append(process)
-
-    if len(comfy_processes) == 1:
-        return comfy_processes[0]
-
-    print(f"Found {len(comfy_processes)} comfy processes out of {len(process_list)} total processes ({len(python_processes)} python), expected 1, will not measure RAM usage")
-    return None
-
-comfy_process = get_comfy_process()
-
-def get_gpu():
-    try:
-        import GPUtil
-        gpus = GPUtil.getGPUs()
-        return gpus[0] if gpus else None
-    except:
-        return None
-
-def get_gpu_name():
-    try:
-        gpu = get_gpu()
-        return gpu.name if gpu else "No GPU detected"
-    except:
-        return "Unable to detect GPU"
-
-def get_vramtotal():
-    try:
-        gpu = get_gpu()
-        return f"{gpu.memoryTotal} MiB" if gpu else "No GPU detected"
-    except:
-        return "Unable to detect GPU"
-
-def get_pip_freeze():
-    try:
-        return subprocess.check_output([sys.executable, '-m', 'pip', 'freeze']).decode('utf-8')
-    except:
-        traceback.print_exc()
-        return "Unable to get pip freeze output"
-
-def measure_vram(vram_time_series, stop_event):
+def measure_vram(samples, stop_event, instance=None, accounting=None, watchdog=None):
     stopped_for = 0
     while True:
-        gpu = get_gpu()
-        vram = gpu.memoryUsed if gpu else 0
-        gpu_usage = gpu.load if gpu else 0
-        cpu_ram = comfy_process.memory_info().rss / (1024 * 1024) if comfy_process else 0
-        cpu_usage = psutil.cpu_percent()
-        vram_time_series.append(f"{vram} MiB,{gpu_usage*100:.1f},{cpu_ram} MiB,{cpu_usage:.2f}")
-        time.sleep(0.5)
+        # One read covers every GPU, the samples themselves follow the GPU the server runs on
+        gpus = gpu_metrics.get_backend().read()
+        samples.record_gpus(gpus)
+        if instance is None:
+            device = 0
+            comfy_process = get_comfy_process()
+        else:
+            # Only this instance's GPU and process, other instances run on the machine at the same time
+            device = instance.device
+            comfy_process = instance.get_process()
+        gpu = next((gpu for gpu in gpus if gpu.index == device), None) if device is not None else None
+        vram = gpu.memory_used if gpu else 0
+        gpu_usage = gpu.utilization if gpu else 0
+        try:
+            cpu_ram = comfy_process.memory_info().rss / (1024 * 1024) if comfy_process else 0
+            cpu_usage = comfy_process.cpu_percent() if instance is not None and comfy_process else psutil.cpu_percent()
+        except psutil.NoSuchProcess:
+            cpu_ram = 0
+            cpu_usage = 0
+        timestamp = time.monotonic()
+        samples.append(timestamp, vram, gpu_usage, cpu_ram, cpu_usage)
+        # The server's own process tree, system-wide CPU is near zero on a many-core host even while a model loads
+        tree_cpu_usage = accounting.sample() if accounting is not None else None
+        if watchdog is not None:
+            watchdog.check(timestamp, gpu_usage, tree_cpu_usage)
+        time.sleep(samples.interval)
         if stop_event.is_set():
             stopped_for += 1
             if stopped_for > 2:
                 break
 
-# https://github.com/Comfy-Org/registry-backend/blob/main/openapi.yml#L2037
-machine_stats = {
-    "machine_name": platform.node(),
-    "os_version": f"{platform.system()} {platform.release()}",
-    "gpu_type": get_gpu_name(),
-    "cpu_capacity": f"{psutil.cpu_count()} cores",
-    "initial_cpu": f"{psutil.cpu_count() - psutil.cpu_count(logical=False)} cores available",
-    "memory_capacity": f"{psutil.virtual_memory().total / (1024 ** 3):.2f} GB",
-    "initial_ram": f"{psutil.virtual_memory().available / (1024 ** 3):.2f} GB available",
-    "vram_time_series": {},
-    "disk_capacity": f"{psutil.disk_usage('/').total / (1024 ** 3):.2f} GB",
-    "initial_disk": f"{psutil.disk_usage('/').free / (1024 ** 3):.2f} GB available",
-    "pip_freeze": get_pip_freeze()
-}
-
 def read_json_file(file_path):
     with open(file_path, "r", encoding="utf-8") as file:
         return json.load(file)
 
 
-def post_json_to_server(json_data, url):
-    return requests.post(url, json=json_data, timeout=REQUEST_TIMEOUT)
+@functools.lru_cache(maxsize=None)
+def load_startup_profile(file_path):
+    # Written by poll_server_start.py while the server started, absent when it was run without --profile-output
+    if not file_path or not os.path.exists(file_path):
+        return None
+    try:
+        return read_json_file(file_path)
+    except (OSError, json.JSONDecodeError):
+        traceback.print_exc()
+        return None
+
+
+def load_prefetch_report(file_path):
+    # Rewritten by default-models-prep.py --prefetch after every model, so it is read again for every payload
+    if not file_path or not os.path.exists(file_path):
+        return None
+    try:
+        return read_json_file(file_path)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def prefetch_running():
+    for process in psutil.process_iter(["cmdline"]):
+        cmdline = " ".join(process.info["cmdline"] or [])
+        if "default-models-prep.py" in cmdline and "--prefetch" in cmdline:
+            return True
+    return False
 
 
-def get_status(prompt_id, url):
-    response = requests.get(f"{url}/{prompt_id}", timeout=REQUEST_TIMEOUT)
-    if response.status_code == 200:
-        return response.json()
-    return None
+def stop_model_prefetch(report_path, timeout=PREFETCH_STOP_TIMEOUT):
+    """
+        Tells default-models-prep.py --prefetch to stop reading models, so it doesn't compete with the workflows for
+        I/O, and waits for its final report. Returns the report, None if no prefetch ran.
+    """
+    if not report_path:
+        return None
+    if not os.path.exists(report_path) and not prefetch_running():
+        return None
+    stop_path = f"{report_path}.stop"
+    # Also created when the prefetch hasn't written its report yet, it then stops before its first model
+    with open(stop_path, "w", encoding="utf-8"):
+        pass
+    deadline = time.monotonic() + timeout
+    while True:
+        report = load_prefetch_report(report_path)
+        if report is None:
+            return None
+        if report.get("finished"):
+            break
+        if time.monotonic() > deadline:
+            print(f"Model prefetch did not stop within {timeout}s")
+            return report
+        time.sleep(0.1)
+    # The prefetch is done with it, it would only be left behind in the checkout
+    os.remove(stop_path)
+    if report.get("stopped"):
+        print(f"Stopped the model prefetch after {report['warmed_bytes'] / (1024 ** 3):.2f} GB, {len(report['not_reached'])} models not reached")
+    return report
 
 
 def make_unix_safe(filename):
@@ -108,27 +140,14 @@ def make_unix_safe(filename):
 
     return safe_filename
 
-def is_completed(status_response, prompt_id):
-    # Check if the expected fields exist in the response
-    return (
-        status_response
-        and prompt_id in status_response
-        and "status" in status_response[prompt_id]
-        and status_response[prompt_id]["status"].get("completed", False)
-    )
-
-
-def upload_to_gcs(bucket_name: str, destination_blob_name: str, source_file_name: str):
-    print(f"Uploading file {source_file_name} to GCS bucket {bucket_name} as {destination_blob_name}")
-    storage_client = storage.Client()
-    bucket = storage_client.get_bucket(bucket_name)
-
-    blob = bucket.blob(destination_blob_name)
-    blob.upload_from_filename(source_file_name)
-    print(f"File {source_file_name} uploaded to {destination_blob_name}")
-
+def output_blob_name(gs_path, index):
+    """
+        Blob of a workflow's index-th output: the first one at gs_path itself, which the payload reports, the others
+        suffixed with their position so no two outputs share a blob.
+    """
+    return gs_path if index == 0 else f"{gs_path}_{index}"
 
-def send_payload_to_api(args, output_files_gcs_paths, logs_gcs_path, workflow_name, start_time, end_time, vram_time_series, status=WfRunStatus.Completed, can_retry=True):
+def send_payload_to_api(reporter, machine_stats_collector, args, output_files_gcs_paths, logs_gcs_path, workflow_name, start_time, end_time, resource_samples, status=WfRunStatus.Completed, node_profile=None, instance=None, accounting=None, golden_comparison=None, results_store=None, watchdog=None, log_slice=None):
 
     is_pr = args.branch_name.endswith("/merge")
     pr_number = None
@@ -138,22 +157,19 @@ def send_payload_to_api(args, output_files_gcs_paths, logs_gcs_path, workflow_na
     # Create the payload as a dictionary
     # Should be mapping to https://github.com/Comfy-Org/registry-backend/blob/main/openapi.yml#L26
 
-    local_machine_stats = machine_stats.copy()
+    local_machine_stats = machine_stats_collector.get().copy()
 
     available_ram = psutil.virtual_memory().available / (1024 ** 2)
 
-    local_machine_stats["vram_time_series"] = {f"{i / 2} seconds": vram_time_series[i] for i in range(len(vram_time_series))}
-    local_machine_stats["vram_time_series"]["total"] = f"{get_vramtotal()},{available_ram} MiB"
-    vram_only = [float(vram.split(",")[0].split(" ")[0]) for vram in vram_time_series]
-
-    avg_vram = 0
-    peak_vram = 0
-    if -1 in vram_only:
-        avg_vram = -1
-        peak_vram = -1
+    resource_series = None
+    if args.payload_encoding == "compact":
+        # One numeric array per column instead of a formatted string per sample
+        resource_series = resource_samples.to_columns()
+        local_machine_stats["vram_time_series"] = {}
     else:
-        avg_vram = sum(vram_only) / len(vram_only)
-        peak_vram = max(vram_only)
+        local_machine_stats["vram_time_series"] = resource_samples.to_time_series()
+    local_machine_stats["vram_time_series"]["total"] = f"{get_vramtotal(instance.device if instance is not None else 0)},{available_ram} MiB"
+    resource_summary = resource_samples.summary()
 
     payload = {
         "repo": args.repo,
@@ -164,6 +180,8 @@ def send_payload_to_api(args, output_files_gcs_paths, logs_gcs_path, workflow_na
         "bucket_name": args.gsc_bucket_name,
         "output_files_gcs_paths": output_files_gcs_paths,
         "comfy_logs_gcs_path": logs_gcs_path,
+        # Byte range of the server log this run covers and the gzip slice of it under comfy_logs_gcs_path
+        "comfy_log_slice": log_slice,
         "commit_hash": args.commit_hash,
         "commit_time": args.commit_time,
         "commit_message": args.commit_message,
@@ -171,8 +189,8 @@ def send_payload_to_api(args, output_files_gcs_paths, logs_gcs_path, workflow_na
         "branch_name": args.branch_name,
         "start_time": start_time,
         "end_time": end_time,
-        "avg_vram": int(avg_vram),
-        "peak_vram": int(peak_vram),
+        "avg_vram": int(resource_summary["vram"]["mean"]),
+        "peak_vram": int(resource_summary["vram"]["max"]),
         "pr_number": pr_number,
         # TODO: support PR author
         # "author": args.,
@@ -181,163 +199,490 @@ def send_payload_to_api(args, output_files_gcs_paths, logs_gcs_path, workflow_na
         "python_version": args.python_version,
         "pytorch_version": args.torch_version,
         "status": status.value,
-        "machine_stats": local_machine_stats
+        "machine_stats": local_machine_stats,
+        "resource_summary": resource_summary,
+        "resource_series": resource_series,
+        "resource_phases": resource_samples.phase_summary(),
+        # Every GPU of the machine over this workflow, and what reading them cost
+        "gpus": resource_samples.gpu_summary(),
+        "gpu_metrics_overhead": gpu_metrics.get_backend().overhead(),
+        # CPU time, I/O and memory of the server's whole process tree over this workflow
+        "process_accounting": accounting.to_dict() if accounting is not None else None,
+        "startup_profile": load_startup_profile(args.startup_profile),
+        # Models read into the page cache while the server started
+        "model_prefetch": load_prefetch_report(args.prefetch_report),
+        "harness_startup": machine_stats_collector.timings,
+        # Only available in the api execution mode, comfy-cli does not expose execution events
+        "node_profile": node_profile.to_dict() if node_profile is not None else None,
+        "golden_comparison": golden_comparison,
+        # Time budget of the run and why it was aborted, if it was
+        "watchdog": watchdog.to_dict() if watchdog is not None else None,
+        # Set when workflows are sharded across several servers
+        "comfy_instance": instance.describe() if instance is not None else None
     }
 
-    # Convert payload dictionary to a JSON string
-    payload_json = json.dumps(payload)
-
-    # Send POST request
-    headers = {"Content-Type": "application/json"}
-    response = None
-    try:
-        response = requests.post(args.api_endpoint, headers=headers, data=payload_json, timeout=REQUEST_TIMEOUT)
-    except Exception as e:
-        if can_retry:
-            print(f"API request failed with exception {e}, retrying in 10 seconds")
-            time.sleep(10)
-            send_payload_to_api(args, output_files_gcs_paths, logs_gcs_path, workflow_name, start_time, end_time, vram_time_series, status, False)
-            return
-        print(f"API request failed with exception {e}")
-        traceback.print_exc()
-        raise e
+    print("#### Payload ####")
     try:
-        print("#### Payload ####")
         pprint.pprint(payload)
-        print("#### Response ####")
-        try:
-            pprint.pprint(response.json())
-        except json.JSONDecodeError:
-            print(f"Invalid JSON: {response.text}")
     except:
         # can sometimes have random encoding errors here
         traceback.print_exc()
 
-    # Write response to application.log
-    log_file_path = "./application.log"
-    with open(log_file_path, "w", encoding="utf-8") as log_file:
-        log_file.write("\n##### Comfy CI Post Response #####\n")
-        log_file.write(response.text)
-
-    # Check the response code
-    if response.status_code != 200:
-        if can_retry:
-            print(f"API request failed with status code {response.status_code} and text {response.text}, retrying in 10 seconds")
-            time.sleep(10)
-            send_payload_to_api(args, output_files_gcs_paths, logs_gcs_path, workflow_name, start_time, end_time, vram_time_series, status, False)
-            return
-        print(f"API request failed with status code {response.status_code} and response body")
-        print(response.text)
-        exit(1)
-    else:
-        print("API request successful")
+    if results_store is not None:
+        try:
+            results_store.record(payload)
+        except Exception:
+            traceback.print_exc()
 
-    return response.status_code
+    # Delivery (with retries) happens in the background, a registry hiccup must not hold up or fail the run
+    reporter.submit(payload)
+    return payload
 
 
-def parse_raw_output(full_output):
+def send_cached_payload(reporter, args, cached_payload, output_files_gcs_paths, logs_gcs_path, fingerprint, results_store=None):
     """
-        This is a hack, because we're not calling the Comfy JSON API directly, we need to reparse the output list from the Comfy-CLI text dump.
-        TODO: Comfy-CLI should be able to yield usable JSONs directly instead of this cursed manual parse
+        Reports a workflow whose result was reused from an earlier run with the same inputs: that run's metrics and
+        outputs under this job's identity. Nothing ran in this job, so its start and end are the time of the lookup
+        and there is no log slice or watchdog; the source run's times are kept under result_cache.
     """
-    outputs_start = full_output.find('Outputs:')
-    if outputs_start == -1:
-        return None
-
-    output = full_output[outputs_start + len('Outputs:'):].replace('\r', '\n').strip()
+    now = int(datetime.datetime.now().timestamp())
+    payload = dict(cached_payload)
+    for field in ("repo", "job_id", "run_id", "commit_time", "commit_message", "branch_name", "job_trigger_user"):
+        payload[field] = getattr(args, field)
+    payload["bucket_name"] = args.gsc_bucket_name
+    payload["output_files_gcs_paths"] = output_files_gcs_paths
+    payload["comfy_logs_gcs_path"] = logs_gcs_path
+    payload["comfy_log_slice"] = None
+    payload["pr_number"] = args.branch_name.split("/")[0] if args.branch_name.endswith("/merge") else None
+    payload["start_time"] = now
+    payload["end_time"] = now
+    payload["watchdog"] = None
+    payload["result_cache"] = {
+        "fingerprint": fingerprint,
+        "source_run_id": cached_payload.get("run_id"),
+        "source_job_id": cached_payload.get("job_id"),
+        "source_start_time": cached_payload.get("start_time"),
+        "source_end_time": cached_payload.get("end_time"),
+    }
+    print(f"#### Cached payload of run {cached_payload.get('run_id')} reused for {payload.get('workflow_name')} ####")
+    if results_store is not None:
+        try:
+            results_store.record(payload)
+        except Exception:
+            traceback.print_exc()
+    reporter.submit(payload)
+    return payload
 
-    outputnl = output.find('\n')
-    if outputnl != -1:
-        output = output[:outputnl]
 
-    lines = output.split('\n')
-    lines = [line.strip() for line in lines if line.strip()]
+def run_workflow_cli(args, file_path, counter, resource_samples, on_output=None, timeout=WORKFLOW_TIMEOUT, abort=None):
+    """
+        Runs a workflow through comfy-cli, handing each output to on_output as soon as comfy-cli prints it.
+    """
+    reader = run_comfy_cli(file_path, timeout, on_output=on_output, on_phase=lambda phase, timestamp: resource_samples.mark(timestamp, phase), abort=abort)
+    output_filenames = reader.outputs
+    if not output_filenames:
+        output_filename = f"{args.output_file_prefix}_{counter:05}_.png"
+        if not os.path.exists(f"{args.workspace_path}/output/{output_filename}"):
+            raise RuntimeError("Invalid output from Comfy-CLI, no outputs found")
+        output_filenames = [output_filename]
+        if on_output is not None:
+            on_output(output_filename)
+    return output_filenames
+
+
+def run_workflow_api(comfy_client, file_path, node_profile, on_output=None, timeout=WORKFLOW_TIMEOUT, abort=None):
+    prompt_id = comfy_client.queue_prompt(node_profile.workflow)
+    print(f"Queued workflow {file_path} as prompt {prompt_id}")
+    history_entry = comfy_client.wait_for_prompt(prompt_id, timeout, node_profile, abort)
+    output_filenames = get_output_filenames(history_entry)
+    if not output_filenames:
+        raise PromptExecutionError(f"Prompt {prompt_id} finished without any outputs", prompt_id)
+    if on_output is not None:
+        for filename in output_filenames:
+            on_output(filename)
+    return output_filenames
 
-    filenames = []
-    for line in lines:
-        fnind = line.find('filename=')
-        if fnind == -1:
-            continue
-        fnstart = fnind + len('filename=')
-        fnend = line.find('&', fnstart)
-        if fnend == -1:
-            fnend = len(line)
-        filenames.append(line[fnstart:fnend])
 
-    return filenames
+def uncached_workflow(workflow, nonce):
+    """
+        A copy of workflow with the nonce as an extra input of every node. ComfyUI keys its execution cache on node
+        inputs, so every node runs again instead of the whole prompt being served from an earlier identical one.
+    """
+    return {
+        node_id: {**node, "inputs": {**node.get("inputs", {}), BENCHMARK_NONCE_INPUT: nonce}}
+        for node_id, node in workflow.items()
+    }
 
 
-def main(args):
-    names = args.comfy_workflow_names
-    if names == "auto":
-        names = "sd15_default.json,sd15_lora.json,xl_default.json,xl_sketch_control.json,mixed_15_xl_addrefine.json"
-        if args.os == "linux":
-            # Note: SD3 and Flux are intentionally Linux-only (due to RAM limits on other main machines) and also intentionally at the end
-            names += ",sd3_default.json,sd3_multi_prompt.json,sd3-single-t5.json,flux_schnell_fp8_default.json"
-    workflow_files = names.split(",")
-    print(f"Running workflows: {workflow_files}")
-    counter = 1
+def measure_workflow_run(args, comfy_client, file_path):
+    """
+        Runs a workflow once for benchmarking, without resolving or uploading its outputs. Returns (wall_seconds, ResourceSamples).
+        The server's execution cache is freed first (and its models unloaded with --benchmark-unload-models) and
+        the prompt made unique, so repeated runs execute every node instead of hitting the cache.
+    """
+    try:
+        if comfy_client is not None:
+            comfy_client.free(args.benchmark_unload_models)
+        else:
+            free_server(args.comfy_server_url, args.benchmark_unload_models)
+    except Exception as e:
+        # The unique prompt alone still bypasses the execution cache
+        print(f"Could not free the server's memory before the run ({e})")
+    workflow = uncached_workflow(read_json_file(file_path), uuid.uuid4().hex)
+
+    stop_event = threading.Event()
+    resource_samples = ResourceSamples(args.sample_interval)
+    vram_thread = threading.Thread(target=measure_vram, args=(resource_samples, stop_event))
+    vram_thread.start()
+    temp_path = None
+    try:
+        if comfy_client is not None:
+            start = time.perf_counter()
+            run_workflow_api(comfy_client, file_path, NodeExecutionProfile(workflow), timeout=args.workflow_timeout)
+        else:
+            with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False, encoding="utf-8") as f:
+                json.dump(workflow, f)
+                temp_path = f.name
+            start = time.perf_counter()
+            run_comfy_cli(temp_path, args.workflow_timeout, on_phase=lambda phase, timestamp: resource_samples.mark(timestamp, phase))
+        wall_seconds = time.perf_counter() - start
+    finally:
+        stop_event.set()
+        vram_thread.join()
+        if temp_path is not None:
+            os.remove(temp_path)
+    return wall_seconds, resource_samples
+
+
+def at_least_one(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
+
+def workflow_time_budget(args, results_store, workflow_file_name, gpu_type):
+    """
+        Returns (seconds, source) a workflow may run for: derived from its earlier completed runs on this OS and GPU
+        model when there are enough of them, args.workflow_timeout otherwise.
+    """
+    if args.adaptive_timeout and results_store is not None:
+        try:
+            durations = results_store.durations(workflow_file_name, args.os, gpu_type, limit=BUDGET_HISTORY_RUNS)
+        except Exception:
+            traceback.print_exc()
+            durations = []
+        budget = workflow_budget(durations, args.timeout_percentile, args.timeout_factor, args.max_workflow_timeout)
+        if budget is not None:
+            return budget, f"p{round(args.timeout_percentile * 100)} of {len(durations)} runs x {args.timeout_factor}"
+    return args.workflow_timeout, "fixed"
 
-    for workflow_file_name in workflow_files:
-        gs_path = make_unix_safe(f"output-files/{args.github_action_workflow_name}-{args.os}-{args.python_version}-{args.cuda_version}-{args.torch_version}-{workflow_file_name}-run-{args.run_id}")
-        logs_gs_path = make_unix_safe(f"logs/{args.job_id}-{args.os}-{args.python_version}-{args.cuda_version}-{args.torch_version}-{workflow_file_name}-run-{args.run_id}")
-        #send_payload_to_api(args, gs_path, logs_gs_path, workflow_file_name, 0, 0, WfRunStatus.Started)
-        file_path = f"workflows/{workflow_file_name}"
 
-        print(f"Running workflow {file_path}")
-        start_time = int(datetime.datetime.now().timestamp())
-        output_filenames = []
+def compare_outputs(golden_comparer, workflow_file_name, output_paths):
+    try:
+        with span("golden_compare", "golden", workflow=workflow_file_name, outputs=len(output_paths)) as trace_args:
+            comparison = golden_comparer.compare(workflow_file_name, output_paths)
+            trace_args["status"] = comparison["status"]
+    except Exception as e:
+        # A broken comparison must not lose the run's results
+        traceback.print_exc()
+        return {"status": "error", "error": str(e), "outputs": []}
+    print(f"Golden comparison of {workflow_file_name}: {comparison['status']}")
+    return comparison
 
-        stop_event = threading.Event()
-        vram_time_series = []
-        vram_thread = threading.Thread(target=measure_vram, args=(vram_time_series, stop_event))
-        vram_thread.start()
 
-        try:
-            result = subprocess.run(
-                [
-                    "comfy", "--skip-prompt", "--no-enable-telemetry",
-                    "run",
-                    "--workflow", file_path,
-                    "--timeout", "600" # 10min timeout for workflow
-                ],
-                check=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                env=os.environ,
-            )
-
-            stop_event.set()
-            vram_thread.join()
-
-            full_output = f"{result.stdout}"
-            print(f"stdout: {full_output}")
-            print(f"stderr: {result.stderr}")
-            output_filenames = parse_raw_output(full_output)
-            if output_filenames is None:
-                if not os.path.exists(f"{args.workspace_path}/output/{args.output_file_prefix}_{counter:05}_.png"):
-                    raise RuntimeError("Invalid output from Comfy-CLI, no outputs found")
-                output_filenames = [f"{args.output_file_prefix}_{counter:05}_.png"]
-
-        except subprocess.CalledProcessError as e:
-            stop_event.set()
-            vram_thread.join()
-            send_payload_to_api(args, gs_path, logs_gs_path, workflow_file_name, start_time, int(datetime.datetime.now().timestamp()), vram_time_series, WfRunStatus.Failed)
+def trace_workflow_run(track, workflow_file_name, run_started, resource_samples, node_profile, status):
+    """
+        Adds a workflow's execution, its comfy-cli phases or node spans and its resource samples to the trace.
+        track names the server it ran on, so sharded runs get their own tracks.
+    """
+    if not tracer.enabled:
+        return
+    run_ended = time.monotonic()
+    tracer.complete("execute", tracer.to_us(run_started), tracer.to_us(run_ended), "workflow", {"workflow": workflow_file_name, "status": status.value})
+    for i, (phase, start) in enumerate(resource_samples.phases):
+        end = resource_samples.phases[i + 1][1] if i + 1 < len(resource_samples.phases) else run_ended
+        tracer.complete(phase, tracer.to_us(start), tracer.to_us(end), "phase", {"workflow": workflow_file_name}, track=f"{track} phases")
+    if node_profile is not None:
+        for node_id, start_ms, end_ms in node_profile.spans:
+            node = node_profile.workflow.get(node_id, {})
+            tracer.complete(node.get("class_type") or str(node_id), tracer.wall_to_us(start_ms / 1000), tracer.wall_to_us(end_ms / 1000), "node", {"workflow": workflow_file_name, "node_id": node_id}, track=f"{track} nodes")
+    tracer.counters(track, resource_samples.timestamps, resource_samples.columns)
+
+
+def trace_server_startup(profile):
+    """
+        Adds the server startup measured by poll_server_start.py, which ran before this process, to the trace.
+    """
+    origin = profile.get("spawn_time") or profile.get("poll_start_time")
+    if not origin or profile.get("ready") is None:
+        return
+    ready = origin + profile["ready"]
+    tracer.complete("server_startup", tracer.wall_to_us(origin), tracer.wall_to_us(ready), "startup", {"spawn_time_source": profile.get("spawn_time_source")}, track="server startup")
+    phase_start = origin
+    for phase, seconds in profile.get("phases", {}).items():
+        tracer.complete(phase, tracer.wall_to_us(phase_start), tracer.wall_to_us(phase_start + seconds), "startup", track="server startup")
+        phase_start += seconds
+    if profile.get("poll_start_time"):
+        tracer.complete("readiness_polling", tracer.wall_to_us(profile["poll_start_time"]), tracer.wall_to_us(ready), "startup", {"attempts": profile.get("probe_attempts")}, track="server readiness")
+
+
+def trace_model_prefetch(report):
+    for entry in report.get("models", []):
+        if entry.get("status") == "warmed":
+            tracer.complete(entry["model"], tracer.wall_to_us(entry["started_at"]), tracer.wall_to_us(entry["started_at"] + entry["seconds"]), "startup", {"bytes": entry["bytes"]}, track="model prefetch")
+
+
+def write_trace(args):
+    profile = load_startup_profile(args.startup_profile)
+    if profile:
+        trace_server_startup(profile)
+    prefetch_report = load_prefetch_report(args.prefetch_report)
+    if prefetch_report:
+        trace_model_prefetch(prefetch_report)
+    event_count = tracer.write(args.trace_output)
+    print(f"Wrote {event_count} trace events to {args.trace_output}, open it in https://ui.perfetto.dev")
+
+
+def run_and_report_workflow(args, workflow_file_name, counter, comfy_client, uploader, reporter, machine_stats_collector, instance=None, golden_comparer=None, results_store=None, result_cache=None, log_shipper=None):
+    """
+        Runs one workflow, uploads its outputs and reports it to the API. instance is the server it runs on when
+        workflows are sharded across several, comfy_client then talks to that server.
+        With a log_shipper, the part of the server log written while the workflow ran is uploaded to logs_gs_path.
+        With a result_cache, a workflow whose inputs match an earlier successful run reuses that run's outputs and
+        metrics instead of running again (unless args.force_rerun).
+        Returns (golden comparison of the outputs or None without a golden_comparer, whether the workflow ran).
+    """
+    output_dir = instance.output_dir if instance is not None and instance.output_dir else f"{args.workspace_path}/output"
+    gs_path = make_unix_safe(f"output-files/{args.github_action_workflow_name}-{args.os}-{args.python_version}-{args.cuda_version}-{args.torch_version}-{workflow_file_name}-run-{args.run_id}")
+    logs_gs_path = make_unix_safe(f"logs/{args.job_id}-{args.os}-{args.python_version}-{args.cuda_version}-{args.torch_version}-{workflow_file_name}-run-{args.run_id}")
+    #send_payload_to_api(reporter, machine_stats_collector, args, gs_path, logs_gs_path, workflow_file_name, 0, 0, WfRunStatus.Started)
+    file_path = f"workflows/{workflow_file_name}"
+
+    fingerprint = None
+    if result_cache is not None:
+        with span("result_cache_lookup", "cache") as trace_args:
+            fingerprint = result_cache.fingerprint(read_json_file(file_path), args)
+            cached = None if args.force_rerun else result_cache.lookup(fingerprint)
+            trace_args["hit"] = cached is not None
+        if cached is not None:
+            cached_payload, cached_output_paths = cached
+            print(f"Inputs of {file_path} match run {cached_payload.get('run_id')} (fingerprint {fingerprint[:16]}), reusing its {len(cached_output_paths)} outputs")
+            for index, output_path in enumerate(cached_output_paths):
+                uploader.submit(output_blob_name(gs_path, index), output_path)
+            send_cached_payload(reporter, args, cached_payload, gs_path, logs_gs_path, fingerprint, results_store)
+            return cached_payload.get("golden_comparison"), False
+
+    print(f"Running workflow {file_path}" + (f" on instance {instance.name}" if instance is not None else ""))
+    start_time = int(datetime.datetime.now().timestamp())
+    output_filenames = []
+    node_profile = None
+
+    stop_event = threading.Event()
+    resource_samples = ResourceSamples(args.sample_interval)
+    accounting = ProcessTreeAccounting(instance.get_process() if instance is not None else get_comfy_process())
+    accounting.start()
+    # The same name machine stats report as gpu_type, read from the GPU backend so the first workflow doesn't wait for
+    # the background machine stats collection (pip freeze) to finish
+    budget, budget_source = workflow_time_budget(args, results_store, workflow_file_name, get_gpu_name())
+    server_url = instance.url if instance is not None else args.comfy_server_url
+    # Stops the prompt on the server too, killing comfy-cli alone would leave it running there
+    watchdog = RunWatchdog(budget, budget_source, args.stall_window, args.stall_gpu_threshold, args.stall_cpu_threshold, on_abort=lambda: interrupt_server(server_url))
+    timeout = int(budget) + TIMEOUT_GRACE
+    print(f"Time budget of {file_path}: {budget:.0f}s ({budget_source})")
+    vram_thread = threading.Thread(target=measure_vram, args=(resource_samples, stop_event, instance, accounting, watchdog))
+    vram_thread.start()
+
+    # Outputs start uploading as soon as they are reported, while the rest of the workflow still runs
+    uploaded_outputs = []
+
+    def upload_output(filename, gs_path=gs_path):
+        uploader.submit(output_blob_name(gs_path, len(uploaded_outputs)), os.path.join(output_dir, filename))
+        uploaded_outputs.append(filename)
+
+    trace_track = instance.name if instance is not None else "comfy"
+    if log_shipper is not None:
+        log_shipper.start_slice(workflow_file_name, f"{logs_gs_path}/application.log.gz", instance.log_path if instance is not None else None)
+    run_started = time.monotonic()
+    try:
+        if comfy_client is not None:
+            node_profile = NodeExecutionProfile(read_json_file(file_path))
+            output_filenames = run_workflow_api(comfy_client, file_path, node_profile, upload_output, timeout, watchdog.abort)
+        else:
+            output_filenames = run_workflow_cli(args, file_path, counter, resource_samples, upload_output, timeout, watchdog.abort)
+
+        stop_event.set()
+        vram_thread.join()
+        accounting.finish()
+        trace_workflow_run(trace_track, workflow_file_name, run_started, resource_samples, node_profile, WfRunStatus.Completed)
+
+    except (subprocess.CalledProcessError, PromptExecutionError) as e:
+        stop_event.set()
+        vram_thread.join()
+        accounting.finish()
+        # Aborted runs are reported as failed, the registry has no status for them; watchdog.abort_reason says why
+        status = WfRunStatus.Failed
+        trace_workflow_run(trace_track, workflow_file_name, run_started, resource_samples, node_profile, status)
+        log_slice = log_shipper.end_slice(workflow_file_name, status.value) if log_shipper is not None else None
+        send_payload_to_api(reporter, machine_stats_collector, args, gs_path, logs_gs_path, workflow_file_name, start_time, int(datetime.datetime.now().timestamp()), resource_samples, status, node_profile, instance, accounting, results_store=results_store, watchdog=watchdog, log_slice=log_slice)
+        if watchdog.reason is not None:
+            print(f"Workflow {file_path} aborted ({watchdog.reason}) after {watchdog.aborted_after:.0f}s")
+        if isinstance(e, subprocess.CalledProcessError):
             print("Error STD Out:", e.stdout)
             print("Error:", e.stderr)
-            raise e
-        finally:
-            stop_event.set()
+        else:
+            print("Error:", e)
+        raise e
+    finally:
+        stop_event.set()
+
+    print(f"Workflow {file_path} completed")
+    end_time = int(datetime.datetime.now().timestamp())
+    log_slice = log_shipper.end_slice(workflow_file_name, WfRunStatus.Completed.value) if log_shipper is not None else None
+    print(f"Outputs of {file_path}: {output_filenames}")
+    golden_comparison = None
+    if golden_comparer is not None:
+        golden_comparison = compare_outputs(golden_comparer, workflow_file_name, [os.path.join(output_dir, filename) for filename in output_filenames])
+
+    with span("send_payload_to_api", "api", workflow=workflow_file_name):
+        payload = send_payload_to_api(reporter, machine_stats_collector, args, gs_path, logs_gs_path, workflow_file_name, start_time, end_time, resource_samples, WfRunStatus.Completed, node_profile, instance, accounting, golden_comparison, results_store, watchdog, log_slice)
+    if result_cache is not None:
+        try:
+            with span("result_cache_store", "cache"):
+                result_cache.store(fingerprint, payload, [os.path.join(output_dir, filename) for filename in output_filenames])
+        except OSError:
+            traceback.print_exc()
+    return golden_comparison, True
 
-        print(f"Workflow {file_path} completed")
-        end_time = int(datetime.datetime.now().timestamp())
 
-        for filename in output_filenames:
-            upload_to_gcs(args.gsc_bucket_name, gs_path, f"{args.workspace_path}/output/{filename}")
+def main(args):
+    gpu_metrics.configure(args.gpu_metrics, args.sample_interval)
+    if args.prefetch_report is None and args.workspace_path:
+        args.prefetch_report = os.path.join(args.workspace_path, "model-prefetch.json")
+    if args.startup_profile is None:
+        args.startup_profile = os.path.join(args.workspace_path or "", "startup-profile.json")
+    server_urls = [url.strip() for url in (args.comfy_server_urls or "").split(",") if url.strip()]
+    if len(server_urls) == 1 and args.instances <= 1:
+        # Nothing to shard across, the one server is used through its API like --comfy-server-url
+        print(f"Running every workflow on {server_urls[0]} through its API")
+        args.comfy_server_url = server_urls[0]
+        args.execution_mode = "api"
+        args.comfy_server_urls = None
+    with span("stop_model_prefetch", "startup"):
+        stop_model_prefetch(args.prefetch_report)
+    # Collected in the background while the workflows are being selected and the first one starts
+    machine_stats_collector = MachineStatsCollector()
+
+    given_files, workflow_files, estimate = select_workflows(args.comfy_workflow_names, args.os, args.workflow_order, models_dir=os.path.join(args.workspace_path or "", "models"))
+    if estimate is not None:
+        print(f"Reordered workflows by shared models: {given_files} -> {workflow_files}")
+        print(f"Estimated model reloads: {estimate['original_reloads']} -> {estimate['scheduled_reloads']}")
+        if estimate["original_bytes"] is not None:
+            print(f"Estimated bytes reloaded: {estimate['original_bytes'] / (1024 ** 3):.2f} GB -> {estimate['scheduled_bytes'] / (1024 ** 3):.2f} GB")
+    print(f"Running workflows: {workflow_files}")
+    counter = 1
+
+    comfy_client = None
+    if args.execution_mode == "api":
+        comfy_client = ComfyApiClient(args.comfy_server_url)
 
-        send_payload_to_api(args, gs_path, logs_gs_path, workflow_file_name, start_time, end_time, vram_time_series, WfRunStatus.Completed)
-        counter += 1
+    if args.benchmark:
+        try:
+            results = run_benchmark(args, workflow_files, lambda file_path: measure_workflow_run(args, comfy_client, file_path))
+        finally:
+            if comfy_client is not None:
+                comfy_client.close()
+        regressions = [name for name, result in results.items() if any(c["regression"] for c in (result["comparison"] or {}).values())]
+        if regressions:
+            print(f"Significant regressions in: {', '.join(regressions)}")
+            if args.fail_on_regression:
+                sys.exit(1)
+        return
+
+    uploader = GcsUploader(args.gsc_bucket_name, max_workers=args.upload_workers, dedupe=args.dedupe_uploads)
+    log_shipper = None
+    if args.ship_logs:
+        # The server logs of the whole job, next to the per-workflow slices under each workflow's logs_gs_path
+        logs_gs_prefix = make_unix_safe(f"logs/{args.job_id}-{args.os}-{args.python_version}-{args.cuda_version}-{args.torch_version}-run-{args.run_id}")
+        log_shipper = LogShipper(uploader, logs_gs_prefix, args.log_slice_dir or os.path.join(args.workspace_path or "", "log-slices"), args.log_segment_mb * 1024 * 1024)
+        log_shipper.watch(args.comfy_log or os.path.join(args.workspace_path or "", "application.log"))
+    golden_comparer = None
+    if args.golden_compare:
+        golden_comparer = GoldenComparer(args.golden_dir, args.os, args.torch_version, args.cuda_version, args.update_golden, args.compare_workers)
+    golden_results = {}
+    results_store = ResultsStore(args.results_db) if args.results_db else None
+    result_cache = None
+    if args.result_cache:
+        result_cache = ResultCache(args.result_cache_dir, args.result_cache_entries, os.path.join(args.workspace_path or "", "models"), os.path.join(args.workspace_path or "", "input"))
+    reporter = PayloadReporter(args.api_endpoint, spool_path=args.payload_spool, encoding=args.payload_encoding, batch=args.payload_batch)
+    replayed = reporter.replay_spool()
+    if replayed:
+        print(f"Replaying {replayed} payloads left undelivered by earlier jobs")
+
+    instances = []
+    try:
+        if args.instances > 1 or args.comfy_server_urls:
+            urls = server_urls or [args.comfy_server_url]
+            devices = parse_devices(args.instance_devices, max(args.instances, len(urls)))
+            # The servers already running are used as they are, the remaining instances are started here
+            instances = [ComfyInstance(url, device) for url, device in zip(urls, devices)]
+            for i, device in enumerate(devices[len(urls):]):
+                instances.append(launch_instance(args.workspace_path, args.instance_base_port + i, device, args.comfy_run_flags))
+            with span("wait_for_instances", "startup", instances=len(instances)):
+                wait_until_ready(instances, args.instance_start_timeout)
+            print(f"Sharding workflows across {len(instances)} ComfyUI instances: {', '.join(instance.name for instance in instances)}")
+
+        if len(instances) > 1:
+            clients = {}
+
+            def run_on_instance(instance, workflow_file_name):
+                # Each worker thread only ever uses its own instance's client
+                if instance.name not in clients:
+                    clients[instance.name] = ComfyApiClient(instance.url)
+                with span("workflow", "workflow", workflow=workflow_file_name, instance=instance.name):
+                    golden_results[workflow_file_name], _ = run_and_report_workflow(args, workflow_file_name, counter, clients[instance.name], uploader, reporter, machine_stats_collector, instance, golden_comparer, results_store, result_cache, log_shipper)
+
+            try:
+                # SD3 and Flux keep running last, and on their own because of their RAM use
+                run_sharded(instances, workflow_files, run_on_instance, exclusive=LINUX_ONLY_WORKFLOWS)
+            finally:
+                for client in clients.values():
+                    client.close()
+        else:
+            for workflow_file_name in workflow_files:
+                with span("workflow", "workflow", workflow=workflow_file_name):
+                    golden_results[workflow_file_name], ran = run_and_report_workflow(args, workflow_file_name, counter, comfy_client, uploader, reporter, machine_stats_collector, golden_comparer=golden_comparer, results_store=results_store, result_cache=result_cache, log_shipper=log_shipper)
+                # Counts the outputs ComfyUI saved, a cached workflow saved none
+                if ran:
+                    counter += 1
+    finally:
+        if log_shipper is not None:
+            # Queued before the uploads are waited for, so the last segments and the index land too
+            try:
+                log_shipper.close()
+            except Exception:
+                traceback.print_exc()
+        # Outputs still uploading in the background must land before the job ends, even if a workflow failed
+        with span("wait_for_uploads", "gcs"):
+            upload_results = uploader.close()
+        with span("wait_for_reports", "api"):
+            reporter.close()
+        if comfy_client is not None:
+            comfy_client.close()
+        stop_instances(instances)
+        if golden_comparer is not None:
+            golden_comparer.close()
+        if results_store is not None:
+            results_store.close()
+
+    failed_uploads = [result for result in upload_results if result.error is not None]
+    if failed_uploads:
+        raise RuntimeError(f"{len(failed_uploads)} of {len(upload_results)} output uploads failed")
+    mismatches = [name for name, comparison in golden_results.items() if comparison and comparison["status"] == "mismatch"]
+    if mismatches:
+        print(f"Outputs differ from the golden files in: {', '.join(mismatches)}")
+        if args.fail_on_golden_mismatch:
+            sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -362,6 +707,61 @@ if __name__ == "__main__":
     parser.add_argument("--workspace-path", type=str, help="Workspace (ComfyUI repo) path, likely ${HOME}/action_runners/_work/ComfyUI/ComfyUI/.")
     parser.add_argument("--action-path", type=str, help="Action path., likely ${HOME}/action_runners/_work/comfy-action/.")
     parser.add_argument("--output-file-prefix", type=str, help="Output file prefix.")
+    parser.add_argument("--upload-workers", type=int, default=4, help="Number of concurrent GCS uploads.")
+    parser.add_argument("--dedupe-uploads", action=argparse.BooleanOptionalAction, default=True, help="Copy outputs whose content hash is already in the bucket there instead of uploading them again.")
+    parser.add_argument("--golden-compare", action=argparse.BooleanOptionalAction, default=True, help="Compare every workflow's outputs with its stored golden files (PSNR, SSIM, perceptual hash).")
+    parser.add_argument("--golden-dir", type=str, default=os.path.expanduser("~/.cache/comfy-actions-runner/golden"), help="Directory holding the golden outputs per workflow/OS/torch/CUDA combination.")
+    parser.add_argument("--update-golden", action="store_true", help="Replace the stored golden files with this run's outputs.")
+    parser.add_argument("--compare-workers", type=int, default=None, help="Processes comparing outputs with golden files when a workflow has many outputs (default: one per CPU).")
+    parser.add_argument("--fail-on-golden-mismatch", action="store_true", help="Exit with an error when outputs differ from their golden files.")
+    parser.add_argument("--payload-spool", type=str, default=DEFAULT_SPOOL_PATH, help="Append-only file that run payloads are spooled to until the API accepted them.")
+    parser.add_argument("--payload-encoding", type=str, default="json", choices=PAYLOAD_ENCODINGS, help="'compact' sends gzipped payloads with columnar resource samples and the pip freeze only once per job, the API has to support it.")
+    parser.add_argument("--payload-batch", action="store_true", help="Report all workflows of the job in one request at the end instead of one request per workflow.")
+    parser.add_argument("--results-db", type=str, default=DEFAULT_RESULTS_DB, help="Local SQLite database every run payload is also written to, query it with results_store.py. Empty to disable.")
+    parser.add_argument("--result-cache", action="store_true", help="Reuse the outputs and metrics of an earlier successful run whose inputs (workflow, run settings, models, input images) match instead of running the workflow again.")
+    parser.add_argument("--result-cache-dir", type=str, default=DEFAULT_RESULT_CACHE_DIR, help="Where --result-cache keeps outputs and metrics of successful runs by input fingerprint.")
+    parser.add_argument("--result-cache-entries", type=int, default=200, help="Most recently used result cache entries to keep.")
+    parser.add_argument("--force-rerun", action="store_true", help="Run every workflow even when a cached result with the same inputs exists (the cache is still updated).")
+    parser.add_argument("--workflow-timeout", type=int, default=WORKFLOW_TIMEOUT, help="Seconds a workflow may run when there is no history to derive its budget from.")
+    parser.add_argument("--adaptive-timeout", action=argparse.BooleanOptionalAction, default=True, help="Derive each workflow's time budget from its earlier runs on this OS and GPU model in --results-db.")
+    parser.add_argument("--timeout-percentile", type=float, default=0.95, help="Percentile of the earlier durations the adaptive budget is based on.")
+    parser.add_argument("--timeout-factor", type=float, default=2.0, help="Safety factor the percentile is multiplied by.")
+    parser.add_argument("--max-workflow-timeout", type=int, default=1800, help="Upper limit of the adaptive budget in seconds.")
+    parser.add_argument("--stall-window", type=float, default=180, help="Abort a workflow after this many seconds without GPU or CPU activity, 0 to never.")
+    parser.add_argument("--stall-gpu-threshold", type=float, default=2.0, help="GPU utilization in percent at or below which the GPU counts as idle.")
+    parser.add_argument("--stall-cpu-threshold", type=float, default=2.0, help="CPU utilization of the server's process tree, in percent of one core, at or below which it counts as idle.")
+    parser.add_argument("--ship-logs", action=argparse.BooleanOptionalAction, default=True, help="Upload the server log while the job runs, as gzip segments plus a slice per workflow under its logs path and a byte-range index.")
+    parser.add_argument("--comfy-log", type=str, default=None, help="Log of the running ComfyUI server (default: application.log in --workspace-path).")
+    parser.add_argument("--log-slice-dir", type=str, default=None, help="Where the compressed log segments, slices and index are written before upload (default: log-slices in --workspace-path).")
+    parser.add_argument("--log-segment-mb", type=int, default=LOG_SEGMENT_SIZE // (1024 * 1024), help="Size of the log segments uploaded while the job runs, in MiB of uncompressed log.")
+    parser.add_argument("--trace-output", type=str, default=None, help="Write a Trace Event Format trace of the whole run here, for https://ui.perfetto.dev or chrome://tracing.")
+    parser.add_argument("--gpu-metrics", type=str, default="auto", choices=GPU_METRICS_BACKENDS, help="How GPU memory and utilization are read: NVML in-process, one streaming nvidia-smi, a fake GPU for testing, or no GPU. 'auto' tries NVML, then nvidia-smi.")
+    parser.add_argument("--sample-interval", type=float, default=0.5, help="Seconds between VRAM/RAM/CPU samples while a workflow runs.")
+    parser.add_argument("--startup-profile", type=str, default=None, help="Server startup profile written by poll_server_start.py (default: startup-profile.json in --workspace-path), reported with every workflow.")
+    parser.add_argument("--prefetch-report", type=str, default=None, help="Report of default-models-prep.py --prefetch (default: model-prefetch.json in --workspace-path), reported with every workflow. The prefetch is stopped before the first workflow.")
+    parser.add_argument("--workflow-order", type=str, default="auto", choices=["auto", "given", "model-affinity"], help="'model-affinity' reorders workflows to reuse already loaded models, 'given' keeps the listed order, 'auto' reorders only the default workflow list.")
+    parser.add_argument("--benchmark", action="store_true", help="Run each workflow repeatedly and compare the timings and VRAM against a stored baseline instead of uploading results.")
+    parser.add_argument("--warmup-runs", type=int, default=1, help="Unmeasured runs per workflow before the measured ones in benchmark mode.")
+    parser.add_argument("--measured-runs", type=at_least_one, default=5, help="Measured runs per workflow in benchmark mode.")
+    parser.add_argument("--benchmark-unload-models", action="store_true", help="Unload the server's models before every benchmark run too, measuring cold runs that load them again.")
+    parser.add_argument("--baseline-dir", type=str, default=os.path.expanduser("~/.cache/comfy-actions-runner/baselines"), help="Directory holding the benchmark baseline JSON per workflow/OS/torch/CUDA combination.")
+    parser.add_argument("--update-baseline", action="store_true", help="Replace the stored baseline with this benchmark's samples.")
+    parser.add_argument("--benchmark-output", type=str, default="benchmark-results.json", help="Where the benchmark results are written.")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with an error when the benchmark finds a significant regression.")
+    parser.add_argument("--execution-mode", type=str, default="cli", choices=["cli", "api"], help="Run workflows through a comfy-cli subprocess each, or queue them directly on the running server's API.")
+    parser.add_argument("--comfy-server-url", type=str, default="http://127.0.0.1:8188", help="Base URL of the running ComfyUI server, used by the api execution mode.")
+    parser.add_argument("--instances", type=int, default=1, help="Number of ComfyUI servers to shard the workflows across (always through their API). The running server is the first, the others are started by the action.")
+    parser.add_argument("--comfy-server-urls", type=str, default=None, help="Comma separated base URLs of already running servers to shard the workflows across, instead of --comfy-server-url alone. A single URL is used like --comfy-server-url.")
+    parser.add_argument("--instance-devices", type=str, default="auto", help="CUDA device index or 'cpu' per instance, comma separated; 'auto' gives each instance its own GPU while there are enough, the rest run on the CPU.")
+    parser.add_argument("--instance-base-port", type=int, default=8189, help="Port of the first server started by the action, the next ones count up from it.")
+    parser.add_argument("--instance-start-timeout", type=float, default=300, help="Seconds to wait for all instances to accept requests.")
 
     args = parser.parse_args()
-    main(args)
+    if args.trace_output:
+        tracing.enable()
+    try:
+        with span("action"):
+            main(args)
+    finally:
+        if args.trace_output:
+            write_trace(args)
@@ -0,0 +1,284 @@
+import contextlib, gzip, hashlib, json, os, pprint, queue, random, re, threading, traceback, uuid
+import requests
+from tracing import span
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+REQUEST_TIMEOUT = 60 * 5
+# One spool per runner, a runner runs one job at a time so no other job replays or compacts its records meanwhile
+RUNNER_NAME = re.sub(r"[^\w\-.]", "_", os.environ.get("RUNNER_NAME", "local"))
+DEFAULT_SPOOL_PATH = os.path.expanduser(f"~/.cache/comfy-actions-runner/payload-spool-{RUNNER_NAME}.jsonl")
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+PAYLOAD_ENCODINGS = ("json", "compact")
+# Tells the API how the body is encoded, plain json payloads are sent without it
+PAYLOAD_FORMAT_HEADER = "X-Comfy-Payload-Format"
+
+
+@contextlib.contextmanager
+def spool_file_lock(lock_path):
+    """
+        Exclusive lock between the processes using a spool, held while it is appended to or rewritten.
+    """
+    with open(lock_path, "a+b") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class PayloadReporter:
+    """
+        Sends run payloads to the registry API from a background thread so API hiccups never block or fail a GPU job.
+
+        Every payload is first appended to a local spool file, and a "done" record is appended once the API accepted (or
+        permanently rejected) it. Payloads without a "done" record, e.g. from a job that was killed or gave up retrying,
+        are replayed by the next job that opens the same spool. Payloads the API permanently rejected are kept in
+        the dead-letter file next to the spool.
+
+        The "compact" encoding gzips the body and replaces machine_stats.pip_freeze with a hash reference, sending the
+        snapshot itself under "environments" only until a request carrying it was accepted. With batch, payloads are
+        only spooled until close(), which sends all of them in one request.
+    """
+
+    def __init__(self, api_endpoint, spool_path=DEFAULT_SPOOL_PATH, max_attempts=6, base_delay=1.0, max_delay=60.0, encoding="json", batch=False):
+        self.api_endpoint = api_endpoint
+        self.encoding = encoding
+        self.batch = batch
+        self.batched = []
+        self.delivered_environments = set()
+        self.spool_path = spool_path
+        self.spool_lock_path = spool_path + ".lock"
+        self.dead_letter_path = os.path.splitext(spool_path)[0] + "-dead-letter.jsonl"
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json"})
+        self.queue = queue.Queue()
+        self.abort_event = threading.Event()
+        self.spool_lock = threading.Lock()
+        self.pending = set()
+        self.results = {}
+        os.makedirs(os.path.dirname(os.path.abspath(spool_path)), exist_ok=True)
+        self.thread = threading.Thread(target=self._worker, name="payload-reporter", daemon=True)
+        self.thread.start()
+
+    def _append(self, path, record):
+        with self.spool_lock, spool_file_lock(self.spool_lock_path):
+            with open(path, "a", encoding="utf-8") as spool:
+                spool.write(json.dumps(record) + "\n")
+                spool.flush()
+                os.fsync(spool.fileno())
+
+    def _append_spool(self, record):
+        self._append(self.spool_path, record)
+
+    def _undelivered(self):
+        """
+            The spooled payloads without a "done" record, by id. Call with the spool locked.
+        """
+        payloads = {}
+        if not os.path.exists(self.spool_path):
+            return payloads
+        with open(self.spool_path, "r", encoding="utf-8") as spool:
+            for line in spool:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A job killed mid-write leaves a truncated last line behind
+                    continue
+                if record.get("type") == "payload":
+                    payloads[record["id"]] = record["payload"]
+                elif record.get("type") == "done":
+                    payloads.pop(record["id"], None)
+        return payloads
+
+    def _compact_spool(self):
+        """
+            Drops the delivered records from the spool, removing it once nothing is left undelivered. Returns the
+            undelivered payloads by id.
+        """
+        with self.spool_lock, spool_file_lock(self.spool_lock_path):
+            payloads = self._undelivered()
+            if not payloads:
+                if os.path.exists(self.spool_path):
+                    os.remove(self.spool_path)
+                return payloads
+            temp_path = f"{self.spool_path}.{os.getpid()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as spool:
+                for payload_id, payload in payloads.items():
+                    spool.write(json.dumps({"type": "payload", "id": payload_id, "payload": payload}) + "\n")
+            os.replace(temp_path, self.spool_path)
+        return payloads
+
+    def replay_spool(self):
+        """
+            Queues every payload left over in the spool by earlier jobs. Returns how many were queued.
+        """
+        payloads = self._compact_spool()
+        for payload_id, payload in payloads.items():
+            print(f"Replaying spooled payload {payload_id} for workflow {payload.get('workflow_name')} of run {payload.get('run_id')}")
+            self._enqueue(payload_id, payload)
+        return len(payloads)
+
+    def _enqueue(self, payload_id, payload):
+        self.pending.add(payload_id)
+        if self.batch:
+            self.batched.append((payload_id, payload))
+        else:
+            self.queue.put([(payload_id, payload)])
+
+    def submit(self, payload):
+        payload_id = str(uuid.uuid4())
+        self._append_spool({"type": "payload", "id": payload_id, "payload": payload})
+        self._enqueue(payload_id, payload)
+        return payload_id
+
+    def _backoff(self, attempt):
+        # Full jitter, so retries of several runners hitting the same outage don't line up
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _compact(self, payload, environments):
+        payload = dict(payload)
+        machine_stats = dict(payload.get("machine_stats") or {})
+        pip_freeze = machine_stats.pop("pip_freeze", None)
+        if pip_freeze is not None:
+            environment_hash = hashlib.sha256(pip_freeze.encode("utf-8")).hexdigest()
+            machine_stats["environment_ref"] = environment_hash
+            if environment_hash not in self.delivered_environments:
+                environments[environment_hash] = {"pip_freeze": pip_freeze}
+        payload["machine_stats"] = machine_stats
+        return payload
+
+    def _encode(self, payloads):
+        """
+            Returns (body, headers, hashes of the environments the body carries) for a request with payloads.
+        """
+        headers = {}
+        environments = {}
+        if self.encoding == "compact":
+            payloads = [self._compact(payload, environments) for payload in payloads]
+        if self.batch:
+            body = {"payloads": payloads}
+            if environments:
+                body["environments"] = environments
+            headers[PAYLOAD_FORMAT_HEADER] = f"{self.encoding}-batch"
+        else:
+            body = payloads[0]
+            if environments:
+                body["environments"] = environments
+            if self.encoding != "json":
+                headers[PAYLOAD_FORMAT_HEADER] = self.encoding
+        if self.encoding == "compact":
+            headers["Content-Encoding"] = "gzip"
+            return gzip.compress(json.dumps(body, separators=(",", ":")).encode("utf-8"), compresslevel=6), headers, set(environments)
+        return json.dumps(body), headers, set(environments)
+
+    def _send(self, request_id, items):
+        """
+            Sends the (payload id, payload) items in one request. Returns the final status code and response text,
+            (None, None) when giving up.
+        """
+        body, headers, environments = self._encode([payload for _, payload in items])
+        if self.batch:
+            description = f"{len(items)} workflows"
+            print(f"Sending {len(items)} payloads in one request ({len(body)} bytes)")
+        else:
+            description = items[0][1].get('workflow_name')
+        for attempt in range(self.max_attempts):
+            with span("api_request", "api", payload=request_id, workflows=description, attempt=attempt + 1, bytes=len(body)) as trace_args:
+                try:
+                    response = self.session.post(self.api_endpoint, data=body, headers=headers, timeout=REQUEST_TIMEOUT)
+                    trace_args["status_code"] = response.status_code
+                except Exception as e:
+                    print(f"API request for payload {request_id} failed with exception {e}")
+                    response = None
+
+            if response is not None:
+                print(f"#### Response for {description} ({request_id}) ####")
+                try:
+                    pprint.pprint(response.json())
+                except json.JSONDecodeError:
+                    print(f"Invalid JSON: {response.text}")
+                except:
+                    # can sometimes have random encoding errors here
+                    traceback.print_exc()
+
+                # Append the response to application.log, earlier responses of the job stay there
+                with open("./application.log", "a", encoding="utf-8") as log_file:
+                    log_file.write("\n##### Comfy CI Post Response #####\n")
+                    log_file.write(response.text)
+
+                if response.status_code == 200:
+                    print("API request successful")
+                    self.delivered_environments.update(environments)
+                    return response.status_code, response.text
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    print(f"API request failed with status code {response.status_code}, not retrying: {response.text}")
+                    return response.status_code, response.text
+                print(f"API request failed with status code {response.status_code} and text {response.text}")
+
+            if attempt + 1 < self.max_attempts:
+                delay = self._backoff(attempt)
+                print(f"Retrying payload {request_id} in {delay:.1f} seconds")
+                with span("api_retry_backoff", "api", payload=request_id, seconds=round(delay, 3)):
+                    aborted = self.abort_event.wait(delay)
+                if aborted:
+                    break
+        print(f"Giving up on payload {request_id} for now, it stays in {self.spool_path} for the next job to replay")
+        return None, None
+
+    def _worker(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            if self.abort_event.is_set():
+                continue
+            request_id = str(uuid.uuid4()) if self.batch else item[0][0]
+            status_code, response_text = self._send(request_id, item)
+            for payload_id, payload in item:
+                self.results[payload_id] = status_code
+                if status_code is None:
+                    continue
+                if status_code != 200:
+                    # Retrying won't help, but the payload is kept for whoever fixes what the API rejected
+                    self._append(self.dead_letter_path, {"id": payload_id, "status_code": status_code, "response": response_text, "payload": payload})
+                    print(f"Payload {payload_id} was rejected, kept in {self.dead_letter_path}")
+                self._append_spool({"type": "done", "id": payload_id, "status_code": status_code})
+                self.pending.discard(payload_id)
+
+    def close(self, timeout=120):
+        """
+            Waits up to timeout seconds for queued payloads to be sent. Whatever is still unsent stays spooled.
+        """
+        if self.batched:
+            self.queue.put(self.batched)
+            self.batched = []
+        self.queue.put(None)
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            self.abort_event.set()
+            self.thread.join()
+        if self.pending:
+            print(f"{len(self.pending)} payloads could not be delivered and remain spooled in {self.spool_path}")
+        rejected = sum(1 for status_code in self.results.values() if status_code is not None and status_code != 200)
+        if rejected:
+            print(f"{rejected} payloads were rejected by the API, see {self.dead_letter_path}")
+        # Only delivered records are dropped, whatever is still undelivered stays for the next job
+        self._compact_spool()
+        self.session.close()
+        return self.results
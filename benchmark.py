@@ -0,0 +1,182 @@
+import itertools, json, math, os, random, re, statistics
+
+BOOTSTRAP_RESAMPLES = 2000
+CONFIDENCE = 0.95
+SIGNIFICANCE = 0.05
+# Exact Mann-Whitney p-values are enumerated up to this many rank assignments, a normal approximation is used beyond
+EXACT_TEST_LIMIT = 20000
+# Benchmarked metrics and the relative growth of their median that counts as a regression once it is significant
+REGRESSION_THRESHOLDS = {
+    "wall_time": 0.05,
+    "peak_vram": 0.05,
+    "avg_vram": 0.05,
+}
+
+
+def quantile(sorted_values, q):
+    position = (len(sorted_values) - 1) * q
+    lower = math.floor(position)
+    upper = math.ceil(position)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def summarize(values):
+    """
+        Median, IQR and a bootstrap confidence interval of the median. The bootstrap is seeded so reruns over the same
+        samples report the same interval.
+    """
+    ordered = sorted(values)
+    rng = random.Random(0)
+    medians = sorted(statistics.median(rng.choices(ordered, k=len(ordered))) for _ in range(BOOTSTRAP_RESAMPLES))
+    alpha = (1 - CONFIDENCE) / 2
+    q1 = quantile(ordered, 0.25)
+    q3 = quantile(ordered, 0.75)
+    return {
+        "n": len(ordered),
+        "median": statistics.median(ordered),
+        "mean": statistics.fmean(ordered),
+        "min": ordered[0],
+        "max": ordered[-1],
+        "q1": q1,
+        "q3": q3,
+        "iqr": q3 - q1,
+        "ci_low": quantile(medians, alpha),
+        "ci_high": quantile(medians, 1 - alpha),
+    }
+
+
+def _ranks(values):
+    ordered = sorted(range(len(values)), key=lambda i: values[i])
+    ranks = [0.0] * len(values)
+    i = 0
+    while i < len(ordered):
+        j = i
+        while j + 1 < len(ordered) and values[ordered[j + 1]] == values[ordered[i]]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[ordered[k]] = (i + j) / 2 + 1
+        i = j + 1
+    return ranks
+
+
+def mann_whitney_greater(baseline, current):
+    """
+        One-sided Mann-Whitney U test p-value for current tending to be larger than baseline.
+    """
+    n, m = len(current), len(baseline)
+    if n == 0 or m == 0:
+        return 1.0
+    ranks = _ranks(list(current) + list(baseline))
+    u = sum(ranks[:n]) - n * (n + 1) / 2
+
+    if math.comb(n + m, n) <= EXACT_TEST_LIMIT:
+        as_extreme = 0
+        total = 0
+        for chosen in itertools.combinations(ranks, n):
+            total += 1
+            if sum(chosen) - n * (n + 1) / 2 >= u - 1e-9:
+                as_extreme += 1
+        return as_extreme / total
+
+    mean_u = n * m / 2
+    tie_counts = {}
+    for rank in ranks:
+        tie_counts[rank] = tie_counts.get(rank, 0) + 1
+    tie_term = sum(t ** 3 - t for t in tie_counts.values()) / ((n + m) * (n + m - 1))
+    sigma = math.sqrt(n * m / 12 * ((n + m + 1) - tie_term))
+    if sigma == 0:
+        return 1.0
+    z = (u - mean_u - 0.5) / sigma
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def baseline_path(baseline_dir, os_name, torch_version, cuda_version, workflow_name):
+    combination = re.sub(r'[^\w\-\.]', '_', f"{os_name}-torch{torch_version}-cuda{cuda_version}")
+    return os.path.join(baseline_dir, combination, f"{workflow_name}.baseline.json")
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_baseline(path, result):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"commit_hash": result["commit_hash"], "samples": result["samples"]}, f, indent=2)
+
+
+def compare_to_baseline(samples, baseline):
+    """
+        Flags metrics whose median grew past their threshold with a significant Mann-Whitney test against the baseline.
+    """
+    comparison = {}
+    for metric, threshold in REGRESSION_THRESHOLDS.items():
+        current = samples.get(metric, [])
+        previous = baseline["samples"].get(metric, [])
+        if not current or not previous:
+            continue
+        baseline_median = statistics.median(previous)
+        current_median = statistics.median(current)
+        change = (current_median - baseline_median) / baseline_median if baseline_median else 0.0
+        p_value = mann_whitney_greater(previous, current)
+        comparison[metric] = {
+            "baseline_median": baseline_median,
+            "median": current_median,
+            "relative_change": change,
+            "p_value": p_value,
+            "regression": p_value < SIGNIFICANCE and change > threshold,
+        }
+    return comparison
+
+
+def run_benchmark(args, workflow_files, run_once):
+    """
+        Runs every workflow args.warmup_runs + args.measured_runs times through run_once(file_path), which returns
+        (wall_seconds, ResourceSamples), and compares the measured runs against the stored baseline of this
+        OS/torch/CUDA combination. Returns the per-workflow results, writing them to args.benchmark_output.
+    """
+    results = {}
+    for workflow_file_name in workflow_files:
+        file_path = f"workflows/{workflow_file_name}"
+        for i in range(args.warmup_runs):
+            print(f"Warm-up run {i + 1}/{args.warmup_runs} of {file_path}")
+            run_once(file_path)
+
+        samples = {metric: [] for metric in REGRESSION_THRESHOLDS}
+        for i in range(args.measured_runs):
+            wall_seconds, resource_samples = run_once(file_path)
+            vram = resource_samples.summary()["vram"]
+            samples["wall_time"].append(wall_seconds)
+            samples["peak_vram"].append(vram["max"])
+            samples["avg_vram"].append(vram["mean"])
+            print(f"Measured run {i + 1}/{args.measured_runs} of {file_path}: {wall_seconds:.3f}s, peak VRAM {vram['max']:.0f} MiB")
+
+        result = {
+            "workflow_name": workflow_file_name,
+            "commit_hash": args.commit_hash,
+            "samples": samples,
+            "summary": {metric: summarize(values) for metric, values in samples.items() if values},
+            "comparison": None,
+        }
+        path = baseline_path(args.baseline_dir, args.os, args.torch_version, args.cuda_version, workflow_file_name)
+        baseline = load_baseline(path)
+        if baseline is not None:
+            result["comparison"] = compare_to_baseline(samples, baseline)
+        if args.update_baseline or baseline is None:
+            save_baseline(path, result)
+            print(f"Saved baseline {path}")
+        results[workflow_file_name] = result
+
+        wall_time = result["summary"]["wall_time"]
+        print(f"{workflow_file_name}: median {wall_time['median']:.3f}s (IQR {wall_time['iqr']:.3f}s, {CONFIDENCE:.0%} CI {wall_time['ci_low']:.3f}-{wall_time['ci_high']:.3f}s)")
+        for metric, comparison in (result["comparison"] or {}).items():
+            flag = "REGRESSION" if comparison["regression"] else "ok"
+            print(f"  {metric}: {comparison['baseline_median']:.3f} -> {comparison['median']:.3f} ({comparison['relative_change']:+.1%}, p={comparison['p_value']:.4f}) {flag}")
+
+    with open(args.benchmark_output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Benchmark results written to {args.benchmark_output}")
+    return results
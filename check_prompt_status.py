@@ -0,0 +1,278 @@
+import json, posixpath, time, uuid
+import requests
+
+REQUEST_TIMEOUT = 30
+WEBSOCKET_RECV_TIMEOUT = 5
+HISTORY_POLL_INTERVAL = 0.5
+HOTTEST_NODE_COUNT = 5
+
+
+class PromptExecutionError(Exception):
+    def __init__(self, message, prompt_id=None):
+        super().__init__(message)
+        self.prompt_id = prompt_id
+
+
+def interrupt_server(server_url, session=requests):
+    """
+        Interrupts whatever prompt the server is executing right now.
+    """
+    session.post(f"{server_url.rstrip('/')}/interrupt", json={}, timeout=REQUEST_TIMEOUT).raise_for_status()
+
+
+def free_server(server_url, unload_models=False, session=requests):
+    """
+        Asks the server to drop its execution cache before the next prompt, with unload_models also the models it
+        keeps loaded.
+    """
+    session.post(f"{server_url.rstrip('/')}/free", json={"free_memory": True, "unload_models": unload_models}, timeout=REQUEST_TIMEOUT).raise_for_status()
+
+
+def is_completed(status_response, prompt_id):
+    # Check if the expected fields exist in the response
+    return (
+        status_response
+        and prompt_id in status_response
+        and "status" in status_response[prompt_id]
+        and status_response[prompt_id]["status"].get("completed", False)
+    )
+
+
+def get_output_filenames(history_entry):
+    """
+        Collects the files a prompt wrote to the output directory from its /history entry, relative to that directory.
+    """
+    filenames = []
+    for node_output in history_entry.get("outputs", {}).values():
+        for items in node_output.values():
+            if not isinstance(items, list):
+                continue
+            for item in items:
+                if isinstance(item, dict) and item.get("type") == "output" and "filename" in item:
+                    filenames.append(posixpath.join(item.get("subfolder", ""), item["filename"]))
+    return filenames
+
+
+def now_ms():
+    return time.time() * 1000
+
+
+class NodeExecutionProfile:
+    """
+        Per-node start/end times of one prompt, built from the server's execution events as they are received.
+        A node runs from its "executing" event until the next "executing" event (the final one has node None).
+        Without a websocket only the overall execution start/end from the /history status messages is known.
+    """
+
+    def __init__(self, workflow=None):
+        self.workflow = workflow or {}
+        self.execution_start_ms = None
+        self.execution_end_ms = None
+        self.cached_nodes = []
+        self.spans = []
+        self._current = None
+
+    def _close_current(self, timestamp_ms):
+        if self._current is not None:
+            self._current[2] = timestamp_ms
+            self.spans.append(self._current)
+            self._current = None
+
+    def on_event(self, event_type, data, timestamp_ms):
+        if event_type == "execution_start":
+            self.execution_start_ms = timestamp_ms
+        elif event_type == "execution_cached":
+            self.cached_nodes.extend(data.get("nodes", []))
+        elif event_type == "executing":
+            node = data.get("node")
+            if self._current is not None and self._current[0] == node:
+                return
+            self._close_current(timestamp_ms)
+            if node is None:
+                self.execution_end_ms = timestamp_ms
+            else:
+                self._current = [node, timestamp_ms, None]
+        elif event_type in ("execution_error", "execution_interrupted"):
+            self._close_current(timestamp_ms)
+            self.execution_end_ms = timestamp_ms
+
+    def finish(self, timestamp_ms):
+        self._close_current(timestamp_ms)
+        if self.execution_end_ms is None:
+            self.execution_end_ms = timestamp_ms
+
+    def apply_history_status(self, status):
+        # Server-side timestamps are only reported for the prompt as a whole
+        for message_type, data in status.get("messages", []):
+            if message_type == "execution_start" and self.execution_start_ms is None:
+                self.execution_start_ms = data.get("timestamp")
+            elif message_type in ("execution_success", "execution_error", "execution_interrupted") and self.execution_end_ms is None:
+                self.execution_end_ms = data.get("timestamp")
+
+    def _describe(self, node_id):
+        node = self.workflow.get(node_id, {})
+        return {"node_id": node_id, "class_type": node.get("class_type"), "title": node.get("_meta", {}).get("title")}
+
+    def to_dict(self):
+        origin = self.execution_start_ms
+        if origin is None:
+            origin = self.spans[0][1] if self.spans else 0
+        nodes = []
+        totals = {}
+        for node_id, start_ms, end_ms in self.spans:
+            duration_ms = end_ms - start_ms
+            nodes.append({
+                **self._describe(node_id),
+                "start_ms": round(start_ms - origin, 1),
+                "end_ms": round(end_ms - origin, 1),
+                "duration_ms": round(duration_ms, 1),
+            })
+            totals[node_id] = totals.get(node_id, 0) + duration_ms
+
+        execution_ms = None
+        if self.execution_start_ms is not None and self.execution_end_ms is not None:
+            execution_ms = round(self.execution_end_ms - self.execution_start_ms, 1)
+        total_node_ms = sum(totals.values())
+        hottest_nodes = [
+            {
+                **self._describe(node_id),
+                "duration_ms": round(duration_ms, 1),
+                "share": round(duration_ms / total_node_ms, 4) if total_node_ms else 0,
+            }
+            for node_id, duration_ms in sorted(totals.items(), key=lambda item: item[1], reverse=True)[:HOTTEST_NODE_COUNT]
+        ]
+        return {
+            "execution_ms": execution_ms,
+            "nodes": nodes,
+            "cached_nodes": self.cached_nodes,
+            "hottest_nodes": hottest_nodes,
+        }
+
+
+class ComfyApiClient:
+    """
+        Talks to an already running ComfyUI server over its HTTP API, reusing one HTTP session and one websocket for every prompt.
+        Completion is followed over the websocket when websocket-client is available, /history polling is used otherwise.
+    """
+
+    def __init__(self, server_url="http://127.0.0.1:8188"):
+        self.server_url = server_url.rstrip("/")
+        self.client_id = str(uuid.uuid4())
+        self.session = requests.Session()
+        self.ws = None
+        self._websocket = None
+        self._connect_websocket()
+
+    def _connect_websocket(self):
+        try:
+            import websocket
+        except ImportError:
+            print("websocket-client is not installed, will poll /history for prompt completion")
+            return
+        ws_url = "ws" + self.server_url[len("http"):] + f"/ws?clientId={self.client_id}"
+        try:
+            self.ws = websocket.create_connection(ws_url, timeout=WEBSOCKET_RECV_TIMEOUT)
+            self._websocket = websocket
+        except Exception as e:
+            print(f"Could not open websocket to {ws_url} ({e}), will poll /history for prompt completion")
+            self.ws = None
+
+    def close(self):
+        if self.ws is not None:
+            try:
+                self.ws.close()
+            except Exception:
+                pass
+            self.ws = None
+        self.session.close()
+
+    def queue_prompt(self, workflow):
+        response = self.session.post(f"{self.server_url}/prompt", json={"prompt": workflow, "client_id": self.client_id}, timeout=REQUEST_TIMEOUT)
+        if response.status_code != 200:
+            raise PromptExecutionError(f"Server rejected prompt with status code {response.status_code}: {response.text}")
+        return response.json()["prompt_id"]
+
+    def get_history(self, prompt_id):
+        response = self.session.get(f"{self.server_url}/history/{prompt_id}", timeout=REQUEST_TIMEOUT)
+        if response.status_code == 200:
+            return response.json()
+        return None
+
+    def interrupt(self):
+        interrupt_server(self.server_url, self.session)
+
+    def free(self, unload_models=False):
+        free_server(self.server_url, unload_models, self.session)
+
+    def wait_for_prompt(self, prompt_id, timeout, profile=None, abort=None):
+        """
+            Blocks until the prompt finished and returns its /history entry, raises PromptExecutionError on failure or timeout.
+            Execution events seen on the way are recorded into profile when one is given. Setting the abort event
+            (a threading.Event) stops the wait with a PromptExecutionError too.
+        """
+        deadline = time.monotonic() + timeout
+        if self.ws is not None:
+            try:
+                self._wait_on_websocket(prompt_id, deadline, profile, abort)
+            except PromptExecutionError:
+                raise
+            except Exception as e:
+                print(f"Websocket failed while waiting for prompt {prompt_id} ({e}), falling back to /history polling")
+                self.ws = None
+        return self._poll_history(prompt_id, deadline, profile, abort)
+
+    def _handle_event(self, event, prompt_id, profile=None):
+        """
+            Returns True once the event marks the end of the prompt's execution.
+        """
+        event_type = event.get("type")
+        data = event.get("data") or {}
+        if data.get("prompt_id") != prompt_id:
+            return False
+        if profile is not None:
+            profile.on_event(event_type, data, now_ms())
+        if event_type == "execution_error":
+            raise PromptExecutionError(f"Node {data.get('node_id')} ({data.get('node_type')}) failed: {data.get('exception_type')}: {data.get('exception_message')}", prompt_id)
+        if event_type == "execution_interrupted":
+            raise PromptExecutionError(f"Prompt {prompt_id} was interrupted at node {data.get('node_id')}", prompt_id)
+        return event_type == "executing" and data.get("node") is None
+
+    def _wait_on_websocket(self, prompt_id, deadline, profile=None, abort=None):
+        while True:
+            if abort is not None and abort.is_set():
+                raise PromptExecutionError(f"Prompt {prompt_id} was aborted", prompt_id)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise PromptExecutionError(f"Prompt {prompt_id} did not finish within the timeout", prompt_id)
+            self.ws.settimeout(min(remaining, WEBSOCKET_RECV_TIMEOUT))
+            try:
+                message = self.ws.recv()
+            except self._websocket.WebSocketTimeoutException:
+                # The completion message can be missed if it raced the connection, so check history while idle
+                if is_completed(self.get_history(prompt_id), prompt_id):
+                    if profile is not None:
+                        profile.finish(now_ms())
+                    return
+                continue
+            # Binary messages are latent previews
+            if not isinstance(message, str):
+                continue
+            if self._handle_event(json.loads(message), prompt_id, profile):
+                return
+
+    def _poll_history(self, prompt_id, deadline, profile=None, abort=None):
+        while True:
+            if abort is not None and abort.is_set():
+                raise PromptExecutionError(f"Prompt {prompt_id} was aborted", prompt_id)
+            history = self.get_history(prompt_id)
+            if history and prompt_id in history:
+                status = history[prompt_id].get("status", {})
+                if profile is not None:
+                    profile.apply_history_status(status)
+                if status.get("status_str") == "error":
+                    raise PromptExecutionError(f"Prompt {prompt_id} failed: {json.dumps(status.get('messages', []))}", prompt_id)
+                if is_completed(history, prompt_id):
+                    return history[prompt_id]
+            if time.monotonic() > deadline:
+                raise PromptExecutionError(f"Prompt {prompt_id} did not finish within the timeout", prompt_id)
+            time.sleep(HISTORY_POLL_INTERVAL)
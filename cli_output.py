@@ -0,0 +1,155 @@
+import collections, os, posixpath, re, subprocess, sys, threading, time
+from urllib.parse import parse_qs, urlsplit
+
+READ_CHUNK_SIZE = 64 * 1024
+# Longer lines (or progress redraws without any line break) are cut here so a chatty workflow can't grow the buffer
+MAX_LINE_LENGTH = 64 * 1024
+# Lines of each stream kept for the error report when comfy-cli fails
+TAIL_LINES = 200
+# How often a running comfy-cli checks whether it should be aborted
+ABORT_POLL_INTERVAL = 0.5
+OUTPUTS_MARKER = "Outputs:"
+# comfy-cli lines that mark a new phase of the run, in the order they appear
+PHASE_MARKERS = [
+    ("executing", re.compile(r"Executing\b")),
+    ("outputs", re.compile(r"^Outputs:")),
+    ("completed", re.compile(r"^Workflow execution completed")),
+]
+
+
+def parse_output_line(line):
+    """
+        Returns the output file (relative to the output directory) of a comfy-cli output line like
+        http://127.0.0.1:8188/view?filename=ComfyUI_00001_.png&subfolder=&type=output, or None for any other line.
+    """
+    if "filename=" not in line:
+        return None
+    query = parse_qs(urlsplit(line.strip()).query)
+    if "filename" not in query:
+        # Not a URL, keep the text after filename= like the outputs used to be parsed
+        filename = line[line.find("filename=") + len("filename="):].split("&", 1)[0].strip()
+        return filename or None
+    return posixpath.join(query.get("subfolder", [""])[0], query["filename"][0])
+
+
+def split_lines(stream, on_line):
+    """
+        Reads a binary stream to its end in chunks and calls on_line(text, redraw) per line. Progress bars redraw their
+        line with a bare carriage return, those intermediate states are passed with redraw=True.
+    """
+    pending = b""
+    while True:
+        chunk = stream.read1(READ_CHUNK_SIZE) if hasattr(stream, "read1") else stream.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        pending += chunk
+        while True:
+            ends = [i for i in (pending.find(b"\n"), pending.find(b"\r")) if i != -1]
+            if not ends:
+                break
+            end = min(ends)
+            if end == len(pending) - 1 and pending[end:] == b"\r":
+                # Wait for the next chunk to tell a redraw from a \r\n line ending
+                break
+            redraw = pending[end:end + 1] == b"\r" and pending[end + 1:end + 2] != b"\n"
+            on_line(pending[:end].decode("utf-8", errors="replace"), redraw)
+            pending = pending[end + (2 if pending[end:end + 2] == b"\r\n" else 1):]
+        if len(pending) > MAX_LINE_LENGTH:
+            on_line(pending[:MAX_LINE_LENGTH].decode("utf-8", errors="replace"), False)
+            pending = b""
+    pending = pending.rstrip(b"\r")
+    if pending:
+        on_line(pending.decode("utf-8", errors="replace"), False)
+
+
+class CliOutputReader:
+    """
+        Follows one comfy-cli run line by line: tees every finished line to our own output, reports each output file as
+        soon as it is printed through on_output(filename) and each phase change through on_phase(name, monotonic time).
+        Only the last TAIL_LINES lines are kept, for the error report.
+    """
+
+    def __init__(self, on_output=None, on_phase=None, echo=sys.stdout):
+        self.on_output = on_output
+        self.on_phase = on_phase
+        self.echo = echo
+        self.outputs = []
+        self.phases = []
+        self.tail = collections.deque(maxlen=TAIL_LINES)
+        self.in_outputs = False
+
+    def _phase(self, name):
+        if name not in (phase for phase, _ in self.phases):
+            timestamp = time.monotonic()
+            self.phases.append((name, timestamp))
+            if self.on_phase is not None:
+                self.on_phase(name, timestamp)
+
+    def feed(self, line, redraw=False):
+        text = line.strip()
+        for name, pattern in PHASE_MARKERS:
+            if pattern.search(text):
+                self._phase(name)
+        if redraw:
+            return
+        self.tail.append(line)
+        if self.echo is not None:
+            print(line, file=self.echo, flush=True)
+
+        if text.startswith(OUTPUTS_MARKER):
+            self.in_outputs = True
+            text = text[len(OUTPUTS_MARKER):].strip()
+        if not self.in_outputs or not text:
+            return
+        filename = parse_output_line(text)
+        if filename is None:
+            # The output list ends at the first line that isn't an output
+            self.in_outputs = False
+            return
+        self.outputs.append(filename)
+        if self.on_output is not None:
+            self.on_output(filename)
+
+
+def run_comfy_cli(file_path, timeout, on_output=None, on_phase=None, abort=None):
+    """
+        Runs one workflow through comfy-cli, streaming its output through a CliOutputReader. Returns the reader,
+        raises subprocess.CalledProcessError (with the output tails) when comfy-cli fails. Setting the abort event
+        (a threading.Event) terminates comfy-cli.
+    """
+    command = [
+        "comfy", "--skip-prompt", "--no-enable-telemetry",
+        "run",
+        "--workflow", file_path,
+        "--timeout", str(timeout)
+    ]
+    reader = CliOutputReader(on_output, on_phase)
+    stderr_tail = collections.deque(maxlen=TAIL_LINES)
+
+    def read_stderr(stream):
+        def on_line(line, redraw):
+            if not redraw:
+                stderr_tail.append(line)
+                print(line, file=sys.stderr, flush=True)
+        split_lines(stream, on_line)
+
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=os.environ)
+    stderr_thread = threading.Thread(target=read_stderr, args=(process.stderr,), daemon=True)
+    stderr_thread.start()
+    if abort is not None:
+        def terminate_on_abort():
+            while process.poll() is None:
+                if abort.wait(ABORT_POLL_INTERVAL):
+                    process.terminate()
+                    return
+        threading.Thread(target=terminate_on_abort, daemon=True).start()
+    try:
+        split_lines(process.stdout, reader.feed)
+    finally:
+        returncode = process.wait()
+        stderr_thread.join()
+        process.stdout.close()
+        process.stderr.close()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, command, output="\n".join(reader.tail), stderr="\n".join(stderr_tail))
+    return reader
@@ -1,5 +1,21 @@
-import os, requests, argparse, hashlib, shutil
+import os, sys, time, requests, argparse, hashlib, shutil, json, threading, mmap
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
+import psutil
+from workflow_scheduler import models_in_use_order, select_workflows
+
+REQUEST_TIMEOUT = 60
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+WRITE_BUFFER_SIZE = 16 * 1024 * 1024
+HASH_CHUNK_SIZE = 16 * 1024 * 1024
+# Fixed segment size, so segment boundaries stay the same when an interrupted download is resumed
+SEGMENT_SIZE = 256 * 1024 * 1024
+SEGMENTED_MIN_SIZE = 2 * SEGMENT_SIZE
+MANIFEST_NAME = ".manifest.json"
+OBJECTS_DIR = os.path.join("objects", "sha256")
+# ioctl(dest_fd, FICLONE, src_fd) shares extents between two files on btrfs/XFS
+FICLONE = 0x40049409
+PREFETCH_READ_SIZE = 8 * 1024 * 1024
 
 
 MODELS = {
@@ -43,54 +59,528 @@ MODELS = {
 }
 
 
-def download_model(url, path, model_name, expected_hash):
-    print(f"Downloading {model_name} from {url}...")
+def probe_download(url):
+    """
+        Returns (total_size, accepts_ranges) for url, using a one byte range request so redirects and range support are both resolved.
+    """
+    with requests.get(url, stream=True, headers={"Range": "bytes=0-0"}, timeout=REQUEST_TIMEOUT) as r:
+        r.raise_for_status()
+        if r.status_code == 206:
+            try:
+                return int(r.headers.get("content-range", "").rsplit("/", 1)[1]), True
+            except (IndexError, ValueError):
+                return 0, False
+        return int(r.headers.get("content-length", 0)), False
 
-    temp_file_path = os.path.join(path, f"{model_name}.tmp")
-    if os.path.exists(temp_file_path):
-        os.remove(temp_file_path)
 
-    hash_tracker = hashlib.sha256()
+def hash_file_prefix(file_path, length, hash_tracker):
+    with open(file_path, "rb") as f:
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(HASH_CHUNK_SIZE, remaining))
+            if not chunk:
+                raise RuntimeError(f"{file_path} is shorter than the {length} bytes expected")
+            hash_tracker.update(chunk)
+            remaining -= len(chunk)
+
+
+class SegmentProgress:
+    """
+        Bytes fetched per segment of a segmented download, kept in a sidecar file next to the partial download so an
+        interrupted fetch resumes each segment where it stopped.
+    """
+
+    def __init__(self, temp_file_path, total_size):
+        self.path = f"{temp_file_path}.segments"
+        self.total_size = total_size
+        self.lock = threading.Lock()
+        self.done = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            if state.get("total_size") == total_size and state.get("segment_size") == SEGMENT_SIZE:
+                self.done = {int(index): done for index, done in state["done"].items()}
+        elif os.path.exists(temp_file_path):
+            # A partial left by a sequential download is a contiguous prefix
+            prefix = min(os.path.getsize(temp_file_path), total_size)
+            for index, (start, end) in enumerate(self.segments()):
+                self.done[index] = max(0, min(prefix, end + 1) - start)
+
+    def segments(self):
+        return [(start, min(start + SEGMENT_SIZE, self.total_size) - 1) for start in range(0, self.total_size, SEGMENT_SIZE)]
+
+    def update(self, index, done):
+        with self.lock:
+            self.done[index] = done
+
+    def save(self):
+        with self.lock:
+            state = json.dumps({"total_size": self.total_size, "segment_size": SEGMENT_SIZE, "done": self.done})
+            with open(self.path, "w", encoding="utf-8") as f:
+                f.write(state)
 
-    with requests.get(url, stream=True) as r:
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def fetch_segment(url, temp_file_path, index, start, end, segment_progress, progress_bar):
+    done = segment_progress.done.get(index, 0)
+    if start + done > end:
+        return
+    headers = {"Range": f"bytes={start + done}-{end}"}
+    with requests.get(url, stream=True, headers=headers, timeout=REQUEST_TIMEOUT) as r:
         r.raise_for_status()
-        total_size = int(r.headers.get("content-length", 0))
+        if r.status_code != 206:
+            raise RuntimeError(f"Server ignored range request for segment {index} of {url}")
+        with open(temp_file_path, "r+b", buffering=WRITE_BUFFER_SIZE) as f:
+            f.seek(start + done)
+            unsaved = 0
+            for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+                done += len(chunk)
+                unsaved += len(chunk)
+                progress_bar.update(len(chunk))
+                if unsaved >= SEGMENT_SIZE // 4:
+                    # Only record progress that actually reached the file
+                    f.flush()
+                    segment_progress.update(index, done)
+                    segment_progress.save()
+                    unsaved = 0
+            f.flush()
+    if start + done != end + 1:
+        raise RuntimeError(f"Segment {index} of {url} ended early at {start + done} of {end + 1} bytes")
+    segment_progress.update(index, done)
+    segment_progress.save()
+
+
+def download_segmented(url, temp_file_path, total_size, connections, hash_tracker, progress_bar):
+    segment_progress = SegmentProgress(temp_file_path, total_size)
+    segments = segment_progress.segments()
+    progress_bar.update(sum(segment_progress.done.values()))
+    mode = "r+b" if os.path.exists(temp_file_path) else "wb"
+    with open(temp_file_path, mode) as f:
+        f.truncate(total_size)
+    segment_progress.save()
 
-        with tqdm(total=total_size, unit="B", unit_scale=True, mininterval=2) as progress_bar:
-            with open(temp_file_path, "wb") as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    f.write(chunk)
+    pool = ThreadPoolExecutor(max_workers=connections)
+    try:
+        futures = [pool.submit(fetch_segment, url, temp_file_path, index, start, end, segment_progress, progress_bar) for index, (start, end) in enumerate(segments)]
+        # Hash each segment as soon as it and everything before it landed, while later segments are still downloading
+        for future, (start, end) in zip(futures, segments):
+            future.result()
+            with open(temp_file_path, "rb") as f:
+                f.seek(start)
+                remaining = end + 1 - start
+                while remaining > 0:
+                    chunk = f.read(min(HASH_CHUNK_SIZE, remaining))
                     hash_tracker.update(chunk)
-                    progress_bar.update(len(chunk))
+                    remaining -= len(chunk)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+    segment_progress.remove()
+
+
+def download_sequential(url, temp_file_path, hash_tracker, progress_bar):
+    offset = os.path.getsize(temp_file_path) if os.path.exists(temp_file_path) else 0
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+    with requests.get(url, stream=True, headers=headers, timeout=REQUEST_TIMEOUT) as r:
+        if r.status_code == 416:
+            # The partial already holds the whole file
+            hash_file_prefix(temp_file_path, offset, hash_tracker)
+            progress_bar.update(offset)
+            return
+        r.raise_for_status()
+        if offset and r.status_code != 206:
+            print(f"Server does not support resuming {url}, restarting download")
+            offset = 0
+        if offset:
+            print(f"Resuming download at {offset} bytes")
+            hash_file_prefix(temp_file_path, offset, hash_tracker)
+            progress_bar.update(offset)
+        expected_size = offset + int(r.headers.get("content-length", 0))
 
-        if total_size != 0 and progress_bar.n != total_size:
-            raise RuntimeError("Could not download file")
+        with open(temp_file_path, "ab" if offset else "wb", buffering=WRITE_BUFFER_SIZE) as f:
+            for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+                hash_tracker.update(chunk)
+                progress_bar.update(len(chunk))
+
+    if expected_size != offset and progress_bar.n != expected_size:
+        raise RuntimeError("Could not download file")
+
+
+def download_model(url, path, model_name, expected_hash, connections=1):
+    print(f"Downloading {model_name} from {url}...")
+
+    temp_file_path = os.path.join(path, f"{model_name}.tmp")
+    total_size, accepts_ranges = probe_download(url)
+    hash_tracker = hashlib.sha256()
+
+    with tqdm(total=total_size, unit="B", unit_scale=True, mininterval=2, desc=model_name) as progress_bar:
+        segmented = accepts_ranges and (os.path.exists(f"{temp_file_path}.segments") or (connections > 1 and total_size >= SEGMENTED_MIN_SIZE))
+        if segmented:
+            download_segmented(url, temp_file_path, total_size, max(connections, 1), hash_tracker, progress_bar)
+        else:
+            download_sequential(url, temp_file_path, hash_tracker, progress_bar)
 
     file_hash = hash_tracker.hexdigest()
     if expected_hash != file_hash:
+        # A corrupt partial must not be resumed next time
+        os.remove(temp_file_path)
         raise RuntimeError(f"Hash mismatch for {model_name} - expected {expected_hash} but got {file_hash}")
 
-    os.rename(temp_file_path, os.path.join(path, model_name))
+    os.replace(temp_file_path, os.path.join(path, model_name))
     print(f"Downloaded {model_name}.")
 
 
-def main(args):
-    cache_dir = args.cache_directory
-    live_dir = args.live_directory
+def hash_file(file_path):
+    hash_tracker = hashlib.sha256()
+    if os.path.getsize(file_path) == 0:
+        return hash_tracker.hexdigest()
+    with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        view = memoryview(mapped)
+        try:
+            for offset in range(0, len(view), HASH_CHUNK_SIZE):
+                hash_tracker.update(view[offset:offset + HASH_CHUNK_SIZE])
+        finally:
+            view.release()
+    return hash_tracker.hexdigest()
+
+
+class CacheManifest:
+    """
+        Sidecar recording (size, mtime, inode, sha256) of every verified object in the model cache, keyed by sha256.
+        An object whose stat still matches its entry is trusted without re-hashing it.
+    """
+
+    def __init__(self, cache_dir):
+        self.path = os.path.join(cache_dir, MANIFEST_NAME)
+        self.lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"Ignoring unreadable cache manifest {self.path}: {e}")
+
+    @staticmethod
+    def _stat_entry(file_path):
+        stat = os.stat(file_path)
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "inode": stat.st_ino}
+
+    def is_valid(self, key, file_path, expected_hash):
+        entry = self.entries.get(key)
+        if entry is None or entry.get("sha256") != expected_hash:
+            return False
+        return {name: entry.get(name) for name in ("size", "mtime_ns", "inode")} == self._stat_entry(file_path)
+
+    def record(self, key, file_path, sha256):
+        entry = {**self._stat_entry(file_path), "sha256": sha256}
+        with self.lock:
+            self.entries[key] = entry
+            self._save()
+
+    def forget(self, key):
+        with self.lock:
+            if self.entries.pop(key, None) is not None:
+                self._save()
+
+    def _save(self):
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True)
+        os.replace(temp_path, self.path)
+
+
+def object_name(sha256):
+    return os.path.join(OBJECTS_DIR, sha256[:2], sha256)
+
+
+def models_by_hash():
+    grouped = {}
+    for model_name, model_info in MODELS.items():
+        grouped.setdefault(model_info['hash'], []).append(model_name)
+    return grouped
+
+
+def migrate_legacy_cache(cache_dir, manifest):
+    """
+        Moves models cached under their logical name (and their resumable partials) to their content-addressed path.
+    """
     for model_name, model_info in MODELS.items():
-        cache_target = os.path.join(cache_dir, model_name)
-        os.makedirs(os.path.dirname(cache_target), exist_ok=True)
-        if not os.path.exists(cache_target):
-            download_model(model_info['url'], cache_dir, model_name, model_info['hash'])
+        legacy_path = os.path.join(cache_dir, model_name)
+        object_path = os.path.join(cache_dir, object_name(model_info['hash']))
+        trusted = os.path.isfile(legacy_path) and manifest.is_valid(model_name, legacy_path, model_info['hash'])
+        for suffix in ("", ".tmp", ".tmp.segments"):
+            if os.path.isfile(legacy_path + suffix) and not os.path.lexists(object_path + suffix):
+                os.makedirs(os.path.dirname(object_path), exist_ok=True)
+                os.replace(legacy_path + suffix, object_path + suffix)
+                print(f"Moved cached {model_name}{suffix} to {object_path}{suffix}.")
+        if trusted and os.path.isfile(legacy_path):
+            # Another name with the same content was migrated first, this copy is redundant
+            os.remove(legacy_path)
+            print(f"Removed duplicate cached copy {model_name}.")
+        elif trusted and os.path.exists(object_path):
+            manifest.record(model_info['hash'], object_path, model_info['hash'])
+        manifest.forget(model_name)
+
+
+def verify_cache(cache_dir, live_dir, manifest, full_verify, workers):
+    """
+        Checks every cached object against its hash, hashing only files the manifest can't vouch for (or all of them
+        with full_verify). Invalid objects and their live placements are deleted so they get downloaded again.
+    """
+    grouped = models_by_hash()
+    to_hash = {}
+    for sha256 in grouped:
+        object_path = os.path.join(cache_dir, object_name(sha256))
+        if not os.path.exists(object_path):
+            continue
+        if not full_verify and manifest.is_valid(sha256, object_path, sha256):
+            continue
+        to_hash[sha256] = object_path
+    if not to_hash:
+        return
+
+    print(f"Verifying {len(to_hash)} cached models...")
+    # hashlib releases the GIL while hashing large buffers, so threads spread the hashing over all cores
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(hash_file, object_path): sha256 for sha256, object_path in to_hash.items()}
+        for future in as_completed(futures):
+            sha256 = futures[future]
+            object_path = to_hash[sha256]
+            model_names = ", ".join(grouped[sha256])
+            file_hash = future.result()
+            if file_hash == sha256:
+                manifest.record(sha256, object_path, file_hash)
+                print(f"Verified {model_names}.")
+                continue
+            print(f"Cached {model_names} is corrupt (got hash {file_hash}), removing it so it is downloaded again.")
+            os.remove(object_path)
+            manifest.forget(sha256)
+            for model_name in grouped[sha256]:
+                live_target = os.path.join(live_dir, model_name)
+                if os.path.lexists(live_target):
+                    os.remove(live_target)
+
+
+def reflink_file(source, target):
+    if sys.platform.startswith("linux"):
+        import fcntl
+        try:
+            with open(source, "rb") as src, open(target, "wb") as dst:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            if os.path.lexists(target):
+                os.remove(target)
+            raise
+    elif sys.platform == "darwin":
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.clonefile(os.fsencode(source), os.fsencode(target), 0) != 0:
+            raise OSError(ctypes.get_errno(), "clonefile failed")
+    else:
+        raise OSError(f"reflinks are not supported on {sys.platform}")
+
+
+def copy_file(source, target):
+    temp_target = f"{target}.tmp"
+    with open(source, "rb") as src, open(temp_target, "wb") as dst:
+        shutil.copyfileobj(src, dst, WRITE_BUFFER_SIZE)
+    os.replace(temp_target, target)
+
+
+def symlink_file(source, target):
+    os.symlink(os.path.abspath(source), target)
+
+
+# Cheapest first. Reflinks and hardlinks share storage without depending on the cache path staying around,
+# a copy always works but costs the full file size in time and disk
+PLACEMENT_STRATEGIES = (
+    ("reflink", reflink_file),
+    ("hardlink", os.link),
+    ("symlink", symlink_file),
+    ("copy", copy_file),
+)
+
+
+def place_file(source, target):
+    """
+        Makes source available at target using the first strategy that works, returns (strategy, seconds).
+    """
+    errors = []
+    for strategy, place in PLACEMENT_STRATEGIES:
+        start = time.monotonic()
+        try:
+            place(source, target)
+            return strategy, time.monotonic() - start
+        except (OSError, NotImplementedError) as e:
+            errors.append(f"{strategy}: {e}")
+    raise RuntimeError(f"Could not place {source} at {target} ({'; '.join(errors)})")
+
+
+def prepare_model(sha256, model_names, cache_dir, live_dir, connections, manifest):
+    model_info = MODELS[model_names[0]]
+    object_path = os.path.join(cache_dir, object_name(sha256))
+    os.makedirs(os.path.dirname(object_path), exist_ok=True)
+    if not os.path.exists(object_path):
+        download_model(model_info['url'], cache_dir, object_name(sha256), sha256, connections)
+        manifest.record(sha256, object_path, sha256)
+
+    placements = []
+    for model_name in model_names:
         live_target = os.path.join(live_dir, model_name)
         os.makedirs(os.path.dirname(live_target), exist_ok=True)
-        if not os.path.exists(live_target):
+        if os.path.lexists(live_target) and not os.path.exists(live_target):
+            # Dangling link, e.g. to the cache layout before it was content-addressed
+            os.remove(live_target)
+        if os.path.exists(live_target):
+            continue
+        strategy, seconds = place_file(object_path, live_target)
+        print(f"Placed {model_name} at {live_target} via {strategy} in {seconds:.3f}s.")
+        placements.append((model_name, strategy, seconds))
+    return placements
+
+
+def prefetch_file(path, buffer, stop_file=None):
+    """
+        Reads path front to back so it ends up in the page cache, returns (bytes read, whether it stopped early because
+        stop_file appeared). On POSIX the kernel is told the reads are sequential, so it reads ahead in larger blocks.
+    """
+    total = 0
+    view = memoryview(buffer)
+    with open(path, "rb", buffering=0) as f:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        while True:
+            if stop_file and os.path.exists(stop_file):
+                return total, True
+            read = f.readinto(view)
+            if not read:
+                return total, False
+            total += read
+
+
+def write_prefetch_report(report, report_path):
+    temp_path = f"{report_path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    os.replace(temp_path, report_path)
+
+
+def prefetch(args):
+    """
+        Warms the page cache with the models of the selected workflows, in the order the workflows will need them, while
+        the server starts. Stops adding models once --prefetch-ram-fraction of the available RAM is used, so it doesn't
+        evict more than it brings in. The report is rewritten after every model, action.py picks it up from there.
+        action.py creates <report>.stop before the first workflow, the reads stop there so they don't skew its timings.
+    """
+    stop_file = f"{args.prefetch_report}.stop"
+    start = time.monotonic()
+    _, workflow_files, _ = select_workflows(args.workflows, args.os, args.workflow_order, models_dir=args.live_directory)
+    models = models_in_use_order(workflow_files, models_dir=args.live_directory)
+    available = psutil.virtual_memory().available
+    budget = int(available * args.prefetch_ram_fraction)
+    if sys.platform.startswith("linux"):
+        # Server startup reads (Python imports, custom nodes) go first
+        psutil.Process().ionice(psutil.IOPRIO_CLASS_BE, value=7)
+
+    report = {
+        "workflows": workflow_files,
+        "available_bytes": available,
+        "budget_bytes": budget,
+        "warmed_bytes": 0,
+        "seconds": 0,
+        "finished": False,
+        "stopped": False,
+        "not_reached": [],
+        "models": [],
+    }
+    # Replaces whatever an earlier job left there before the first model is read
+    write_prefetch_report(report, args.prefetch_report)
+    buffer = bytearray(PREFETCH_READ_SIZE)
+    seen_files = set()
+    for i, model_name in enumerate(models):
+        if os.path.exists(stop_file):
+            report["stopped"] = True
+            report["not_reached"] = models[i:]
+            break
+        path = os.path.join(args.live_directory, model_name)
+        entry = {"model": model_name, "bytes": 0, "seconds": 0, "started_at": time.time()}
+        try:
+            stat = os.stat(path)
+        except OSError:
+            entry["status"] = "missing"
+            report["models"].append(entry)
+            continue
+        # Several names can share one file, e.g. hardlinks to the same cached object
+        file_id = (stat.st_dev, stat.st_ino)
+        if file_id in seen_files:
+            entry["status"] = "duplicate"
+        elif report["warmed_bytes"] + stat.st_size > budget:
+            entry["status"] = "over_budget"
+        else:
+            seen_files.add(file_id)
+            model_start = time.monotonic()
+            entry["bytes"], stopped = prefetch_file(path, buffer, stop_file)
+            entry["seconds"] = round(time.monotonic() - model_start, 3)
+            entry["status"] = "stopped" if stopped else "warmed"
+            report["warmed_bytes"] += entry["bytes"]
+            if stopped:
+                # Read up to entry["bytes"] of stat.st_size
+                entry["size"] = stat.st_size
+                report["stopped"] = True
+                report["not_reached"] = models[i + 1:]
+                report["models"].append(entry)
+                break
+            print(f"Prefetched {model_name} ({entry['bytes'] / (1024 ** 3):.2f} GB) in {entry['seconds']:.2f}s.")
+        report["models"].append(entry)
+        report["seconds"] = round(time.monotonic() - start, 3)
+        write_prefetch_report(report, args.prefetch_report)
+
+    report["seconds"] = round(time.monotonic() - start, 3)
+    report["finished"] = True
+    write_prefetch_report(report, args.prefetch_report)
+    skipped = [entry["model"] for entry in report["models"] if entry["status"] == "over_budget"]
+    print(f"Prefetched {report['warmed_bytes'] / (1024 ** 3):.2f} GB of models in {report['seconds']:.2f}s (budget {budget / (1024 ** 3):.2f} GB)"
+          + (f", skipped {', '.join(skipped)} for lack of RAM" if skipped else "")
+          + (f", stopped before {len(report['not_reached'])} more models as the workflows started" if report["stopped"] else ""))
+
+
+def main(args):
+    if args.prefetch:
+        prefetch(args)
+        return
+    cache_dir = args.cache_directory
+    live_dir = args.live_directory
+    os.makedirs(cache_dir, exist_ok=True)
+    manifest = CacheManifest(cache_dir)
+    migrate_legacy_cache(cache_dir, manifest)
+    verify_cache(cache_dir, live_dir, manifest, args.verify == "full", args.verify_workers)
+
+    failures = {}
+    placements = []
+    with ThreadPoolExecutor(max_workers=args.download_workers) as pool:
+        futures = {
+            pool.submit(prepare_model, sha256, model_names, cache_dir, live_dir, args.connections_per_file, manifest): ", ".join(model_names)
+            for sha256, model_names in models_by_hash().items()
+        }
+        for future in as_completed(futures):
             try:
-                os.symlink(cache_target, live_target)
-                print(f"Linked {model_name} to {live_target}.")
-            except:
-                shutil.copyfile(cache_target, live_target)
-                print(f"Copied {model_name} to {live_target}.")
+                placements.extend(future.result())
+            except Exception as e:
+                # Let the other downloads finish, their progress is kept either way
+                print(f"Failed to prepare {futures[future]}: {e}")
+                failures[futures[future]] = e
+
+    if placements:
+        print("Model placement summary:")
+        for model_name, strategy, seconds in sorted(placements):
+            print(f"  {strategy:<8} {seconds:8.3f}s  {model_name}")
+    if failures:
+        raise RuntimeError(f"Failed to prepare {len(failures)} models: {', '.join(failures)}")
 
 
 if __name__ == "__main__":
@@ -98,11 +588,43 @@ if __name__ == "__main__":
         description="Download and prepare the standard models the Comfy Action Runner tests against."
     )
     parser.add_argument(
-        "--cache-directory", help="Cache directory where models will be downloaded."
+        "--cache-directory", help="Cache directory where models will be downloaded, stored by their sha256."
     )
     parser.add_argument(
         "--live-directory", help="Directory where models will be placed for live usage."
     )
+    parser.add_argument(
+        "--download-workers", type=int, default=3, help="Number of models downloaded concurrently."
+    )
+    parser.add_argument(
+        "--connections-per-file", type=int, default=4, help="Concurrent range requests used for files large enough to be fetched in segments."
+    )
+    parser.add_argument(
+        "--verify", choices=["manifest", "full"], default="manifest",
+        help="'manifest' only hashes cached models whose size/mtime/inode changed since they were last verified, 'full' hashes all of them."
+    )
+    parser.add_argument(
+        "--verify-workers", type=int, default=os.cpu_count(), help="Number of cached models hashed concurrently when verifying."
+    )
+    parser.add_argument(
+        "--prefetch", action="store_true",
+        help="Instead of preparing models, read the models of the selected workflows from --live-directory into the page cache, e.g. while the server starts."
+    )
+    parser.add_argument(
+        "--workflows", default="auto", help="Comma separated workflows to prefetch the models of, or 'auto' for the default set (as passed to action.py)."
+    )
+    parser.add_argument(
+        "--os", default=None, help="OS the default workflow set is chosen for."
+    )
+    parser.add_argument(
+        "--workflow-order", choices=["auto", "given", "model-affinity"], default="auto", help="Order the workflows will run in, as passed to action.py."
+    )
+    parser.add_argument(
+        "--prefetch-ram-fraction", type=float, default=0.5, help="Share of the available RAM the prefetched models may take up."
+    )
+    parser.add_argument(
+        "--prefetch-report", default="model-prefetch.json", help="Where the prefetched models, bytes and time are written. Prefetching stops once <report>.stop exists."
+    )
 
     args = parser.parse_args()
     main(args)
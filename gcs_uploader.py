@@ -0,0 +1,101 @@
+import hashlib, threading, time, traceback
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from google.cloud import storage
+from tracing import tracer
+
+UploadResult = namedtuple("UploadResult", ["source_file_name", "destination_blob_name", "error", "duration", "deduplicated"], defaults=[False])
+# Every uploaded file is also kept under its content hash here, so identical files are copied inside the bucket instead of uploaded again
+CONTENT_PREFIX = "content/sha256"
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class GcsUploader:
+    """
+        Uploads files to a GCS bucket on a bounded thread pool, so the next workflow can start while outputs are still uploading.
+        One storage client and bucket handle are shared by every upload. Call flush() before exiting to wait for everything queued.
+        With dedupe, a file whose content hash is already in the bucket is copied server-side instead of uploaded.
+        That pays off for workflow outputs, which repeat across runs; submit(dedupe=False) skips it for files that don't, like logs.
+    """
+
+    def __init__(self, bucket_name, max_workers=4, dedupe=True):
+        self.bucket_name = bucket_name
+        self.dedupe = dedupe
+        self.known_hashes = set()
+        self.known_hashes_lock = threading.Lock()
+        self.storage_client = storage.Client()
+        self.bucket = self.storage_client.get_bucket(bucket_name)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gcs-upload")
+        self.futures = []
+
+    def _upload_deduplicated(self, destination_blob_name, source_file_name):
+        """
+            Returns True when the content was already in the bucket and only copied there.
+        """
+        sha256 = file_sha256(source_file_name)
+        content_blob = self.bucket.blob(f"{CONTENT_PREFIX}/{sha256}")
+        with self.known_hashes_lock:
+            known = sha256 in self.known_hashes
+        if known or content_blob.exists():
+            self.bucket.copy_blob(content_blob, self.bucket, destination_blob_name)
+            deduplicated = True
+        else:
+            self.bucket.blob(destination_blob_name).upload_from_filename(source_file_name)
+            self.bucket.copy_blob(self.bucket.blob(destination_blob_name), self.bucket, content_blob.name)
+            deduplicated = False
+        with self.known_hashes_lock:
+            self.known_hashes.add(sha256)
+        return deduplicated
+
+    def _upload(self, destination_blob_name, source_file_name, queued_at=None, dedupe=True):
+        start = time.monotonic()
+        deduplicated = False
+        try:
+            if dedupe:
+                deduplicated = self._upload_deduplicated(destination_blob_name, source_file_name)
+            else:
+                blob = self.bucket.blob(destination_blob_name)
+                blob.upload_from_filename(source_file_name)
+        except Exception as e:
+            print(f"Failed to upload {source_file_name} to {destination_blob_name}: {e}")
+            traceback.print_exc()
+            tracer.complete("upload", tracer.to_us(start), tracer.to_us(time.monotonic()), "gcs", {"file": source_file_name, "error": str(e)})
+            return UploadResult(source_file_name, destination_blob_name, e, time.monotonic() - start)
+        duration = time.monotonic() - start
+        tracer.complete("upload", tracer.to_us(start), tracer.to_us(start + duration), "gcs", {
+            "file": source_file_name, "blob": destination_blob_name, "deduplicated": deduplicated,
+            "queued_seconds": round(start - queued_at, 3) if queued_at is not None else None,
+        })
+        print(f"File {source_file_name} {'already in bucket, copied' if deduplicated else 'uploaded'} to {destination_blob_name} in {duration:.2f}s")
+        return UploadResult(source_file_name, destination_blob_name, None, duration, deduplicated)
+
+    def submit(self, destination_blob_name, source_file_name, dedupe=True):
+        print(f"Queueing upload of {source_file_name} to GCS bucket {self.bucket_name} as {destination_blob_name}")
+        future = self.executor.submit(self._upload, destination_blob_name, source_file_name, time.monotonic(), self.dedupe and dedupe)
+        self.futures.append(future)
+        return future
+
+    def flush(self):
+        """
+            Waits for every queued upload and returns their UploadResults in submission order.
+        """
+        results = [future.result() for future in self.futures]
+        self.futures = []
+        failed = [result for result in results if result.error is not None]
+        deduplicated = sum(1 for result in results if result.deduplicated)
+        print(f"Uploaded {len(results) - len(failed)}/{len(results)} files to GCS bucket {self.bucket_name} ({deduplicated} already in the bucket)")
+        for result in failed:
+            print(f"  FAILED {result.source_file_name} -> {result.destination_blob_name}: {result.error}")
+        return results
+
+    def close(self):
+        results = self.flush()
+        self.executor.shutdown(wait=True)
+        return results
@@ -0,0 +1,175 @@
+import hashlib, math, os, re, shutil, threading
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from PIL import Image
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+SSIM_WINDOW = 7
+SSIM_K1 = 0.01
+SSIM_K2 = 0.03
+PHASH_SIZE = 32
+PHASH_BITS = 8
+# An output matches its golden image when it passes every one of these
+MIN_PSNR = 30.0
+MIN_SSIM = 0.95
+MAX_PHASH_DISTANCE = 8
+# Below this many outputs the comparisons run in-process, starting the pool would cost more than it saves
+POOL_MIN_OUTPUTS = 4
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_rgb(path):
+    with Image.open(path) as image:
+        return np.asarray(image.convert("RGB"), dtype=np.float64)
+
+
+def psnr(a, b, peak=255.0):
+    mse = np.mean((a - b) ** 2)
+    return math.inf if mse == 0 else float(10 * np.log10(peak * peak / mse))
+
+
+def _box_mean(x, window):
+    # Means over every window x window block via an integral image, one pass regardless of the window size
+    integral = np.pad(x, ((1, 0), (1, 0))).cumsum(0).cumsum(1)
+    sums = integral[window:, window:] - integral[:-window, window:] - integral[window:, :-window] + integral[:-window, :-window]
+    return sums / (window * window)
+
+
+def ssim(a, b, peak=255.0):
+    """
+        Mean SSIM (Wang et al., 2004) of the luma of two RGB images over uniform SSIM_WINDOW windows.
+    """
+    luma = np.array([0.299, 0.587, 0.114])
+    x = a @ luma
+    y = b @ luma
+    window = min(SSIM_WINDOW, x.shape[0], x.shape[1])
+    c1 = (SSIM_K1 * peak) ** 2
+    c2 = (SSIM_K2 * peak) ** 2
+    mu_x = _box_mean(x, window)
+    mu_y = _box_mean(y, window)
+    var_x = _box_mean(x * x, window) - mu_x * mu_x
+    var_y = _box_mean(y * y, window) - mu_y * mu_y
+    covariance = _box_mean(x * y, window) - mu_x * mu_y
+    ssim_map = ((2 * mu_x * mu_y + c1) * (2 * covariance + c2)) / ((mu_x * mu_x + mu_y * mu_y + c1) * (var_x + var_y + c2))
+    return float(ssim_map.mean())
+
+
+def _dct_matrix(n):
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+def phash(path):
+    """
+        64-bit perceptual hash: the signs of the lowest 8x8 DCT coefficients of the 32x32 grayscale image against their median.
+    """
+    with Image.open(path) as image:
+        pixels = np.asarray(image.convert("L").resize((PHASH_SIZE, PHASH_SIZE), Image.LANCZOS), dtype=np.float64)
+    dct = _dct_matrix(PHASH_SIZE)
+    low = (dct @ pixels @ dct.T)[:PHASH_BITS, :PHASH_BITS].flatten()
+    bits = low > np.median(low[1:])
+    return int("".join("1" if bit else "0" for bit in bits), 2)
+
+
+def compare_images(output_path, golden_path):
+    """
+        Compares one output with its golden file. Byte-identical files short-circuit without decoding either of them.
+    """
+    result = {"output": os.path.basename(output_path), "golden": golden_path}
+    if file_sha256(output_path) == file_sha256(golden_path):
+        result.update(psnr=None, ssim=1.0, phash_distance=0, identical=True, match=True)
+        return result
+    result["identical"] = False
+    if not output_path.lower().endswith(IMAGE_EXTENSIONS):
+        result.update(psnr=None, ssim=None, phash_distance=None, match=False)
+        return result
+
+    output = load_rgb(output_path)
+    golden = load_rgb(golden_path)
+    if output.shape != golden.shape:
+        result.update(psnr=None, ssim=None, phash_distance=None, match=False, error=f"size {output.shape[1]}x{output.shape[0]} != golden {golden.shape[1]}x{golden.shape[0]}")
+        return result
+    result["psnr"] = psnr(output, golden)
+    result["ssim"] = ssim(output, golden)
+    result["phash_distance"] = bin(phash(output_path) ^ phash(golden_path)).count("1")
+    result["match"] = result["psnr"] >= MIN_PSNR and result["ssim"] >= MIN_SSIM and result["phash_distance"] <= MAX_PHASH_DISTANCE
+    if math.isinf(result["psnr"]):
+        # Not valid JSON, identical pixels are already told by ssim 1.0
+        result["psnr"] = None
+    return result
+
+
+class GoldenComparer:
+    """
+        Compares workflow outputs with the golden files stored per workflow under golden_dir/<os>-torch<t>-cuda<c>/.
+        Outputs are matched to golden files by their position. A workflow without any golden files (or every workflow
+        when update is set) has its outputs stored as the new golden files instead. A different number of outputs
+        than golden files is a mismatch, the golden files are only replaced with update.
+    """
+
+    def __init__(self, golden_dir, os_name, torch_version, cuda_version, update=False, workers=None):
+        combination = re.sub(r'[^\w\-\.]', '_', f"{os_name}-torch{torch_version}-cuda{cuda_version}")
+        self.golden_dir = os.path.join(golden_dir, combination)
+        self.update = update
+        self.workers = workers
+        self.pool = None
+        # compare() runs on the sharded worker threads, only one of them may start the pool
+        self.pool_lock = threading.Lock()
+
+    def _golden_paths(self, workflow_name, output_paths):
+        workflow_dir = os.path.join(self.golden_dir, workflow_name)
+        return [os.path.join(workflow_dir, f"{i:03}{os.path.splitext(path)[1].lower()}") for i, path in enumerate(output_paths)]
+
+    def _store(self, workflow_name, output_paths, golden_paths):
+        workflow_dir = os.path.join(self.golden_dir, workflow_name)
+        if os.path.isdir(workflow_dir):
+            shutil.rmtree(workflow_dir)
+        os.makedirs(workflow_dir)
+        for output_path, golden_path in zip(output_paths, golden_paths):
+            shutil.copyfile(output_path, golden_path)
+        print(f"Saved {len(output_paths)} golden files for {workflow_name} in {workflow_dir}")
+
+    def _stored_goldens(self, workflow_name):
+        workflow_dir = os.path.join(self.golden_dir, workflow_name)
+        if not os.path.isdir(workflow_dir):
+            return []
+        return sorted(os.path.join(workflow_dir, name) for name in os.listdir(workflow_dir))
+
+    def compare(self, workflow_name, output_paths):
+        golden_paths = self._golden_paths(workflow_name, output_paths)
+        stored = self._stored_goldens(workflow_name)
+        if self.update or not stored:
+            self._store(workflow_name, output_paths, golden_paths)
+            return {"status": "golden_saved", "outputs": []}
+
+        # Position by position over the outputs both sides have, an extension change is a golden file missing
+        pairs = [(output_path, golden_path) for output_path, golden_path in zip(output_paths, golden_paths) if golden_path in stored]
+        if len(pairs) >= POOL_MIN_OUTPUTS:
+            with self.pool_lock:
+                if self.pool is None:
+                    self.pool = ProcessPoolExecutor(max_workers=self.workers)
+            results = list(self.pool.map(compare_images, *zip(*pairs)))
+        else:
+            results = [compare_images(output_path, golden_path) for output_path, golden_path in pairs]
+        count_matches = len(output_paths) == len(stored) and len(pairs) == len(stored)
+        if not count_matches:
+            print(f"{workflow_name}: {len(output_paths)} outputs, but {len(stored)} golden files (use --update-golden if that is expected)")
+        status = "match" if count_matches and all(result["match"] for result in results) else "mismatch"
+        for result in results:
+            if not result["match"]:
+                print(f"{workflow_name}: {result['output']} differs from {result['golden']} (PSNR {result['psnr']}, SSIM {result['ssim']}, pHash distance {result['phash_distance']}{', ' + result['error'] if 'error' in result else ''})")
+        return {"status": status, "outputs": results, "output_count": len(output_paths), "golden_count": len(stored)}
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
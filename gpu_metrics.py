@@ -0,0 +1,303 @@
+import abc, atexit, collections, math, shutil, subprocess, threading, time
+import psutil
+
+GPU_METRICS_BACKENDS = ("auto", "nvml", "nvidia-smi", "fake", "none")
+# Memory in MiB, utilization in percent
+GpuSample = collections.namedtuple("GpuSample", ["index", "name", "memory_used", "memory_total", "utilization"])
+NVIDIA_SMI_QUERY = "index,name,memory.used,memory.total,utilization.gpu"
+# How long the first read waits for the streaming nvidia-smi to report every GPU once
+NVIDIA_SMI_FIRST_READ_TIMEOUT = 10
+
+
+class GpuMetricsError(Exception):
+    pass
+
+
+def parse_number(value):
+    try:
+        return float(value)
+    except ValueError:
+        # "[N/A]" or "[Not Supported]", e.g. the utilization of some datacenter GPUs
+        return 0.0
+
+
+class GpuMetricsBackend(abc.ABC):
+    """
+        Reads the memory and utilization of every GPU. read() returns one GpuSample per GPU, reusing the last reading
+        while it is younger than max_age seconds, so several sampling threads don't multiply the cost.
+        The backend keeps track of what its own reads cost, see overhead().
+    """
+
+    name = None
+
+    def __init__(self, max_age=0.0):
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.last = None
+        self.last_time = None
+        self.reads = 0
+        self.read_seconds = 0.0
+        self.read_cpu_seconds = 0.0
+
+    @abc.abstractmethod
+    def _read(self):
+        """
+            Reads every GPU now, returns one GpuSample per GPU.
+        """
+
+    def read(self):
+        with self.lock:
+            now = time.monotonic()
+            if self.last is not None and now - self.last_time < self.max_age:
+                return self.last
+            cpu_start = time.thread_time()
+            self.last = self._read()
+            self.last_time = time.monotonic()
+            self.reads += 1
+            self.read_seconds += self.last_time - now
+            self.read_cpu_seconds += time.thread_time() - cpu_start
+            return self.last
+
+    def gpu(self, index=0):
+        for sample in self.read():
+            if sample.index == index:
+                return sample
+        return None
+
+    def helper_cpu_seconds(self):
+        # CPU used outside this process on behalf of the backend, e.g. by nvidia-smi
+        return 0.0
+
+    def overhead(self):
+        return {
+            "backend": self.name,
+            "reads": self.reads,
+            "mean_read_ms": round(self.read_seconds / self.reads * 1000, 3) if self.reads else None,
+            "cpu_seconds": round(self.read_cpu_seconds + self.helper_cpu_seconds(), 3),
+        }
+
+    def close(self):
+        pass
+
+
+class NullBackend(GpuMetricsBackend):
+    """
+        No GPUs, for machines without an NVIDIA driver.
+    """
+
+    name = "none"
+
+    def _read(self):
+        return []
+
+
+class NvmlBackend(GpuMetricsBackend):
+    """
+        Talks to the driver through NVML (nvidia-ml-py) in-process, with the device handles looked up once.
+    """
+
+    name = "nvml"
+
+    def __init__(self, max_age=0.0):
+        super().__init__(max_age)
+        try:
+            import pynvml
+        except ImportError as e:
+            raise GpuMetricsError("nvidia-ml-py is not installed") from e
+        self.pynvml = pynvml
+        # GPUs whose failing reads were already reported, a broken GPU would otherwise print on every sample
+        self.failing = set()
+        try:
+            pynvml.nvmlInit()
+            self.handles = [pynvml.nvmlDeviceGetHandleByIndex(i) for i in range(pynvml.nvmlDeviceGetCount())]
+            self.names = [self._decode(pynvml.nvmlDeviceGetName(handle)) for handle in self.handles]
+        except pynvml.NVMLError as e:
+            raise GpuMetricsError(f"NVML failed: {e}") from e
+
+    @staticmethod
+    def _decode(name):
+        # Older nvidia-ml-py versions return bytes
+        return name.decode("utf-8") if isinstance(name, bytes) else name
+
+    def _read(self):
+        samples = []
+        for index, (handle, name) in enumerate(zip(self.handles, self.names)):
+            try:
+                memory = self.pynvml.nvmlDeviceGetMemoryInfo(handle)
+            except self.pynvml.NVMLError as e:
+                if index not in self.failing:
+                    self.failing.add(index)
+                    print(f"NVML could not read the memory of GPU {index}: {e}, it is left out of the samples")
+                continue
+            try:
+                utilization = float(self.pynvml.nvmlDeviceGetUtilizationRates(handle).gpu)
+            except self.pynvml.NVMLError:
+                # Not supported on some GPUs
+                utilization = 0.0
+            samples.append(GpuSample(index, name, memory.used / (1024 ** 2), memory.total / (1024 ** 2), utilization))
+        return samples
+
+    def close(self):
+        try:
+            self.pynvml.nvmlShutdown()
+        except self.pynvml.NVMLError:
+            pass
+
+
+class NvidiaSmiStreamBackend(GpuMetricsBackend):
+    """
+        One long-running nvidia-smi that prints every GPU each interval seconds, instead of a new nvidia-smi per read.
+        read() returns the latest line of every GPU.
+    """
+
+    name = "nvidia-smi"
+
+    def __init__(self, interval=0.5, max_age=0.0):
+        super().__init__(max_age)
+        executable = shutil.which("nvidia-smi")
+        if executable is None:
+            raise GpuMetricsError("nvidia-smi is not on the PATH")
+        self.latest = {}
+        self.latest_lock = threading.Lock()
+        self.first_reading = threading.Event()
+        self.gpu_count = self._count_gpus(executable)
+        self.process = subprocess.Popen(
+            [executable, f"--query-gpu={NVIDIA_SMI_QUERY}", "--format=csv,noheader,nounits", f"-lms={max(int(interval * 1000), 100)}"],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+        )
+        self.helper = psutil.Process(self.process.pid)
+        self.helper_cpu = 0.0
+        self.thread = threading.Thread(target=self._follow, name="nvidia-smi-stream", daemon=True)
+        self.thread.start()
+
+    @staticmethod
+    def _count_gpus(executable):
+        try:
+            output = subprocess.check_output([executable, "--query-gpu=index", "--format=csv,noheader"], text=True, timeout=NVIDIA_SMI_FIRST_READ_TIMEOUT)
+        except (OSError, subprocess.SubprocessError) as e:
+            raise GpuMetricsError(f"nvidia-smi failed: {e}") from e
+        return len([line for line in output.splitlines() if line.strip()])
+
+    @staticmethod
+    def parse_line(line):
+        fields = [field.strip() for field in line.split(",")]
+        if len(fields) != 5 or not fields[0].isdigit():
+            return None
+        index, name, *values = fields
+        return GpuSample(int(index), name, *(parse_number(value) for value in values))
+
+    def _follow(self):
+        for line in self.process.stdout:
+            sample = self.parse_line(line)
+            if sample is None:
+                continue
+            with self.latest_lock:
+                self.latest[sample.index] = sample
+                if len(self.latest) >= self.gpu_count:
+                    self.first_reading.set()
+        # nvidia-smi exited, reads return what was seen last
+        self.first_reading.set()
+
+    def _read(self):
+        # Without any GPU there is no reading to wait for
+        if self.gpu_count:
+            self.first_reading.wait(NVIDIA_SMI_FIRST_READ_TIMEOUT)
+        with self.latest_lock:
+            return [self.latest[index] for index in sorted(self.latest)]
+
+    def helper_cpu_seconds(self):
+        try:
+            cpu_times = self.helper.cpu_times()
+            self.helper_cpu = cpu_times.user + cpu_times.system
+        except psutil.NoSuchProcess:
+            pass
+        return self.helper_cpu
+
+    def close(self):
+        self.helper_cpu_seconds()
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.process.stdout.close()
+
+
+class FakeBackend(GpuMetricsBackend):
+    """
+        count made-up GPUs whose memory and utilization follow a fixed pattern over the reads, for testing without a GPU.
+    """
+
+    name = "fake"
+
+    def __init__(self, count=1, memory_total=24576.0, max_age=0.0):
+        super().__init__(max_age)
+        self.count = count
+        self.memory_total = memory_total
+        self.step = 0
+
+    def _read(self):
+        self.step += 1
+        level = (math.sin(self.step / 10) + 1) / 2
+        return [
+            GpuSample(index, f"Fake GPU {index}", round(self.memory_total * level * (index + 1) / (self.count + 1), 1), self.memory_total, round(level * 100, 1))
+            for index in range(self.count)
+        ]
+
+
+def create_backend(kind="auto", interval=0.5):
+    """
+        The backend of the given kind. 'auto' uses NVML, then a streaming nvidia-smi, then no GPUs.
+    """
+    max_age = interval / 2
+    if kind == "none":
+        return NullBackend()
+    if kind == "fake":
+        return FakeBackend(max_age=max_age)
+    if kind == "nvml":
+        return NvmlBackend(max_age)
+    if kind == "nvidia-smi":
+        return NvidiaSmiStreamBackend(interval, max_age)
+    errors = []
+    for backend in (lambda: NvmlBackend(max_age), lambda: NvidiaSmiStreamBackend(interval, max_age)):
+        try:
+            return backend()
+        except GpuMetricsError as e:
+            errors.append(str(e))
+    print(f"No GPU metrics available ({'; '.join(errors)}), GPU usage will be reported as zero")
+    return NullBackend()
+
+
+_backend = None
+_backend_config = ("auto", 0.5)
+_backend_lock = threading.Lock()
+
+
+def configure(kind="auto", interval=0.5):
+    """
+        Sets the backend get_backend() creates, call it before anything reads GPU metrics.
+    """
+    global _backend_config
+    _backend_config = (kind, interval)
+
+
+def get_backend():
+    """
+        The backend shared by everything in this process, created on first use.
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = create_backend(*_backend_config)
+            # A streaming nvidia-smi would otherwise outlive the process
+            atexit.register(close_backend)
+        return _backend
+
+
+def close_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is not None:
+            _backend.close()
+            _backend = None
@@ -0,0 +1,221 @@
+import collections, os, shlex, subprocess, sys, threading, time, traceback
+from urllib.parse import urlsplit
+import psutil
+import requests
+from machine_stats import get_comfy_process, get_gpu_count
+from poll_server_start import is_successful
+
+READY_POLL_INTERVAL = 0.25
+STOP_TIMEOUT = 30
+
+
+class ComfyInstance:
+    """
+        One ComfyUI server the harness runs workflows on: either already running at url, or launched by launch_instance.
+        device is a CUDA device index, or None for a CPU-only instance.
+    """
+
+    def __init__(self, url, device=None, popen=None, output_dir=None, log_path=None):
+        self.url = url.rstrip("/")
+        self.device = device
+        self.popen = popen
+        self.output_dir = output_dir
+        self.log_path = log_path
+        self._process = None
+
+    @property
+    def port(self):
+        return urlsplit(self.url).port or 80
+
+    @property
+    def name(self):
+        return f"{self.port}-{'cpu' if self.device is None else f'cuda{self.device}'}"
+
+    def get_process(self):
+        # Kept around so psutil's per-process CPU percentages are measured between consecutive samples
+        if self._process is None:
+            if self.popen is not None:
+                try:
+                    self._process = psutil.Process(self.popen.pid)
+                except psutil.NoSuchProcess:
+                    return None
+            else:
+                self._process = get_comfy_process(self.port)
+        return self._process
+
+    def describe(self):
+        return {"url": self.url, "port": self.port, "device": "cpu" if self.device is None else f"cuda:{self.device}"}
+
+
+def parse_devices(spec, count):
+    """
+        Device of each of count instances: 'auto' gives every instance its own GPU while there are enough and makes the
+        rest CPU-only, otherwise a comma separated list of CUDA indices or 'cpu' (the last entry repeats).
+    """
+    if spec == "auto":
+        gpu_count = get_gpu_count()
+        return [i if i < gpu_count else None for i in range(count)]
+    entries = [entry.strip() for entry in spec.split(",") if entry.strip()]
+    devices = [None if entry == "cpu" else int(entry) for entry in entries]
+    return [devices[min(i, len(devices) - 1)] for i in range(count)]
+
+
+def split_run_flags(comfy_run_flags):
+    """
+        The extra ComfyUI arguments of --comfy-run-flags as an argv list. action.yml passes them wrapped in literal
+        quotes (the payload reports them that way), those are stripped before splitting.
+    """
+    flags = (comfy_run_flags or "").strip()
+    if len(flags) >= 2 and flags[0] == flags[-1] and flags[0] in "'\"":
+        flags = flags[1:-1]
+    return shlex.split(flags)
+
+
+def launch_instance(workspace_path, port, device, comfy_run_flags=""):
+    """
+        Starts a ComfyUI server from workspace_path on port with its own output and temp directories, so instances
+        can't overwrite each other's outputs or clear each other's temp files on startup.
+    """
+    instance_dir = os.path.join(workspace_path, "instances", str(port))
+    output_dir = os.path.join(instance_dir, "output")
+    os.makedirs(output_dir, exist_ok=True)
+    command = [
+        sys.executable, "main.py",
+        "--listen", "127.0.0.1",
+        "--port", str(port),
+        "--output-directory", output_dir,
+        "--temp-directory", instance_dir,
+    ]
+    command += ["--cpu"] if device is None else ["--cuda-device", str(device)]
+    command += split_run_flags(comfy_run_flags)
+    log_path = os.path.join(workspace_path, f"application-{port}.log")
+    print(f"Launching ComfyUI instance: {' '.join(command)}")
+    with open(log_path, "w", encoding="utf-8") as log:
+        popen = subprocess.Popen(command, cwd=workspace_path, stdout=log, stderr=subprocess.STDOUT)
+    return ComfyInstance(f"http://127.0.0.1:{port}", device, popen, output_dir, log_path)
+
+
+def wait_until_ready(instances, timeout):
+    """
+        Blocks until every instance answers /queue, raises RuntimeError naming those that didn't within timeout.
+    """
+    deadline = time.monotonic() + timeout
+    pending = list(instances)
+    with requests.Session() as session:
+        while pending:
+            pending = [instance for instance in pending if not is_successful(session, instance.url, 2)]
+            for instance in pending:
+                if instance.popen is not None and instance.popen.poll() is not None:
+                    raise RuntimeError(f"ComfyUI instance {instance.name} exited with {instance.popen.returncode}, see {instance.log_path}")
+            if not pending:
+                break
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"ComfyUI instances did not start within {timeout}s: {', '.join(instance.name for instance in pending)}")
+            time.sleep(READY_POLL_INTERVAL)
+
+
+def stop_instances(instances):
+    for instance in instances:
+        if instance.popen is None or instance.popen.poll() is not None:
+            continue
+        instance.popen.terminate()
+        try:
+            instance.popen.wait(STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            instance.popen.kill()
+            instance.popen.wait()
+
+
+class WorkStealingQueue:
+    """
+        Per-worker deques of items. Each worker starts with a contiguous slice of the given order (keeping neighbouring
+        workflows that share models together) and takes from its front, an idle worker steals from the back of the
+        fullest other deque. Items in exclusive (SD3 and Flux, which need the most RAM) are held back until every other
+        item finished and then run one at a time. Workers report finished items with done().
+    """
+
+    def __init__(self, items, workers, exclusive=()):
+        self.condition = threading.Condition()
+        self.cancelled = False
+        self.held = collections.deque(item for item in items if item in exclusive)
+        items = [item for item in items if item not in exclusive]
+        self.running = 0
+        self.deques = [collections.deque() for _ in range(workers)]
+        per_worker, extra = divmod(len(items), workers)
+        start = 0
+        for i, worker_deque in enumerate(self.deques):
+            end = start + per_worker + (1 if i < extra else 0)
+            worker_deque.extend(items[start:end])
+            start = end
+        self.steals = 0
+
+    def take(self, worker):
+        """
+            Next item for worker, or None once every item was handed out or the queue was cancelled. Blocks while
+            only held items are left and others are still running.
+        """
+        with self.condition:
+            while not self.cancelled:
+                victim = max(self.deques, key=len)
+                if self.deques[worker]:
+                    item = self.deques[worker].popleft()
+                elif victim:
+                    self.steals += 1
+                    item = victim.pop()
+                elif self.held and self.running == 0:
+                    item = self.held.popleft()
+                elif self.held:
+                    self.condition.wait()
+                    continue
+                else:
+                    return None
+                self.running += 1
+                return item
+            return None
+
+    def done(self):
+        with self.condition:
+            self.running -= 1
+            self.condition.notify_all()
+
+    def cancel(self):
+        with self.condition:
+            self.cancelled = True
+            self.condition.notify_all()
+
+
+def run_sharded(instances, items, run_item, exclusive=()):
+    """
+        Runs run_item(instance, item) for every item across the instances, one item at a time per instance, the items
+        in exclusive last and alone. The first failure stops new items from being started; it is re-raised once the
+        running ones finished. Returns the (instance name, item) pairs in completion order.
+    """
+    work_queue = WorkStealingQueue(items, len(instances), exclusive)
+    completed = []
+    errors = []
+
+    def worker(index, instance):
+        while True:
+            item = work_queue.take(index)
+            if item is None:
+                return
+            try:
+                run_item(instance, item)
+                completed.append((instance.name, item))
+            except BaseException as e:
+                traceback.print_exc()
+                errors.append(e)
+                work_queue.cancel()
+                return
+            finally:
+                work_queue.done()
+
+    threads = [threading.Thread(target=worker, args=(i, instance), name=f"instance-{instance.name}") for i, instance in enumerate(instances)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print(f"Ran {len(completed)} workflows on {len(instances)} instances ({work_queue.steals} stolen)")
+    if errors:
+        raise errors[0]
+    return completed
@@ -0,0 +1,179 @@
+"""
+Canonical JSON fingerprints and base64 encodings of workflow files, streamed so no full serialised copy is kept.
+
+e.g. > python json_fingerprint.py workflows/sd15_default.json
+     > python json_fingerprint.py --base64 < workflow.json
+     > python json_fingerprint.py --batch workflows/
+
+"""
+import argparse, base64, hashlib, json, math, os, sys
+
+# Serialised chunks are gathered up to this size before being hashed and encoded
+CHUNK_SIZE = 64 * 1024
+
+
+def format_number(value):
+    """
+        Integral floats are written like ints (1.0 -> 1) and exponents without padding (1e-07 -> 1e-7), so equal
+        numbers always serialise the same.
+    """
+    if isinstance(value, int):
+        return str(value)
+    if not math.isfinite(value):
+        raise ValueError(f"{value} can't be represented in JSON")
+    if value.is_integer() and abs(value) < 1e21:
+        return str(int(value))
+    text = repr(value)
+    if "e" in text:
+        mantissa, exponent = text.split("e")
+        exponent = int(exponent)
+        text = f"{mantissa}e{'+' if exponent > 0 else '-'}{abs(exponent)}"
+    return text
+
+
+def canonical_chunks(data):
+    """
+        Yields the canonical serialisation of data piece by piece: sorted keys, no whitespace, unescaped unicode.
+    """
+    if isinstance(data, dict):
+        yield "{"
+        for i, key in enumerate(sorted(data)):
+            if not isinstance(key, str):
+                raise TypeError(f"JSON object keys must be strings, got {key!r}")
+            yield ("," if i else "") + json.dumps(key, ensure_ascii=False) + ":"
+            yield from canonical_chunks(data[key])
+        yield "}"
+    elif isinstance(data, (list, tuple)):
+        yield "["
+        for i, item in enumerate(data):
+            if i:
+                yield ","
+            yield from canonical_chunks(item)
+        yield "]"
+    elif isinstance(data, str):
+        yield json.dumps(data, ensure_ascii=False)
+    elif data is True:
+        yield "true"
+    elif data is False:
+        yield "false"
+    elif data is None:
+        yield "null"
+    elif isinstance(data, (int, float)):
+        yield format_number(data)
+    else:
+        raise TypeError(f"{type(data).__name__} is not JSON serializable")
+
+
+def canonical_byte_chunks(data):
+    pending = []
+    size = 0
+    for chunk in canonical_chunks(data):
+        pending.append(chunk)
+        size += len(chunk)
+        if size >= CHUNK_SIZE:
+            yield "".join(pending).encode("utf-8")
+            pending = []
+            size = 0
+    if pending:
+        yield "".join(pending).encode("utf-8")
+
+
+def raw_byte_chunks(stream):
+    return iter(lambda: stream.read(CHUNK_SIZE), b"")
+
+
+class Base64Writer:
+    """
+        Base64-encodes the bytes written to it onto out as they arrive, carrying the 0-2 bytes that don't fill a
+        3-byte group over to the next write.
+    """
+
+    def __init__(self, out):
+        self.out = out
+        self.pending = b""
+
+    def write(self, data):
+        data = self.pending + data
+        whole = len(data) - len(data) % 3
+        self.out.write(base64.b64encode(data[:whole]))
+        self.pending = data[whole:]
+
+    def close(self):
+        self.out.write(base64.b64encode(self.pending))
+        self.pending = b""
+
+
+def fingerprint(data):
+    """
+        sha256 of the canonical serialisation of data.
+    """
+    hash_tracker = hashlib.sha256()
+    for chunk in canonical_byte_chunks(data):
+        hash_tracker.update(chunk)
+    return hash_tracker.hexdigest()
+
+
+def process(chunks, base64_out=None):
+    """
+        Hashes the chunks and, with base64_out, writes their base64 encoding there in the same pass. Returns the sha256.
+    """
+    hash_tracker = hashlib.sha256()
+    writer = Base64Writer(base64_out) if base64_out is not None else None
+    for chunk in chunks:
+        hash_tracker.update(chunk)
+        if writer is not None:
+            writer.write(chunk)
+    if writer is not None:
+        writer.close()
+    return hash_tracker.hexdigest()
+
+
+def file_chunks(path, raw):
+    """
+        Chunks of a file ('-' is stdin), either its bytes as they are or its canonical JSON serialisation.
+    """
+    stream = sys.stdin.buffer if path == "-" else open(path, "rb")
+    try:
+        if raw:
+            yield from raw_byte_chunks(stream)
+        else:
+            yield from canonical_byte_chunks(json.load(stream))
+    finally:
+        if stream is not sys.stdin.buffer:
+            stream.close()
+
+
+def main(args):
+    paths = args.files or ["-"]
+    if args.batch:
+        paths = sorted(os.path.join(args.batch, name) for name in os.listdir(args.batch) if name.endswith(".json"))
+
+    if args.base64:
+        if len(paths) != 1:
+            print("--base64 encodes a single file")
+            sys.exit(1)
+        sha256 = process(file_chunks(paths[0], args.raw), sys.stdout.buffer)
+        sys.stdout.buffer.write(b"\n")
+        sys.stdout.flush()
+        # Kept off stdout so the encoding can be piped on as it is
+        print(f"sha256: {sha256}", file=sys.stderr)
+        return
+
+    fingerprints = {}
+    for path in paths:
+        fingerprints[path] = process(file_chunks(path, args.raw))
+    if args.json:
+        print(json.dumps(fingerprints, indent=2))
+    else:
+        for path, sha256 in fingerprints.items():
+            print(f"{sha256}  {path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fingerprint or base64-encode JSON workflow files in their canonical form (sorted keys, no whitespace, stable numbers).")
+    parser.add_argument("files", nargs="*", help="JSON files to read, '-' or nothing for stdin.")
+    parser.add_argument("--batch", type=str, default=None, help="Fingerprint every .json file in this directory instead.")
+    parser.add_argument("--base64", action="store_true", help="Print the base64 encoding of the canonical JSON instead (its sha256 goes to stderr).")
+    parser.add_argument("--raw", action="store_true", help="Use the file bytes as they are instead of canonicalising the JSON.")
+    parser.add_argument("--json", action="store_true", help="Print the fingerprints as a JSON object.")
+    main(parser.parse_args())
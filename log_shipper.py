@@ -0,0 +1,195 @@
+"""
+Ships ComfyUI server logs to GCS while the job runs instead of in one upload at the end.
+
+Each log is followed from its first byte and written out as gzip segments of about LOG_SEGMENT_SIZE, uploaded as
+soon as they fill up. Every workflow also gets its own gzip slice of the bytes the log grew by while it ran, uploaded
+when it finishes. log-index.json maps byte ranges of every log to the segment and slice blobs holding them, so any
+part of a log can be fetched without downloading all of it. Segments are gzip members, concatenated in index order
+they decompress to the whole log: > cat *.log.gz | gunzip
+"""
+import json, os, threading, time, zlib
+
+# Log bytes per segment before it is closed and uploaded
+LOG_SEGMENT_SIZE = 8 * 1024 * 1024
+TAIL_INTERVAL = 1.0
+READ_SIZE = 1024 * 1024
+INDEX_FILE = "log-index.json"
+
+
+class GzipSlice:
+    """
+        A byte range of a log, gzip-compressed into path as the bytes come in.
+    """
+
+    def __init__(self, path, blob_name, start_offset):
+        self.path = path
+        self.blob_name = blob_name
+        self.start_offset = start_offset
+        self.end_offset = start_offset
+        self.start_time = time.time()
+        self.compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        self.file = open(path, "wb")
+
+    def write(self, data):
+        self.file.write(self.compressor.compress(data))
+        self.end_offset += len(data)
+
+    def close(self):
+        self.file.write(self.compressor.flush())
+        self.file.close()
+        return {
+            "blob": self.blob_name,
+            "start_offset": self.start_offset,
+            "end_offset": self.end_offset,
+            "compressed_size": os.path.getsize(self.path),
+        }
+
+
+class LogTail:
+    """
+        Follows one log file and hands every new chunk to its current segment and to the open workflow slices.
+    """
+
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        self.offset = 0
+        self.segment = None
+        self.segments = []
+        self.slices = {}
+
+
+class LogShipper:
+    """
+        Tails the given logs on a background thread. start_slice()/end_slice() bracket a workflow, end_slice() queues
+        the workflow's slice on the uploader right away. close() ships what is left and the index.
+    """
+
+    def __init__(self, uploader, gcs_prefix, work_dir, segment_size=LOG_SEGMENT_SIZE, interval=TAIL_INTERVAL):
+        self.uploader = uploader
+        self.gcs_prefix = gcs_prefix
+        self.work_dir = work_dir
+        self.segment_size = segment_size
+        self.interval = interval
+        os.makedirs(work_dir, exist_ok=True)
+        self.tails = {}
+        self.default_path = None
+        self.workflows = []
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._follow, name="log-shipper", daemon=True)
+        self.thread.start()
+
+    def watch(self, path, name=None):
+        """
+            Starts shipping the log at path, the first one watched is the default log of start_slice().
+        """
+        path = os.path.abspath(path)
+        with self.lock:
+            if path not in self.tails:
+                name = name or os.path.splitext(os.path.basename(path))[0]
+                self.tails[path] = LogTail(name, path)
+            if self.default_path is None:
+                self.default_path = path
+
+    def _follow(self):
+        while not self.stop_event.wait(self.interval):
+            with self.lock:
+                for tail in self.tails.values():
+                    self._catch_up(tail)
+
+    def _catch_up(self, tail):
+        try:
+            with open(tail.path, "rb") as log:
+                log.seek(tail.offset)
+                for data in iter(lambda: log.read(READ_SIZE), b""):
+                    self._ship_bytes(tail, data)
+        except FileNotFoundError:
+            # The server has not created it yet
+            pass
+
+    def _ship_bytes(self, tail, data):
+        for log_slice in tail.slices.values():
+            log_slice.write(data)
+        while data:
+            if tail.segment is None:
+                number = len(tail.segments)
+                tail.segment = GzipSlice(
+                    os.path.join(self.work_dir, f"{tail.name}-{number:05}.log.gz"),
+                    f"{self.gcs_prefix}/{tail.name}/{number:05}.log.gz",
+                    tail.offset,
+                )
+            room = self.segment_size - (tail.segment.end_offset - tail.segment.start_offset)
+            tail.segment.write(data[:room])
+            tail.offset += len(data[:room])
+            data = data[room:]
+            if tail.segment.end_offset - tail.segment.start_offset >= self.segment_size:
+                self._close_segment(tail)
+
+    def _close_segment(self, tail):
+        tail.segments.append(tail.segment.close())
+        # Log files are unique, looking them up by content hash would only add requests
+        self.uploader.submit(tail.segment.blob_name, tail.segment.path, dedupe=False)
+        tail.segment = None
+
+    def start_slice(self, key, blob_name, path=None):
+        """
+            Starts recording the bytes the log (the default one without path) grows by into a slice for key.
+        """
+        path = os.path.abspath(path) if path else self.default_path
+        if path is None:
+            return
+        with self.lock:
+            if path not in self.tails:
+                self.tails[path] = LogTail(os.path.splitext(os.path.basename(path))[0], path)
+            tail = self.tails[path]
+            self._catch_up(tail)
+            local_path = os.path.join(self.work_dir, f"{key}.log.gz")
+            tail.slices[key] = GzipSlice(local_path, blob_name, tail.offset)
+
+    def end_slice(self, key, status=None):
+        """
+            Closes the slice of key and queues its upload. Returns its index entry, None if no slice was started.
+        """
+        with self.lock:
+            for tail in self.tails.values():
+                if key in tail.slices:
+                    break
+            else:
+                return None
+            # Everything the server logged up to now belongs to the workflow
+            self._catch_up(tail)
+            log_slice = tail.slices.pop(key)
+            entry = {"workflow": key, "log": tail.name, "status": status, "start_time": log_slice.start_time, "end_time": time.time(), **log_slice.close()}
+            self.workflows.append(entry)
+        self.uploader.submit(entry["blob"], log_slice.path, dedupe=False)
+        return entry
+
+    def index(self):
+        return {
+            "logs": {
+                tail.name: {"size": tail.offset, "segments": tail.segments}
+                for tail in self.tails.values()
+            },
+            "workflows": self.workflows,
+        }
+
+    def close(self):
+        """
+            Ships the rest of every log, ends the slices still open and uploads the index. Returns the index path.
+        """
+        self.stop_event.set()
+        self.thread.join()
+        with self.lock:
+            for tail in self.tails.values():
+                self._catch_up(tail)
+                if tail.segment is not None:
+                    self._close_segment(tail)
+            open_keys = [key for tail in self.tails.values() for key in tail.slices]
+        for key in open_keys:
+            self.end_slice(key, "unfinished")
+        index_path = os.path.join(self.work_dir, INDEX_FILE)
+        with open(index_path, "w", encoding="utf-8") as f:
+            json.dump(self.index(), f, indent=2)
+        self.uploader.submit(f"{self.gcs_prefix}/{INDEX_FILE}", index_path, dedupe=False)
+        return index_path
@@ -0,0 +1,200 @@
+import hashlib, os, platform, site, subprocess, sys, threading, time, traceback
+import psutil
+import gpu_metrics
+from tracing import span
+
+PIP_FREEZE_CACHE_DIR = os.path.expanduser("~/.cache/comfy-actions-runner/pip-freeze")
+
+
+def get_listening_process(port):
+    """
+        The process listening on a local TCP port. Listing other users' sockets needs root on macOS, None is returned then.
+    """
+    try:
+        for connection in psutil.net_connections(kind="tcp"):
+            if connection.status == psutil.CONN_LISTEN and connection.laddr and connection.laddr.port == port and connection.pid:
+                return psutil.Process(connection.pid)
+    except (psutil.AccessDenied, psutil.NoSuchProcess, PermissionError):
+        pass
+    return None
+
+
+# Found server processes by port, a failed lookup is not kept so it is retried once the server is up
+_comfy_processes = {}
+
+
+def get_comfy_process(port=None):
+    process = _comfy_processes.get(port)
+    if process is None:
+        process = _find_comfy_process(port)
+        if process is not None:
+            _comfy_processes[port] = process
+    return process
+
+
+def _find_comfy_process(port=None):
+    if port is not None:
+        process = get_listening_process(port)
+        if process is not None:
+            return process
+
+    comfy_processes = []
+    process_list = list(psutil.process_iter(['pid', 'exe', 'cmdline']))
+    python_processes = [proc for proc in process_list if proc.info['exe'] is not None and 'python' in proc.info['exe'].lower()]
+    for process in python_processes:
+        cmdline = process.info['cmdline']
+        if cmdline and 'main.py' in ' '.join(cmdline):
+            comfy_processes.append(process)
+    if port is not None and len(comfy_processes) > 1:
+        # Several servers run side by side, tell them apart by the port they were started with
+        comfy_processes = [
+            process for process in comfy_processes
+            if f"--port {port}" in ' '.join(process.info['cmdline']) or f"--port={port}" in ' '.join(process.info['cmdline'])
+        ]
+
+    if len(comfy_processes) == 1:
+        return comfy_processes[0]
+
+    print(f"Found {len(comfy_processes)} comfy processes{f' on port {port}' if port is not None else ''} out of {len(process_list)} total processes ({len(python_processes)} python), expected 1, will not measure RAM usage")
+    return None
+
+def get_gpu(index=0):
+    """
+        The current GpuSample of a GPU from the shared metrics backend, None if there is no such GPU.
+    """
+    return gpu_metrics.get_backend().gpu(index)
+
+def get_gpu_count():
+    return len(gpu_metrics.get_backend().read())
+
+def get_gpu_name():
+    gpu = get_gpu()
+    return gpu.name if gpu else "No GPU detected"
+
+def get_vramtotal(index=0):
+    gpu = get_gpu(index) if index is not None else None
+    return f"{gpu.memory_total} MiB" if gpu else "No GPU detected"
+
+
+def get_environment_fingerprint():
+    """
+        Identifies the installed package set without running pip: the interpreter plus the names and mtimes of every
+        site-packages entry, which change whenever a distribution is installed, upgraded or removed.
+    """
+    fingerprint = hashlib.sha256()
+    fingerprint.update(f"{sys.executable}\0{sys.version}\0{sys.prefix}\0".encode("utf-8"))
+    site_dirs = list(site.getsitepackages()) if hasattr(site, "getsitepackages") else []
+    site_dirs.append(site.getusersitepackages())
+    for site_dir in sorted(set(site_dirs)):
+        try:
+            entries = sorted(os.scandir(site_dir), key=lambda entry: entry.name)
+        except OSError:
+            continue
+        fingerprint.update(f"{site_dir}\0".encode("utf-8"))
+        for entry in entries:
+            try:
+                fingerprint.update(f"{entry.name}\0{entry.stat(follow_symlinks=False).st_mtime_ns}\0".encode("utf-8"))
+            except OSError:
+                continue
+    return fingerprint.hexdigest()
+
+
+def get_pip_freeze(cache_dir=PIP_FREEZE_CACHE_DIR):
+    """
+        Returns (pip freeze output, whether it came from the on-disk cache).
+    """
+    cache_path = None
+    try:
+        cache_path = os.path.join(cache_dir, f"{get_environment_fingerprint()}.txt")
+        if os.path.exists(cache_path):
+            with open(cache_path, "r", encoding="utf-8") as f:
+                return f.read(), True
+    except OSError:
+        traceback.print_exc()
+    try:
+        pip_freeze = subprocess.check_output([sys.executable, '-m', 'pip', 'freeze']).decode('utf-8')
+    except:
+        traceback.print_exc()
+        return "Unable to get pip freeze output", False
+    if cache_path is not None:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            temp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                f.write(pip_freeze)
+            os.replace(temp_path, cache_path)
+        except OSError:
+            traceback.print_exc()
+    return pip_freeze, False
+
+
+def collect_machine_stats():
+    """
+        Returns (machine_stats, timings), timings holding how long each probe took in seconds.
+    """
+    timings = {}
+
+    start = time.perf_counter()
+    with span("comfy_process_lookup", "machine_stats"):
+        get_comfy_process()
+    timings["comfy_process_lookup"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with span("gpu_query", "machine_stats"):
+        gpu_name = get_gpu_name()
+    timings["gpu_query"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with span("pip_freeze", "machine_stats") as trace_args:
+        pip_freeze, cached = get_pip_freeze()
+        trace_args["cached"] = cached
+    timings["pip_freeze"] = time.perf_counter() - start
+    timings["pip_freeze_cached"] = cached
+
+    start = time.perf_counter()
+    # https://github.com/Comfy-Org/registry-backend/blob/main/openapi.yml#L2037
+    machine_stats = {
+        "machine_name": platform.node(),
+        "os_version": f"{platform.system()} {platform.release()}",
+        "gpu_type": gpu_name,
+        "cpu_capacity": f"{psutil.cpu_count()} cores",
+        "initial_cpu": f"{psutil.cpu_count() - psutil.cpu_count(logical=False)} cores available",
+        "memory_capacity": f"{psutil.virtual_memory().total / (1024 ** 3):.2f} GB",
+        "initial_ram": f"{psutil.virtual_memory().available / (1024 ** 3):.2f} GB available",
+        "vram_time_series": {},
+        "disk_capacity": f"{psutil.disk_usage('/').total / (1024 ** 3):.2f} GB",
+        "initial_disk": f"{psutil.disk_usage('/').free / (1024 ** 3):.2f} GB available",
+        "pip_freeze": pip_freeze
+    }
+    timings["system_info"] = time.perf_counter() - start
+    return machine_stats, timings
+
+
+class MachineStatsCollector:
+    """
+        Collects the machine stats on a background thread, so importing this module or starting a run doesn't wait on
+        process scans, nvidia-smi or pip. get() blocks until the collection finished.
+    """
+
+    def __init__(self):
+        self.machine_stats = None
+        self.timings = {}
+        self.thread = threading.Thread(target=self._collect, name="machine-stats", daemon=True)
+        self.thread.start()
+
+    def _collect(self):
+        start = time.perf_counter()
+        try:
+            with span("collect_machine_stats", "machine_stats"):
+                self.machine_stats, self.timings = collect_machine_stats()
+        except Exception:
+            traceback.print_exc()
+            self.machine_stats = {}
+        self.timings["total"] = time.perf_counter() - start
+        print(f"Collected machine stats in {self.timings['total']:.2f}s: " + ", ".join(
+            f"{name} {value:.2f}s" if isinstance(value, float) else f"{name} {value}" for name, value in self.timings.items() if name != "total"
+        ))
+
+    def get(self):
+        self.thread.join()
+        return self.machine_stats
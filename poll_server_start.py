@@ -1,31 +1,170 @@
+import argparse, json, os, re, sys, threading, time
+import psutil
 import requests
-import time
-import sys
 
-def is_successful():
+# Log lines ComfyUI prints at each startup stage, in the order they appear
+STARTUP_MILESTONES = [
+    ("imports_done", re.compile(r"^(Total VRAM|pytorch version:|Device:)")),
+    ("custom_nodes_loaded", re.compile(r"^(Import times for custom nodes:|Starting server)")),
+    ("http_listening", re.compile(r"^To see the GUI go to:")),
+]
+LOG_POLL_INTERVAL = 0.05
+
+
+def is_successful(session, url, request_timeout):
     try:
-        response = requests.get("http://localhost:8188/queue")
+        response = session.get(f"{url}/queue", timeout=request_timeout)
         if response.status_code == 200:
             return True
-    except requests.exceptions.ConnectionError:
-        print("Not started yet")
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
         return False
     return False
 
-def main():
-    start_time = time.time()
+
+def get_process_spawn_time(pid, create_time):
+    """
+        psutil derives create_time from the whole-second boot time on Linux, so use the process age against
+        /proc/uptime there instead to keep the spawn time accurate to a clock tick.
+    """
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime", "r") as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - (uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError, AttributeError):
+        return create_time
+
+
+def get_server_spawn_time(port):
+    """
+        Creation time of the ComfyUI process, found by its main.py command line (and the port, if several are running).
+    """
+    candidates = []
+    for process in psutil.process_iter(['cmdline', 'create_time']):
+        cmdline = ' '.join(process.info['cmdline'] or [])
+        if 'main.py' in cmdline and 'poll_server_start' not in cmdline:
+            candidates.append((f"--port {port}" in cmdline or f"--port={port}" in cmdline, process.info['create_time'], process.pid))
+    if not candidates:
+        return None
+    # Prefer an exact port match, then the most recently started server
+    _, create_time, pid = max(candidates)
+    return get_process_spawn_time(pid, create_time)
+
+
+class LogFollower:
+    """
+        Follows the server log from its beginning and records when each startup milestone line shows up.
+    """
+
+    def __init__(self, log_file):
+        self.log_file = log_file
+        self.milestones = {}
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._follow, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+
+    def _match(self, line):
+        for name, pattern in STARTUP_MILESTONES:
+            if name not in self.milestones and pattern.search(line.strip()):
+                self.milestones[name] = time.time()
+
+    def _follow(self):
+        while not os.path.exists(self.log_file):
+            if self.stop_event.wait(LOG_POLL_INTERVAL):
+                return
+        with open(self.log_file, "r", encoding="utf-8", errors="replace") as log:
+            pending = ""
+            while True:
+                chunk = log.read()
+                if chunk:
+                    lines = (pending + chunk).split("\n")
+                    pending = lines.pop()
+                    for line in lines:
+                        self._match(line)
+                elif self.stop_event.is_set():
+                    break
+                else:
+                    time.sleep(LOG_POLL_INTERVAL)
+            self._match(pending)
+
+
+def build_profile(spawn_time, poll_start, ready_time, milestones, attempts):
+    origin = spawn_time or poll_start
+    profile = {
+        "spawn_time": spawn_time,
+        "spawn_time_source": "process" if spawn_time else "poller_start",
+        "poll_start_time": poll_start,
+        "probe_attempts": attempts,
+        "milestones": {name: round(timestamp - origin, 3) for name, timestamp in milestones.items()},
+        "ready": round(ready_time - origin, 3) if ready_time else None,
+        "phases": {},
+    }
+    previous_name, previous_time = "spawn", origin
+    for name, _ in STARTUP_MILESTONES:
+        if name in milestones:
+            profile["phases"][f"{previous_name}_to_{name}"] = round(milestones[name] - previous_time, 3)
+            previous_name, previous_time = name, milestones[name]
+    if ready_time:
+        profile["phases"][f"{previous_name}_to_ready"] = round(ready_time - previous_time, 3)
+    return profile
+
+
+def main(args):
+    poll_start = time.time()
     print("Polling server start...")
+    follower = None
+    if args.log_file:
+        follower = LogFollower(args.log_file)
+        follower.start()
+
+    session = requests.Session()
+    delay = args.initial_delay
+    attempts = 0
+    ready_time = None
     while True:
-        success = is_successful()
-        if success:
-            print("Server started.")
+        attempts += 1
+        if is_successful(session, args.url, args.request_timeout):
+            ready_time = time.time()
+            print(f"Server started after {ready_time - poll_start:.2f}s ({attempts} attempts).")
             break
 
-        if time.time() - start_time > 60:
+        if time.time() - poll_start > args.timeout:
             print("Error: Server did start within timeout.")
-            sys.exit(1)
-        print("Server not started yet. Waiting...")
-        time.sleep(5)
+            break
+        time.sleep(delay)
+        delay = min(delay * 1.5, args.max_delay)
+
+    if follower is not None:
+        # Give the log a moment to catch up with the listening line
+        time.sleep(LOG_POLL_INTERVAL * 2)
+        follower.stop()
+    port = re.search(r":(\d+)", args.url.split("//", 1)[-1])
+    spawn_time = get_server_spawn_time(port.group(1) if port else "8188")
+    profile = build_profile(spawn_time, poll_start, ready_time, follower.milestones if follower else {}, attempts)
+    print("#### Startup profile ####")
+    print(json.dumps(profile, indent=2))
+    if args.profile_output:
+        with open(args.profile_output, "w", encoding="utf-8") as f:
+            json.dump(profile, f, indent=2)
+
+    if ready_time is None:
+        sys.exit(1)
+
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Wait for the ComfyUI server to accept requests and report how long its startup took.")
+    parser.add_argument("--url", type=str, default="http://localhost:8188", help="Base URL of the ComfyUI server.")
+    parser.add_argument("--timeout", type=float, default=60, help="Seconds to wait for the server before failing.")
+    parser.add_argument("--request-timeout", type=float, default=2, help="Timeout of each readiness request in seconds.")
+    parser.add_argument("--initial-delay", type=float, default=0.05, help="First delay between readiness requests, it grows by 1.5x per attempt.")
+    parser.add_argument("--max-delay", type=float, default=1.0, help="Longest delay between readiness requests.")
+    parser.add_argument("--log-file", type=str, default=None, help="Server log to follow for startup milestones.")
+    parser.add_argument("--profile-output", type=str, default=None, help="Where to write the JSON startup profile.")
+    main(parser.parse_args())
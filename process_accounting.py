@@ -0,0 +1,172 @@
+import sys, time
+import psutil
+
+# Children are looked up again every this many samples, in between only the known processes are read
+CHILDREN_REFRESH_SAMPLES = 4
+
+
+def read_counters(process):
+    """
+        CPU times and I/O counters of a single process. I/O counters are None where psutil can't read them (macOS).
+    """
+    with process.oneshot():
+        cpu_times = process.cpu_times()
+        try:
+            io = process.io_counters()
+        except (AttributeError, psutil.AccessDenied, NotImplementedError):
+            io = None
+        rss = process.memory_info().rss
+    return {
+        # Includes children the process already waited for (always zero outside Linux)
+        "cpu_user": cpu_times.user + getattr(cpu_times, "children_user", 0),
+        "cpu_system": cpu_times.system + getattr(cpu_times, "children_system", 0),
+        "read_bytes": io.read_bytes if io else None,
+        "write_bytes": io.write_bytes if io else None,
+        "read_count": io.read_count if io else None,
+        "write_count": io.write_count if io else None,
+        "rss": rss,
+    }
+
+
+def read_uss(processes):
+    """
+        Summed unique set size of processes, None if it can't be read. Needs a full memory map walk, so it is only
+        taken at the start and end of a workflow.
+    """
+    total = 0
+    for process in processes:
+        try:
+            total += process.memory_full_info().uss
+        except psutil.NoSuchProcess:
+            continue
+        except (psutil.AccessDenied, AttributeError):
+            return None
+    return total
+
+
+class ProcessTreeAccounting:
+    """
+        Resource usage of the ComfyUI server and all of its child processes over one workflow: CPU time and I/O as
+        deltas between start() and finish(), RSS and USS at both ends plus the peak tree RSS seen by sample().
+        Processes are keyed by (pid, create time). On Linux an exited child's CPU time and I/O are added to its parent
+        when it is reaped, so only the processes still alive at finish() are counted there; elsewhere an exited child
+        keeps the counters it was last sampled with.
+    """
+
+    def __init__(self, process):
+        self.process = process
+        self.baseline = {}
+        self.latest = {}
+        self.children = []
+        self.samples = 0
+        self.peak_rss = 0
+        self.start_rss = None
+        self.end_rss = None
+        self.start_uss = None
+        self.end_uss = None
+        self.start_time = None
+        self.end_time = None
+        self.last_cpu_seconds = None
+        self.last_sample_time = None
+
+    def _cpu_seconds(self):
+        return sum(counters["cpu_user"] + counters["cpu_system"] for counters in self.latest.values())
+
+    def _tree(self, refresh_children):
+        if refresh_children:
+            try:
+                self.children = self.process.children(recursive=True)
+            except psutil.NoSuchProcess:
+                self.children = []
+        return [self.process] + self.children
+
+    def _read(self, refresh_children=True):
+        rss = 0
+        for process in self._tree(refresh_children):
+            try:
+                key = (process.pid, process.create_time())
+                counters = read_counters(process)
+            except (psutil.NoSuchProcess, psutil.ZombieProcess):
+                continue
+            except psutil.AccessDenied:
+                continue
+            self.latest[key] = counters
+            rss += counters["rss"]
+        self.peak_rss = max(self.peak_rss, rss)
+        return rss
+
+    def start(self):
+        if self.process is None:
+            return
+        self.start_time = time.monotonic()
+        self.start_rss = self._read()
+        # Processes already running count from here, ones started later from zero
+        self.baseline = {key: dict(counters) for key, counters in self.latest.items()}
+        self.last_cpu_seconds = self._cpu_seconds()
+        self.last_sample_time = self.start_time
+        self.start_uss = read_uss(self._tree(False))
+
+    def sample(self):
+        """
+            Reads the tree again, returns its CPU utilization since the previous sample in percent of one core (None
+            without a process).
+        """
+        if self.process is None or self.start_time is None:
+            return None
+        self.samples += 1
+        self._read(self.samples % CHILDREN_REFRESH_SAMPLES == 0)
+        now = time.monotonic()
+        cpu_seconds = self._cpu_seconds()
+        elapsed = now - self.last_sample_time
+        utilization = max(cpu_seconds - self.last_cpu_seconds, 0) / elapsed * 100 if elapsed > 0 else 0.0
+        self.last_cpu_seconds = cpu_seconds
+        self.last_sample_time = now
+        return utilization
+
+    def finish(self):
+        if self.process is None or self.start_time is None:
+            return
+        self.end_time = time.monotonic()
+        self.end_rss = self._read()
+        if sys.platform.startswith("linux"):
+            alive = set()
+            for process in self._tree(False):
+                try:
+                    alive.add((process.pid, process.create_time()))
+                except psutil.NoSuchProcess:
+                    continue
+            self.latest = {key: counters for key, counters in self.latest.items() if key in alive}
+        self.end_uss = read_uss(self._tree(False))
+
+    def _delta(self, name):
+        total = 0
+        for key, counters in self.latest.items():
+            if counters[name] is None:
+                return None
+            baseline = self.baseline.get(key, {}).get(name) or 0
+            total += counters[name] - baseline
+        return total
+
+    def to_dict(self):
+        if self.start_time is None or self.end_time is None:
+            return None
+        cpu_user = self._delta("cpu_user")
+        cpu_system = self._delta("cpu_system")
+        wall = self.end_time - self.start_time
+        return {
+            "processes": len(self.latest),
+            "wall_seconds": round(wall, 3),
+            "cpu_user_seconds": round(cpu_user, 3),
+            "cpu_system_seconds": round(cpu_system, 3),
+            # Average number of cores kept busy by the server
+            "cpu_utilization": round((cpu_user + cpu_system) / wall, 3) if wall > 0 else None,
+            "read_bytes": self._delta("read_bytes"),
+            "write_bytes": self._delta("write_bytes"),
+            "read_count": self._delta("read_count"),
+            "write_count": self._delta("write_count"),
+            "start_rss": self.start_rss,
+            "end_rss": self.end_rss,
+            "peak_rss": self.peak_rss,
+            "start_uss": self.start_uss,
+            "end_uss": self.end_uss,
+        }
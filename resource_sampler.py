@@ -0,0 +1,186 @@
+import bisect, math
+from array import array
+
+SAMPLE_COLUMNS = ("vram", "gpu_usage", "cpu_ram", "cpu_usage")
+SUMMARY_QUANTILES = (0.5, 0.95, 0.99)
+
+
+class P2Quantile:
+    """
+        Streaming quantile estimate using the P-square algorithm (Jain & Chlamtac, 1985): five markers, O(1) per sample,
+        no stored observations. Exact while fewer than five samples have been seen.
+    """
+
+    def __init__(self, p):
+        self.p = p
+        self.count = 0
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, x):
+        self.count += 1
+        h = self.heights
+        if self.count <= 5:
+            bisect.insort(h, x)
+            return
+
+        n = self.positions
+        if x < h[0]:
+            h[0] = x
+            k = 0
+        elif x >= h[4]:
+            h[4] = x
+            k = 3
+        else:
+            k = bisect.bisect_right(h, x) - 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        for i in (1, 2, 3):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                parabolic = h[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (h[i + 1] - h[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - d) * (h[i] - h[i - 1]) / (n[i] - n[i - 1])
+                )
+                if h[i - 1] < parabolic < h[i + 1]:
+                    h[i] = parabolic
+                else:
+                    h[i] = h[i] + d * (h[i + d] - h[i]) / (n[i + d] - n[i])
+                n[i] += d
+
+    def value(self):
+        if self.count == 0:
+            return 0.0
+        if self.count <= 5:
+            # Nearest-rank on the few samples we have
+            return self.heights[max(0, math.ceil(self.p * self.count) - 1)]
+        return self.heights[2]
+
+
+class RunningStats:
+    def __init__(self, quantiles=SUMMARY_QUANTILES):
+        self.count = 0
+        self.mean = 0.0
+        self.max = 0.0
+        self.quantiles = {q: P2Quantile(q) for q in quantiles}
+
+    def add(self, x):
+        self.count += 1
+        self.mean += (x - self.mean) / self.count
+        self.max = x if self.count == 1 else max(self.max, x)
+        for estimator in self.quantiles.values():
+            estimator.add(x)
+
+    def summary(self):
+        summary = {"mean": self.mean, "max": self.max}
+        for q, estimator in self.quantiles.items():
+            summary[f"p{round(q * 100)}"] = estimator.value()
+        return summary
+
+
+class ResourceSamples:
+    """
+        Resource samples of one workflow run, stored as one typed array per column (VRAM MiB, GPU usage %, process RAM MiB,
+        CPU usage %) with mean/max/quantiles kept up to date as samples are added.
+    """
+
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self.timestamps = array("d")
+        self.columns = {name: array("d") for name in SAMPLE_COLUMNS}
+        self.stats = {name: RunningStats() for name in SAMPLE_COLUMNS}
+        self.phases = []
+        self.gpus = {}
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def append(self, timestamp, vram, gpu_usage, cpu_ram, cpu_usage):
+        self.timestamps.append(timestamp)
+        for name, value in zip(SAMPLE_COLUMNS, (vram, gpu_usage, cpu_ram, cpu_usage)):
+            self.columns[name].append(value)
+            self.stats[name].add(value)
+
+    def record_gpus(self, gpu_samples):
+        """
+            Keeps the peak memory and utilization of every GPU, not only the one the samples are taken from.
+        """
+        for gpu in gpu_samples:
+            stats = self.gpus.get(gpu.index)
+            if stats is None:
+                stats = self.gpus[gpu.index] = {"index": gpu.index, "name": gpu.name, "memory_total": gpu.memory_total, "memory_used": RunningStats(), "utilization": RunningStats()}
+            stats["memory_used"].add(gpu.memory_used)
+            stats["utilization"].add(gpu.utilization)
+
+    def gpu_summary(self):
+        return [
+            {
+                "index": stats["index"],
+                "name": stats["name"],
+                "memory_total": stats["memory_total"],
+                "peak_memory_used": stats["memory_used"].max,
+                "mean_memory_used": round(stats["memory_used"].mean, 1),
+                "peak_utilization": stats["utilization"].max,
+                "mean_utilization": round(stats["utilization"].mean, 1),
+            }
+            for stats in (self.gpus[index] for index in sorted(self.gpus))
+        ]
+
+    def mark(self, timestamp, phase):
+        """
+            Records that the run entered phase at timestamp (on the same clock as the samples).
+        """
+        self.phases.append((phase, timestamp))
+
+    def phase_summary(self):
+        """
+            Start offset, duration and peak VRAM/RAM of every marked phase, each lasting until the next mark or the last sample.
+        """
+        if not self.phases:
+            return []
+        origin = self.timestamps[0] if self.timestamps else self.phases[0][1]
+        end_of_run = self.timestamps[-1] if self.timestamps else self.phases[-1][1]
+        summary = []
+        for i, (phase, start) in enumerate(self.phases):
+            end = self.phases[i + 1][1] if i + 1 < len(self.phases) else max(end_of_run, start)
+            first = bisect.bisect_left(self.timestamps, start)
+            last = bisect.bisect_right(self.timestamps, end)
+            summary.append({
+                "phase": phase,
+                "start_seconds": round(start - origin, 3),
+                "duration_seconds": round(end - start, 3),
+                "peak_vram": max(self.columns["vram"][first:last], default=None),
+                "peak_cpu_ram": max(self.columns["cpu_ram"][first:last], default=None),
+            })
+        return summary
+
+    def summary(self):
+        return {name: self.stats[name].summary() for name in SAMPLE_COLUMNS}
+
+    def to_columns(self):
+        """
+            The samples as one numeric array per column plus their offsets in seconds from the first sample, for the
+            compact payload encoding.
+        """
+        origin = self.timestamps[0] if self.timestamps else 0.0
+        columns = {"offsets": [round(timestamp - origin, 3) for timestamp in self.timestamps]}
+        for name in SAMPLE_COLUMNS:
+            columns[name] = self.columns[name].tolist()
+        return {"interval": self.interval, "columns": columns}
+
+    def to_time_series(self):
+        """
+            The per-sample string mapping the registry API expects in machine_stats.vram_time_series.
+        """
+        vram, gpu_usage, cpu_ram, cpu_usage = (self.columns[name] for name in SAMPLE_COLUMNS)
+        return {
+            # Rounded, 0.1 * 3 would otherwise be "0.30000000000000004 seconds"
+            f"{round(i * self.interval, 3)} seconds": f"{vram[i]} MiB,{gpu_usage[i]:.1f},{cpu_ram[i]} MiB,{cpu_usage[i]:.2f}"
+            for i in range(len(self.timestamps))
+        }
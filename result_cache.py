@@ -0,0 +1,151 @@
+import hashlib, importlib.util, json, os, shutil, time
+from json_fingerprint import fingerprint
+from workflow_scheduler import get_workflow_models
+
+DEFAULT_RESULT_CACHE_DIR = os.path.expanduser("~/.cache/comfy-actions-runner/result-cache")
+MODELS_PREP_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "default-models-prep.py")
+ENTRY_FILE = "entry.json"
+# Run settings that change what a workflow produces, in addition to the workflow itself and its models
+FINGERPRINT_ARGS = ("commit_hash", "os", "python_version", "torch_version", "cuda_version", "comfy_run_flags")
+# Node inputs naming a file in ComfyUI's input directory, by node class
+INPUT_FILE_INPUTS = {"LoadImage": "image", "LoadImageMask": "image"}
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def load_model_hashes(script_path=MODELS_PREP_SCRIPT):
+    """
+        The sha256 of every model default-models-prep.py installs, keyed like its MODELS table.
+    """
+    spec = importlib.util.spec_from_file_location("default_models_prep", script_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return {model_name: model_info["hash"] for model_name, model_info in module.MODELS.items()}
+
+
+def get_workflow_input_files(workflow):
+    """
+        Files a workflow loads from ComfyUI's input directory, relative to it.
+    """
+    input_files = set()
+    for node in workflow.values():
+        input_name = INPUT_FILE_INPUTS.get(node.get("class_type"))
+        filename = node.get("inputs", {}).get(input_name) if input_name else None
+        if isinstance(filename, str):
+            # Annotated names like "sketch.png [input]" point at the same file
+            input_files.add(filename.removesuffix(" [input]"))
+    return input_files
+
+
+def hash_input_file(path):
+    hash_tracker = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            hash_tracker.update(chunk)
+    return hash_tracker.hexdigest()
+
+
+def workflow_fingerprint(workflow, args, model_hashes, models_dir=None, input_dir=None):
+    """
+        sha256 over the canonical workflow (without the UI-only _meta titles), the run settings in FINGERPRINT_ARGS,
+        the hashes of the models the workflow loads and of the input files (e.g. LoadImage images) it reads from
+        input_dir. Models missing from model_hashes are identified by size and mtime.
+    """
+    nodes = {node_id: {key: value for key, value in node.items() if key != "_meta"} for node_id, node in workflow.items()}
+    models = {}
+    for model in sorted(get_workflow_models(workflow)):
+        if model in model_hashes:
+            models[model] = model_hashes[model]
+            continue
+        try:
+            stat = os.stat(os.path.join(models_dir, model))
+            models[model] = f"stat:{stat.st_size}:{stat.st_mtime_ns}"
+        except (OSError, TypeError):
+            models[model] = "missing"
+    input_files = {}
+    for input_file in sorted(get_workflow_input_files(workflow)):
+        try:
+            input_files[input_file] = hash_input_file(os.path.join(input_dir, input_file))
+        except (OSError, TypeError):
+            input_files[input_file] = "missing"
+    fingerprint_input = {
+        "workflow": nodes,
+        "settings": {name: getattr(args, name, None) or "" for name in FINGERPRINT_ARGS},
+        "models": models,
+        "input_files": input_files,
+    }
+    return fingerprint(fingerprint_input)
+
+
+def link_or_copy(source, target):
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+class ResultCache:
+    """
+        Outputs and payload of earlier successful workflow runs, one directory per input fingerprint.
+        Only the max_entries most recently used entries are kept.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_RESULT_CACHE_DIR, max_entries=200, models_dir=None, input_dir=None):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.models_dir = models_dir
+        self.input_dir = input_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        try:
+            self.model_hashes = load_model_hashes()
+        except Exception as e:
+            print(f"Could not load the model hashes from {MODELS_PREP_SCRIPT} ({e}), models will be fingerprinted by size and mtime")
+            self.model_hashes = {}
+
+    def fingerprint(self, workflow, args):
+        return workflow_fingerprint(workflow, args, self.model_hashes, self.models_dir, self.input_dir)
+
+    def lookup(self, fingerprint):
+        """
+            Returns (payload, output paths) of a cached run, None if there is none or its outputs are gone.
+        """
+        entry_dir = os.path.join(self.cache_dir, fingerprint)
+        entry_path = os.path.join(entry_dir, ENTRY_FILE)
+        try:
+            with open(entry_path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        output_paths = [os.path.join(entry_dir, "outputs", filename) for filename in entry["outputs"]]
+        if not all(os.path.exists(path) for path in output_paths):
+            return None
+        # Marks the entry as recently used for pruning
+        os.utime(entry_path)
+        return entry["payload"], output_paths
+
+    def store(self, fingerprint, payload, output_paths):
+        entry_dir = os.path.join(self.cache_dir, fingerprint)
+        temp_dir = f"{entry_dir}.{os.getpid()}.tmp"
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        os.makedirs(os.path.join(temp_dir, "outputs"))
+        filenames = []
+        for i, output_path in enumerate(output_paths):
+            # Prefixed with the position, outputs of different subfolders can share a name
+            filename = f"{i:03}-{os.path.basename(output_path)}"
+            link_or_copy(output_path, os.path.join(temp_dir, "outputs", filename))
+            filenames.append(filename)
+        with open(os.path.join(temp_dir, ENTRY_FILE), "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": fingerprint, "stored_at": time.time(), "outputs": filenames, "payload": payload}, f)
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        os.replace(temp_dir, entry_dir)
+        self.prune()
+
+    def prune(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            entry_path = os.path.join(self.cache_dir, name, ENTRY_FILE)
+            try:
+                entries.append((os.path.getmtime(entry_path), name))
+            except OSError:
+                continue
+        for _, name in sorted(entries, reverse=True)[self.max_entries:]:
+            shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
@@ -0,0 +1,203 @@
+import argparse, datetime, json, os, sqlite3, sys, threading, time
+from benchmark import quantile
+
+DEFAULT_RESULTS_DB = os.path.expanduser("~/.cache/comfy-actions-runner/results.sqlite3")
+TREND_METRICS = ("duration", "peak_vram", "avg_vram")
+TREND_PERCENTILES = (0.5, 0.9, 0.99)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    recorded_at REAL NOT NULL,
+    run_id TEXT,
+    job_id TEXT,
+    workflow_name TEXT,
+    commit_hash TEXT,
+    commit_time TEXT,
+    commit_epoch REAL,
+    branch_name TEXT,
+    os TEXT,
+    python_version TEXT,
+    torch_version TEXT,
+    cuda_version TEXT,
+    gpu_type TEXT,
+    status TEXT,
+    start_time INTEGER,
+    end_time INTEGER,
+    duration REAL,
+    avg_vram REAL,
+    peak_vram REAL,
+    cached INTEGER,
+    payload TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_by_combination ON runs (workflow_name, os, torch_version, cuda_version, commit_epoch);
+CREATE INDEX IF NOT EXISTS runs_by_commit ON runs (commit_hash);
+"""
+# Columns added after the first release, added to databases created before them
+ADDED_COLUMNS = {"gpu_type": "TEXT", "cached": "INTEGER"}
+# Runs whose result was reused from an earlier run, their metrics are that run's and would be counted twice
+NOT_CACHED = "(cached IS NULL OR cached = 0)"
+
+
+def parse_commit_time(commit_time, fallback):
+    try:
+        return datetime.datetime.fromisoformat(commit_time).timestamp()
+    except (TypeError, ValueError):
+        return fallback
+
+
+class ResultsStore:
+    """
+        Every run payload in a local SQLite database, so trends can be looked at on the runner without the registry.
+        Safe to share between threads.
+    """
+
+    def __init__(self, path=DEFAULT_RESULTS_DB):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        columns = {row[1] for row in self.connection.execute("PRAGMA table_info(runs)")}
+        if columns:
+            for column, column_type in ADDED_COLUMNS.items():
+                if column not in columns:
+                    self.connection.execute(f"ALTER TABLE runs ADD COLUMN {column} {column_type}")
+        self.connection.executescript(SCHEMA)
+
+    def record(self, payload):
+        start_time = payload.get("start_time") or 0
+        end_time = payload.get("end_time") or 0
+        row = (
+            time.time(), payload.get("run_id"), payload.get("job_id"), payload.get("workflow_name"), payload.get("commit_hash"),
+            payload.get("commit_time"), parse_commit_time(payload.get("commit_time"), start_time), payload.get("branch_name"),
+            payload.get("os"), payload.get("python_version"), payload.get("pytorch_version"), payload.get("cuda_version"),
+            (payload.get("machine_stats") or {}).get("gpu_type"), payload.get("status"), start_time, end_time, end_time - start_time if start_time and end_time else None,
+            payload.get("avg_vram"), payload.get("peak_vram"), 1 if payload.get("result_cache") else 0, json.dumps(payload),
+        )
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT INTO runs (recorded_at, run_id, job_id, workflow_name, commit_hash, commit_time, commit_epoch, branch_name, os, python_version,"
+                " torch_version, cuda_version, gpu_type, status, start_time, end_time, duration, avg_vram, peak_vram, cached, payload)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                row,
+            )
+
+    def durations(self, workflow_name, os_name, gpu_type, status="WorkflowRunStatusCompleted", limit=50):
+        """
+            Durations of the most recent runs of a workflow on this OS and GPU model that actually ran, newest first.
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT duration FROM runs WHERE workflow_name = ? AND os = ? AND gpu_type IS ? AND status = ? AND duration IS NOT NULL AND {NOT_CACHED}"
+                " ORDER BY recorded_at DESC LIMIT ?",
+                (workflow_name, os_name, gpu_type, status, limit),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def _commit_epoch(self, commit_hash):
+        # Abbreviated hashes work too
+        row = self.connection.execute("SELECT MIN(commit_epoch) FROM runs WHERE commit_hash LIKE ?", (f"{commit_hash}%",)).fetchone()
+        if row[0] is None:
+            raise ValueError(f"No results stored for commit {commit_hash}")
+        return row[0]
+
+    def trend(self, workflow_name, os_name=None, torch_version=None, cuda_version=None, from_commit=None, to_commit=None, last=None, status=None):
+        """
+            Per-commit medians and overall percentiles of the duration and VRAM of a workflow's runs that actually ran,
+            oldest commit first.
+        """
+        conditions = ["workflow_name = ?", NOT_CACHED]
+        parameters = [workflow_name]
+        for column, value in (("os", os_name), ("torch_version", torch_version), ("cuda_version", cuda_version), ("status", status)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                parameters.append(value)
+        with self.lock:
+            if from_commit is not None:
+                conditions.append("commit_epoch >= ?")
+                parameters.append(self._commit_epoch(from_commit))
+            if to_commit is not None:
+                conditions.append("commit_epoch <= ?")
+                parameters.append(self._commit_epoch(to_commit))
+            rows = self.connection.execute(
+                f"SELECT commit_hash, commit_time, commit_epoch, {', '.join(TREND_METRICS)} FROM runs WHERE {' AND '.join(conditions)} ORDER BY commit_epoch, id",
+                parameters,
+            ).fetchall()
+
+        commits = {}
+        for commit_hash, commit_time, commit_epoch, *metrics in rows:
+            commit = commits.setdefault(commit_hash, {"commit_hash": commit_hash, "commit_time": commit_time, "runs": 0, "values": {metric: [] for metric in TREND_METRICS}})
+            commit["runs"] += 1
+            for metric, value in zip(TREND_METRICS, metrics):
+                if value is not None:
+                    commit["values"][metric].append(value)
+        commits = list(commits.values())
+        if last is not None:
+            commits = commits[-last:]
+
+        trend = []
+        overall = {metric: [] for metric in TREND_METRICS}
+        for commit in commits:
+            entry = {"commit_hash": commit["commit_hash"], "commit_time": commit["commit_time"], "runs": commit["runs"]}
+            for metric, values in commit["values"].items():
+                entry[metric] = quantile(sorted(values), 0.5) if values else None
+                overall[metric].extend(values)
+            trend.append(entry)
+        percentiles = {
+            metric: {f"p{round(q * 100)}": quantile(sorted(values), q) for q in TREND_PERCENTILES} if values else None
+            for metric, values in overall.items()
+        }
+        return {"workflow_name": workflow_name, "commits": trend, "percentiles": percentiles}
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+def format_value(value):
+    return "-" if value is None else f"{value:.1f}"
+
+
+def main(args):
+    if not os.path.exists(args.db):
+        print(f"No results database at {args.db}")
+        sys.exit(1)
+    store = ResultsStore(args.db)
+    start = time.perf_counter()
+    try:
+        result = store.trend(args.workflow, args.os, args.torch_version, args.cuda_version, args.from_commit, args.to_commit, args.last, args.status)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+    finally:
+        store.close()
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    if args.json:
+        print(json.dumps({**result, "query_ms": round(elapsed_ms, 3)}, indent=2))
+        return
+    print(f"{'commit':<12} {'commit time':<26} {'runs':>4} {'duration s':>10} {'peak VRAM':>10} {'avg VRAM':>10}")
+    for commit in result["commits"]:
+        print(f"{(commit['commit_hash'] or '-')[:12]:<12} {(commit['commit_time'] or '-'):<26} {commit['runs']:>4} {format_value(commit['duration']):>10} {format_value(commit['peak_vram']):>10} {format_value(commit['avg_vram']):>10}")
+    for metric, percentiles in result["percentiles"].items():
+        if percentiles:
+            print(f"{metric}: " + ", ".join(f"{name} {value:.1f}" for name, value in percentiles.items()))
+    print(f"Query took {elapsed_ms:.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show the duration and VRAM trend of a workflow from the local results database.")
+    parser.add_argument("workflow", type=str, help="Workflow file name, e.g. sd15_default.json.")
+    parser.add_argument("--db", type=str, default=DEFAULT_RESULTS_DB, help="Results database written by action.py.")
+    parser.add_argument("--os", type=str, default=None, help="Only runs on this OS.")
+    parser.add_argument("--torch-version", type=str, default=None, help="Only runs with this torch version.")
+    parser.add_argument("--cuda-version", type=str, default=None, help="Only runs with this CUDA version.")
+    parser.add_argument("--status", type=str, default="WorkflowRunStatusCompleted", help="Only runs with this status, empty for all.")
+    parser.add_argument("--from-commit", type=str, default=None, help="Oldest commit of the range (hash or prefix).")
+    parser.add_argument("--to-commit", type=str, default=None, help="Newest commit of the range (hash or prefix).")
+    parser.add_argument("--last", type=int, default=None, help="Only the last N commits of the range.")
+    parser.add_argument("--json", action="store_true", help="Print the result as JSON.")
+    args = parser.parse_args()
+    args.status = args.status or None
+    main(args)
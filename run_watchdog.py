@@ -0,0 +1,82 @@
+import threading, time
+from benchmark import quantile
+
+# Fewer completed runs than this and the fixed timeout is used, a budget from a handful of runs would be noise
+BUDGET_MIN_RUNS = 5
+# Budgets never go below this, short workflows still need to load their models on a cold cache
+BUDGET_MIN_SECONDS = 60
+BUDGET_HISTORY_RUNS = 50
+
+
+def workflow_budget(durations, percentile, factor, max_seconds, min_runs=BUDGET_MIN_RUNS, min_seconds=BUDGET_MIN_SECONDS):
+    """
+        Time budget for a workflow from the durations of its earlier runs: the percentile times the safety factor,
+        kept between min_seconds and max_seconds. None when there are fewer than min_runs durations.
+    """
+    durations = sorted(duration for duration in durations if duration)
+    if len(durations) < min_runs:
+        return None
+    return min(max(quantile(durations, percentile) * factor, min_seconds), max_seconds)
+
+
+class RunWatchdog:
+    """
+        Aborts a workflow that overruns its time budget or shows neither GPU nor CPU activity for stall_window
+        seconds. check() is fed every resource sample; on the first violation on_abort is called once and the
+        abort event is set. A stall_window of 0 turns stall detection off. cpu_usage is the server process tree's
+        utilization in percent of one core; None (the server process is unknown) never counts as idle.
+    """
+
+    def __init__(self, budget, budget_source, stall_window, gpu_threshold, cpu_threshold, on_abort=None):
+        self.budget = budget
+        self.budget_source = budget_source
+        self.stall_window = stall_window
+        self.gpu_threshold = gpu_threshold
+        self.cpu_threshold = cpu_threshold
+        self.on_abort = on_abort
+        self.abort = threading.Event()
+        self.reason = None
+        self.start_time = time.monotonic()
+        self.idle_since = None
+        self.longest_idle = 0
+        self.aborted_after = None
+
+    def check(self, timestamp, gpu_usage, cpu_usage):
+        if self.abort.is_set():
+            return
+        if cpu_usage is not None and gpu_usage <= self.gpu_threshold and cpu_usage <= self.cpu_threshold:
+            if self.idle_since is None:
+                self.idle_since = timestamp
+            self.longest_idle = max(self.longest_idle, timestamp - self.idle_since)
+        else:
+            self.idle_since = None
+
+        if self.budget is not None and timestamp - self.start_time > self.budget:
+            self._trigger("budget_exceeded", timestamp)
+        elif self.stall_window and self.idle_since is not None and timestamp - self.idle_since >= self.stall_window:
+            self._trigger("stalled", timestamp)
+
+    def _trigger(self, reason, timestamp):
+        self.reason = reason
+        self.aborted_after = timestamp - self.start_time
+        if reason == "stalled":
+            print(f"No GPU or CPU activity for {timestamp - self.idle_since:.0f}s, aborting the workflow")
+        else:
+            print(f"Workflow exceeded its {self.budget:.0f}s time budget ({self.budget_source}), aborting it")
+        self.abort.set()
+        if self.on_abort is not None:
+            try:
+                self.on_abort()
+            except Exception as e:
+                # The abort event still stops the run on the harness side
+                print(f"Could not interrupt the server ({e})")
+
+    def to_dict(self):
+        return {
+            "budget_seconds": round(self.budget, 1) if self.budget is not None else None,
+            "budget_source": self.budget_source,
+            "stall_window_seconds": self.stall_window,
+            "longest_idle_seconds": round(self.longest_idle, 1),
+            "abort_reason": self.reason,
+            "aborted_after_seconds": round(self.aborted_after, 1) if self.aborted_after is not None else None,
+        }
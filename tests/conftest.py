@@ -0,0 +1,281 @@
+import base64, hashlib, json, struct, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+def websocket_frame(text):
+    # Server frames are not masked
+    data = text.encode("utf-8")
+    if len(data) < 126:
+        return bytes([0x81, len(data)]) + data
+    return bytes([0x81, 126]) + struct.pack("!H", len(data)) + data
+
+
+class StubComfyServer:
+    """
+        Local stand-in for a ComfyUI server: /prompt, /history/<prompt_id>, /queue, /interrupt, /free and, unless
+        websocket is False, /ws. A prompt finishes run_seconds after it was queued with one output image, or fails when
+        one of its nodes has the class_type "Fail". Clients connected to /ws get its execution events, one node after
+        the other.
+    """
+
+    def __init__(self, run_seconds=0.2, websocket=True):
+        self.run_seconds = run_seconds
+        self.websocket = websocket
+        self.prompts = {}
+        self.posts = []
+        self.sockets = {}
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def send_json(self, status_code, data):
+                body = json.dumps(data).encode("utf-8")
+                self.send_response(status_code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                data = json.loads(self.rfile.read(length) or b"null")
+                server.posts.append((self.path, data))
+                if self.path == "/prompt":
+                    self.send_json(200, {"prompt_id": server.queue(data["prompt"], data.get("client_id")), "number": 0, "node_errors": {}})
+                elif self.path in ("/interrupt", "/free"):
+                    self.send_json(200, {})
+                else:
+                    self.send_json(404, {})
+
+            def do_GET(self):
+                if self.path.startswith("/history/"):
+                    self.send_json(200, server.history(self.path.rsplit("/", 1)[1]))
+                elif self.path == "/queue":
+                    self.send_json(200, {"queue_running": [], "queue_pending": []})
+                elif self.path.startswith("/ws") and server.websocket:
+                    self.serve_websocket()
+                else:
+                    self.send_json(404, {})
+
+            def serve_websocket(self):
+                client_id = self.path.partition("clientId=")[2]
+                accept = base64.b64encode(hashlib.sha1((self.headers["Sec-WebSocket-Key"] + WEBSOCKET_GUID).encode()).digest()).decode()
+                self.send_response(101)
+                self.send_header("Upgrade", "websocket")
+                self.send_header("Connection", "Upgrade")
+                self.send_header("Sec-WebSocket-Accept", accept)
+                self.end_headers()
+                self.wfile.flush()
+                send_lock = threading.Lock()
+
+                def send(text):
+                    with send_lock:
+                        self.wfile.write(websocket_frame(text))
+                        self.wfile.flush()
+
+                with server.lock:
+                    server.sockets[client_id] = send
+                # Held open until the client sends its close frame or goes away
+                while (data := self.connection.recv(1024)) and data[0] & 0x0F != 0x8:
+                    pass
+                with server.lock:
+                    server.sockets.pop(client_id, None)
+                if data:
+                    with send_lock:
+                        self.wfile.write(b"\x88\x00")
+                self.close_connection = True
+
+        return Handler
+
+    def queue(self, workflow, client_id=None):
+        with self.lock:
+            prompt_id = f"prompt-{len(self.prompts)}"
+            self.prompts[prompt_id] = (time.monotonic(), workflow)
+            send = self.sockets.get(client_id)
+        if send is not None:
+            threading.Thread(target=self._send_events, args=(send, prompt_id, workflow), daemon=True).start()
+        return prompt_id
+
+    def _send_events(self, send, prompt_id, workflow):
+        try:
+            send(json.dumps({"type": "execution_start", "data": {"prompt_id": prompt_id, "timestamp": time.time() * 1000}}))
+            for node_id, node in workflow.items():
+                send(json.dumps({"type": "executing", "data": {"node": node_id, "prompt_id": prompt_id}}))
+                if node.get("class_type") == "Fail":
+                    send(json.dumps({"type": "execution_error", "data": {
+                        "prompt_id": prompt_id, "node_id": node_id, "node_type": "Fail", "exception_type": "RuntimeError", "exception_message": "stub failure",
+                    }}))
+                    return
+                time.sleep(self.run_seconds / len(workflow))
+            send(json.dumps({"type": "executing", "data": {"node": None, "prompt_id": prompt_id}}))
+        except OSError:
+            # The client went away
+            pass
+
+    def history(self, prompt_id):
+        if prompt_id not in self.prompts:
+            return {}
+        queued_at, workflow = self.prompts[prompt_id]
+        if time.monotonic() - queued_at < self.run_seconds:
+            return {}
+        started = {"prompt_id": prompt_id, "timestamp": (time.time() - self.run_seconds) * 1000}
+        if any(node.get("class_type") == "Fail" for node in workflow.values()):
+            status = {"status_str": "error", "completed": False, "messages": [["execution_start", started], ["execution_error", {"prompt_id": prompt_id}]]}
+            return {prompt_id: {"outputs": {}, "status": status}}
+        outputs = {"9": {"images": [
+            {"filename": f"{prompt_id}.png", "subfolder": "", "type": "output"},
+            {"filename": f"{prompt_id}-preview.png", "subfolder": "", "type": "temp"},
+        ]}}
+        messages = [["execution_start", started], ["execution_success", {"prompt_id": prompt_id, "timestamp": time.time() * 1000}]]
+        return {prompt_id: {"outputs": outputs, "status": {"status_str": "success", "completed": True, "messages": messages}}}
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class StubFileServer:
+    """
+        Local stand-in for a model host serving data at every path, with Range requests (206, 416 past the end).
+        Responses for a range starting at one of cut_at's offsets stop after cut_at[offset] bytes, like a dropped
+        connection. Every Range header received is kept in ranges.
+    """
+
+    def __init__(self, data=b""):
+        self.data = data
+        self.cut_at = {}
+        self.ranges = []
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/model.safetensors"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                data = server.data
+                range_header = self.headers.get("Range")
+                server.ranges.append(range_header)
+                if range_header is None:
+                    start, end = 0, len(data) - 1
+                    self.send_response(200)
+                else:
+                    first, _, last = range_header[len("bytes="):].partition("-")
+                    start, end = int(first), min(int(last) if last else len(data) - 1, len(data) - 1)
+                    if start >= len(data):
+                        self.send_response(416)
+                        self.send_header("Content-Range", f"bytes */{len(data)}")
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+                self.send_header("Accept-Ranges", "bytes")
+                self.send_header("Content-Length", str(end + 1 - start))
+                self.end_headers()
+                body = data[start:end + 1]
+                if range_header is not None and start in server.cut_at:
+                    body = body[:server.cut_at[start]]
+                self.wfile.write(body)
+                self.close_connection = True
+
+        return Handler
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class StubApiEndpoint:
+    """
+        Local stand-in for the registry API: answers POSTs with the status codes in statuses, in order, then 200.
+        The decoded body of every request is kept in requests.
+    """
+
+    def __init__(self, statuses=()):
+        self.statuses = list(statuses)
+        self.requests = []
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/upload-artifact"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                server.requests.append(json.loads(self.rfile.read(length)))
+                status_code = server.statuses.pop(0) if server.statuses else 200
+                body = json.dumps({"status_code": status_code}).encode("utf-8")
+                self.send_response(status_code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def stub_api():
+    server = StubApiEndpoint()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def stub_file_server():
+    server = StubFileServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def stub_server():
+    server = StubComfyServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def stub_server_without_websocket():
+    server = StubComfyServer(websocket=False)
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def stub_servers():
+    servers = [StubComfyServer() for _ in range(3)]
+    yield servers
+    for server in servers:
+        server.close()
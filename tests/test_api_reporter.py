@@ -0,0 +1,84 @@
+import json, os, threading
+import pytest
+from api_reporter import PayloadReporter
+
+
+@pytest.fixture
+def spool_path(tmp_path, monkeypatch):
+    # Responses are appended to ./application.log
+    monkeypatch.chdir(tmp_path)
+    return str(tmp_path / "payload-spool.jsonl")
+
+
+def read_records(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_retryable_status_is_retried_until_accepted(stub_api, spool_path):
+    stub_api.statuses = [503]
+    reporter = PayloadReporter(stub_api.url, spool_path=spool_path, base_delay=0.01)
+    payload_id = reporter.submit({"workflow_name": "sd15.json", "run_id": "1"})
+    results = reporter.close()
+    assert results == {payload_id: 200}
+    assert stub_api.requests == [{"workflow_name": "sd15.json", "run_id": "1"}] * 2
+    # Everything was delivered, compacting leaves no spool and nothing was rejected
+    assert not os.path.exists(spool_path)
+    assert not os.path.exists(reporter.dead_letter_path)
+
+
+def test_rejected_payload_goes_to_the_dead_letter_file(stub_api, spool_path):
+    stub_api.statuses = [400]
+    reporter = PayloadReporter(stub_api.url, spool_path=spool_path, base_delay=0.01)
+    payload_id = reporter.submit({"workflow_name": "sd15.json"})
+    assert reporter.close() == {payload_id: 400}
+    assert len(stub_api.requests) == 1
+    [record] = read_records(reporter.dead_letter_path)
+    assert record["id"] == payload_id and record["status_code"] == 400
+    assert record["payload"] == {"workflow_name": "sd15.json"}
+    assert not os.path.exists(spool_path)
+
+
+def test_payload_stays_spooled_when_the_api_stays_down(stub_api, spool_path):
+    stub_api.statuses = [503, 503]
+    reporter = PayloadReporter(stub_api.url, spool_path=spool_path, max_attempts=2, base_delay=0.01)
+    payload_id = reporter.submit({"workflow_name": "sd15.json"})
+    assert reporter.close() == {payload_id: None}
+    assert read_records(spool_path) == [{"type": "payload", "id": payload_id, "payload": {"workflow_name": "sd15.json"}}]
+
+
+def test_leftover_spool_is_replayed_by_the_next_reporter(stub_api, spool_path):
+    with open(spool_path, "w", encoding="utf-8") as spool:
+        for record in (
+            {"type": "payload", "id": "delivered", "payload": {"workflow_name": "a.json"}},
+            {"type": "payload", "id": "left-over", "payload": {"workflow_name": "b.json"}},
+            {"type": "done", "id": "delivered", "status_code": 200},
+        ):
+            spool.write(json.dumps(record) + "\n")
+        # Truncated by a job killed mid-write
+        spool.write('{"type": "payload", "id": "trunc')
+    reporter = PayloadReporter(stub_api.url, spool_path=spool_path, base_delay=0.01)
+    assert reporter.replay_spool() == 1
+    assert reporter.close() == {"left-over": 200}
+    assert stub_api.requests == [{"workflow_name": "b.json"}]
+    assert not os.path.exists(spool_path)
+
+
+def test_compacting_never_drops_payloads_another_reporter_appends(stub_api, spool_path):
+    stub_api.statuses = [503] * 200
+    writer = PayloadReporter(stub_api.url, spool_path=spool_path, max_attempts=1)
+    compactor = PayloadReporter(stub_api.url, spool_path=spool_path, max_attempts=1)
+    stop = threading.Event()
+
+    def compact():
+        while not stop.is_set():
+            compactor._compact_spool()
+
+    thread = threading.Thread(target=compact)
+    thread.start()
+    payload_ids = {writer.submit({"workflow_name": f"{i}.json"}) for i in range(100)}
+    stop.set()
+    thread.join()
+    writer.close()
+    compactor.close()
+    assert {record["id"] for record in read_records(spool_path)} == payload_ids
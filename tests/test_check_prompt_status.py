@@ -0,0 +1,68 @@
+import threading
+import pytest
+from check_prompt_status import ComfyApiClient, NodeExecutionProfile, PromptExecutionError, get_output_filenames
+
+WORKFLOW = {
+    "1": {"class_type": "CheckpointLoaderSimple", "inputs": {}},
+    "2": {"class_type": "KSampler", "inputs": {}},
+    "9": {"class_type": "SaveImage", "inputs": {}},
+}
+
+
+def run_prompt(server_url, workflow, abort=None):
+    client = ComfyApiClient(server_url)
+    try:
+        profile = NodeExecutionProfile(workflow)
+        prompt_id = client.queue_prompt(workflow)
+        return client.ws, prompt_id, client.wait_for_prompt(prompt_id, 10, profile, abort), profile
+    finally:
+        client.close()
+
+
+def test_websocket_path_records_every_node(stub_server):
+    ws, prompt_id, history_entry, profile = run_prompt(stub_server.url, WORKFLOW)
+    assert ws is not None
+    # The final "executing" event ends the wait, the history is read only to return the outputs
+    assert get_output_filenames(history_entry) == [f"{prompt_id}.png"]
+    report = profile.to_dict()
+    assert [node["node_id"] for node in report["nodes"]] == ["1", "2", "9"]
+    assert report["nodes"][1]["class_type"] == "KSampler"
+    assert report["execution_ms"] > 0
+
+
+def test_websocket_path_reports_the_failing_node(stub_server):
+    with pytest.raises(PromptExecutionError, match="Node 2 \\(Fail\\) failed"):
+        run_prompt(stub_server.url, {**WORKFLOW, "2": {"class_type": "Fail", "inputs": {}}})
+
+
+def test_history_polling_without_websocket(stub_server_without_websocket):
+    ws, prompt_id, history_entry, profile = run_prompt(stub_server_without_websocket.url, WORKFLOW)
+    assert ws is None
+    assert history_entry["status"]["completed"]
+    assert get_output_filenames(history_entry) == [f"{prompt_id}.png"]
+    # Only the overall execution time is known from the history
+    report = profile.to_dict()
+    assert report["nodes"] == []
+    assert report["execution_ms"] > 0
+
+
+def test_history_polling_reports_a_failed_prompt(stub_server_without_websocket):
+    with pytest.raises(PromptExecutionError, match="failed"):
+        run_prompt(stub_server_without_websocket.url, {**WORKFLOW, "2": {"class_type": "Fail", "inputs": {}}})
+
+
+def test_abort_stops_the_wait(stub_server):
+    abort = threading.Event()
+    abort.set()
+    with pytest.raises(PromptExecutionError, match="aborted"):
+        run_prompt(stub_server.url, WORKFLOW, abort)
+
+
+def test_interrupt_and_free(stub_server):
+    client = ComfyApiClient(stub_server.url)
+    try:
+        client.interrupt()
+        client.free(unload_models=True)
+    finally:
+        client.close()
+    assert stub_server.posts == [("/interrupt", {}), ("/free", {"free_memory": True, "unload_models": True})]
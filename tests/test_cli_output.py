@@ -0,0 +1,66 @@
+import io
+from cli_output import CliOutputReader, parse_output_line, split_lines
+
+
+class ChunkedStream:
+    """
+        Hands out the given chunks one read at a time, like a pipe.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+
+    def read1(self, size):
+        return self.chunks.pop(0) if self.chunks else b""
+
+
+def lines_of(chunks):
+    lines = []
+    split_lines(ChunkedStream(chunks), lambda line, redraw: lines.append((line, redraw)))
+    return lines
+
+
+def test_crlf_split_across_chunks_is_one_line_ending():
+    assert lines_of([b"first\r", b"\nsecond\r", b"\n", b"third"]) == [("first", False), ("second", False), ("third", False)]
+
+
+def test_progress_redraws_are_reported_as_redraws():
+    chunks = [b"Executing\n", b" 10%|#   \r", b" 50%|#####\r 100%|########", b"##\r\n", b"Outputs:\n"]
+    assert lines_of(chunks) == [
+        ("Executing", False),
+        (" 10%|#   ", True),
+        (" 50%|#####", True),
+        (" 100%|##########", False),
+        ("Outputs:", False),
+    ]
+
+
+def test_trailing_carriage_return_at_the_end_of_the_stream():
+    assert lines_of([b"last line\r"]) == [("last line", False)]
+
+
+def test_output_lines_keep_their_subfolder():
+    assert parse_output_line("http://127.0.0.1:8188/view?filename=ComfyUI_00001_.png&subfolder=&type=output") == "ComfyUI_00001_.png"
+    assert parse_output_line("http://127.0.0.1:8188/view?filename=a%20b.png&subfolder=sketch%2Fxl&type=output") == "sketch/xl/a b.png"
+    assert parse_output_line("Saved filename=ComfyUI_00002_.png") == "ComfyUI_00002_.png"
+    assert parse_output_line("Executing node 3") is None
+
+
+def test_reader_reports_outputs_and_phases_as_they_are_printed():
+    outputs = []
+    phases = []
+    echo = io.StringIO()
+    reader = CliOutputReader(outputs.append, lambda name, timestamp: phases.append(name), echo)
+    stream = ChunkedStream([
+        b"Executing workflow\r\n 50%|###  \r 100%|#####\r\n",
+        b"Outputs:\r\nhttp://127.0.0.1:8188/view?filename=ComfyUI_00001_.png&subfolder=&type=output\r",
+        b"\nhttp://127.0.0.1:8188/view?filename=mask.png&subfolder=masks&type=output\r\n",
+        b"Workflow execution completed\r\n",
+    ])
+    split_lines(stream, reader.feed)
+    assert outputs == ["ComfyUI_00001_.png", "masks/mask.png"]
+    assert reader.outputs == outputs
+    assert phases == ["executing", "outputs", "completed"]
+    # Redraws are not echoed or kept for the error report
+    assert " 50%|###  " not in reader.tail
+    assert "50%" not in echo.getvalue()
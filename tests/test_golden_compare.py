@@ -0,0 +1,41 @@
+import threading, time
+import golden_compare
+from golden_compare import GoldenComparer
+
+
+class FakePool:
+    created = 0
+
+    def __init__(self, max_workers=None):
+        # Slow to start, like a real process pool, so concurrent callers overlap
+        time.sleep(0.05)
+        FakePool.created += 1
+
+    def map(self, function, output_paths, golden_paths):
+        return [{"output": output, "golden": golden, "match": True} for output, golden in zip(output_paths, golden_paths)]
+
+    def shutdown(self):
+        pass
+
+
+def test_sharded_workers_share_one_comparison_pool(tmp_path, monkeypatch):
+    monkeypatch.setattr(golden_compare, "ProcessPoolExecutor", FakePool)
+    comparer = GoldenComparer(str(tmp_path / "golden"), "linux", "2.5", "12.4")
+    outputs = {}
+    for workflow in ("a.json", "b.json", "c.json"):
+        outputs[workflow] = []
+        for i in range(golden_compare.POOL_MIN_OUTPUTS):
+            output_path = tmp_path / f"{workflow}-{i}.png"
+            output_path.write_bytes(b"png")
+            outputs[workflow].append(str(output_path))
+        assert comparer.compare(workflow, outputs[workflow])["status"] == "golden_saved"
+
+    results = {}
+    threads = [threading.Thread(target=lambda w=workflow: results.setdefault(w, comparer.compare(w, outputs[w]))) for workflow in outputs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    comparer.close()
+    assert FakePool.created == 1
+    assert all(result["status"] == "match" for result in results.values())
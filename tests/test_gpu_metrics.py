@@ -0,0 +1,89 @@
+import sys, threading, time, types
+import pytest
+import action, gpu_metrics
+from gpu_metrics import FakeBackend, GpuMetricsBackend, NvidiaSmiStreamBackend, NvmlBackend
+from resource_sampler import ResourceSamples
+
+
+def test_backends_must_implement_read():
+    with pytest.raises(TypeError):
+        GpuMetricsBackend()
+
+
+def test_reads_within_max_age_reuse_the_last_reading():
+    backend = FakeBackend(count=2, max_age=60)
+    first = backend.read()
+    assert backend.read() is first
+    assert backend.reads == 1
+    assert [gpu.index for gpu in first] == [0, 1]
+
+    uncached = FakeBackend(max_age=0)
+    assert uncached.read() != uncached.read()
+    assert uncached.reads == 2
+
+
+def test_overhead_counts_the_backend_reads():
+    backend = FakeBackend()
+    assert backend.overhead() == {"backend": "fake", "reads": 0, "mean_read_ms": None, "cpu_seconds": 0.0}
+    for _ in range(3):
+        backend.read()
+    overhead = backend.overhead()
+    assert overhead["reads"] == 3
+    assert overhead["mean_read_ms"] >= 0
+    assert overhead["cpu_seconds"] >= 0
+
+
+def test_resource_samples_follow_the_fake_gpu(monkeypatch):
+    backend = FakeBackend(count=2)
+    monkeypatch.setattr(gpu_metrics, "_backend", backend)
+    monkeypatch.setattr(action, "get_comfy_process", lambda: None)
+    samples = ResourceSamples(0.01)
+    stop_event = threading.Event()
+    thread = threading.Thread(target=action.measure_vram, args=(samples, stop_event))
+    thread.start()
+    time.sleep(0.1)
+    stop_event.set()
+    thread.join()
+    assert len(samples) == backend.reads
+    # The samples follow GPU 0, the summary covers both
+    assert max(samples.columns["vram"]) == samples.summary()["vram"]["max"] > 0
+    assert [gpu["name"] for gpu in samples.gpu_summary()] == ["Fake GPU 0", "Fake GPU 1"]
+    assert samples.gpu_summary()[1]["peak_memory_used"] > samples.gpu_summary()[0]["peak_memory_used"]
+
+
+def test_nvml_warns_once_per_failing_gpu(monkeypatch, capsys):
+    class NVMLError(Exception):
+        pass
+
+    def memory_info(handle):
+        if handle == 1:
+            raise NVMLError("GPU is lost")
+        return types.SimpleNamespace(used=1024 ** 3, total=8 * 1024 ** 3)
+
+    pynvml = types.SimpleNamespace(
+        NVMLError=NVMLError,
+        nvmlInit=lambda: None,
+        nvmlDeviceGetCount=lambda: 2,
+        nvmlDeviceGetHandleByIndex=lambda index: index,
+        nvmlDeviceGetName=lambda handle: b"Test GPU",
+        nvmlDeviceGetMemoryInfo=memory_info,
+        nvmlDeviceGetUtilizationRates=lambda handle: types.SimpleNamespace(gpu=50),
+    )
+    monkeypatch.setitem(sys.modules, "pynvml", pynvml)
+    backend = NvmlBackend()
+    for _ in range(3):
+        assert [gpu.index for gpu in backend.read()] == [0]
+    assert capsys.readouterr().out.count("GPU 1") == 1
+
+
+def test_nvidia_smi_without_gpus_does_not_wait_for_a_reading():
+    # Only the state _read uses, without starting nvidia-smi
+    backend = NvidiaSmiStreamBackend.__new__(NvidiaSmiStreamBackend)
+    GpuMetricsBackend.__init__(backend)
+    backend.gpu_count = 0
+    backend.latest = {}
+    backend.latest_lock = threading.Lock()
+    backend.first_reading = threading.Event()
+    started = time.monotonic()
+    assert backend.read() == []
+    assert time.monotonic() - started < 1
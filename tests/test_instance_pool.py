@@ -0,0 +1,94 @@
+import threading, time
+import instance_pool
+from check_prompt_status import ComfyApiClient
+from instance_pool import ComfyInstance, WorkStealingQueue, run_sharded, split_run_flags, wait_until_ready
+
+
+def test_split_run_flags_strips_the_quotes_action_yml_adds():
+    assert split_run_flags("'--fast --preview-method auto'") == ["--fast", "--preview-method", "auto"]
+    assert split_run_flags("--fast --lowvram") == ["--fast", "--lowvram"]
+    assert split_run_flags("''") == []
+    assert split_run_flags("") == []
+    assert split_run_flags(None) == []
+
+
+def test_launch_instance_passes_each_flag_as_its_own_argument(tmp_path, monkeypatch):
+    commands = []
+    monkeypatch.setattr(instance_pool.subprocess, "Popen", lambda command, **kwargs: commands.append(command))
+    instance_pool.launch_instance(str(tmp_path), 8190, 1, "'--fast --preview-method auto'")
+    instance_pool.launch_instance(str(tmp_path), 8191, None, "''")
+    assert commands[0][-5:] == ["--cuda-device", "1", "--fast", "--preview-method", "auto"]
+    assert commands[1][-1] == "--cpu"
+
+
+def test_work_stealing_queue_hands_out_every_item_once():
+    work_queue = WorkStealingQueue(list(range(10)), 3)
+    taken = []
+    while (item := work_queue.take(0)) is not None:
+        taken.append(item)
+        work_queue.done()
+    assert sorted(taken) == list(range(10))
+    assert work_queue.steals > 0
+
+
+def test_exclusive_items_run_last_and_alone():
+    items = ["a.json", "b.json", "sd3.json", "c.json", "flux.json", "d.json"]
+    running = set()
+    lock = threading.Lock()
+    events = []
+
+    def run_item(instance, item):
+        with lock:
+            events.append(("start", item, frozenset(running)))
+            running.add(item)
+        time.sleep(0.05)
+        with lock:
+            running.discard(item)
+            events.append(("end", item))
+
+    instances = [ComfyInstance(f"http://127.0.0.1:{port}") for port in (8190, 8191, 8192)]
+    completed = run_sharded(instances, items, run_item, exclusive={"sd3.json", "flux.json"})
+    assert sorted(item for _, item in completed) == sorted(items)
+    for event in events:
+        if event[0] == "start" and event[1] in ("sd3.json", "flux.json"):
+            # Nothing else runs next to them and every other workflow already finished
+            assert event[2] == frozenset()
+            assert {e[1] for e in events[:events.index(event)] if e[0] == "end"} >= {"a.json", "b.json", "c.json", "d.json"}
+
+
+def test_failure_stops_new_items_without_blocking_held_ones():
+    def run_item(instance, item):
+        if item == "b.json":
+            raise RuntimeError("boom")
+
+    instances = [ComfyInstance("http://127.0.0.1:8190"), ComfyInstance("http://127.0.0.1:8191")]
+    try:
+        run_sharded(instances, ["a.json", "b.json", "sd3.json"], run_item, exclusive={"sd3.json"})
+    except RuntimeError as e:
+        assert str(e) == "boom"
+    else:
+        raise AssertionError("the failure was not re-raised")
+
+
+def test_sharding_across_stub_servers(stub_servers):
+    instances = [ComfyInstance(server.url) for server in stub_servers]
+    wait_until_ready(instances, 10)
+    clients = {instance.name: ComfyApiClient(instance.url) for instance in instances}
+    outputs = {}
+
+    def run_item(instance, item):
+        client = clients[instance.name]
+        prompt_id = client.queue_prompt({"1": {"class_type": "SaveImage", "inputs": {"name": item}}})
+        outputs[item] = client.wait_for_prompt(prompt_id, 10)
+
+    items = [f"workflow-{i}.json" for i in range(7)]
+    try:
+        completed = run_sharded(instances, items, run_item)
+    finally:
+        for client in clients.values():
+            client.close()
+    assert sorted(item for _, item in completed) == items
+    assert set(outputs) == set(items)
+    # Every server got its share of the prompts
+    assert all(server.prompts for server in stub_servers)
+    assert sum(len(server.prompts) for server in stub_servers) == len(items)
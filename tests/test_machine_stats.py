@@ -0,0 +1,19 @@
+import machine_stats
+
+
+def test_comfy_process_lookup_is_retried_until_it_finds_the_server(monkeypatch):
+    monkeypatch.setattr(machine_stats, "_comfy_processes", {})
+    found = iter([None, "server process"])
+    lookups = []
+
+    def find_comfy_process(port=None):
+        lookups.append(port)
+        return next(found)
+
+    monkeypatch.setattr(machine_stats, "_find_comfy_process", find_comfy_process)
+    # Before the server is up
+    assert machine_stats.get_comfy_process(8188) is None
+    assert machine_stats.get_comfy_process(8188) == "server process"
+    # Found once, kept
+    assert machine_stats.get_comfy_process(8188) == "server process"
+    assert lookups == [8188, 8188]
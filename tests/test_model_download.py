@@ -0,0 +1,84 @@
+import hashlib, importlib.util, os
+import pytest, requests
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def models_prep(monkeypatch):
+    # Loaded from its file, the script name is not importable; small segments keep the test data small
+    spec = importlib.util.spec_from_file_location("default_models_prep", os.path.join(REPO_DIR, "default-models-prep.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    monkeypatch.setattr(module, "SEGMENT_SIZE", 1024)
+    monkeypatch.setattr(module, "DOWNLOAD_CHUNK_SIZE", 64)
+    return module
+
+
+class Progress:
+    def __init__(self):
+        self.n = 0
+
+    def update(self, n):
+        self.n += n
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_sequential_download_resumes_with_a_range_request(models_prep, stub_file_server, tmp_path):
+    stub_file_server.data = os.urandom(10000)
+    temp_path = tmp_path / "model.safetensors.tmp"
+    temp_path.write_bytes(stub_file_server.data[:4000])
+    hash_tracker = hashlib.sha256()
+    progress = Progress()
+    models_prep.download_sequential(stub_file_server.url, str(temp_path), hash_tracker, progress)
+    assert stub_file_server.ranges == ["bytes=4000-"]
+    assert read(temp_path) == stub_file_server.data
+    assert hash_tracker.hexdigest() == hashlib.sha256(stub_file_server.data).hexdigest()
+    assert progress.n == 10000
+
+
+def test_sequential_download_of_a_complete_partial_is_answered_with_416(models_prep, stub_file_server, tmp_path):
+    stub_file_server.data = os.urandom(3000)
+    temp_path = tmp_path / "model.safetensors.tmp"
+    temp_path.write_bytes(stub_file_server.data)
+    hash_tracker = hashlib.sha256()
+    progress = Progress()
+    models_prep.download_sequential(stub_file_server.url, str(temp_path), hash_tracker, progress)
+    assert stub_file_server.ranges == ["bytes=3000-"]
+    assert read(temp_path) == stub_file_server.data
+    assert hash_tracker.hexdigest() == hashlib.sha256(stub_file_server.data).hexdigest()
+    assert progress.n == 3000
+
+
+def test_segmented_download_resumes_each_segment_after_an_interruption(models_prep, stub_file_server, tmp_path):
+    stub_file_server.data = os.urandom(5000)
+    temp_path = str(tmp_path / "model.safetensors.tmp")
+    assert models_prep.probe_download(stub_file_server.url) == (5000, True)
+    # The third segment drops after 600 bytes, its progress was saved at 512
+    stub_file_server.cut_at = {2048: 600}
+    with pytest.raises(requests.exceptions.RequestException):
+        models_prep.download_segmented(stub_file_server.url, temp_path, 5000, 2, hashlib.sha256(), Progress())
+    assert os.path.exists(f"{temp_path}.segments")
+    assert models_prep.SegmentProgress(temp_path, 5000).done[2] == 512
+
+    stub_file_server.cut_at = {}
+    stub_file_server.ranges = []
+    hash_tracker = hashlib.sha256()
+    models_prep.download_segmented(stub_file_server.url, temp_path, 5000, 2, hash_tracker, Progress())
+    assert "bytes=2560-3071" in stub_file_server.ranges
+    assert "bytes=0-1023" not in stub_file_server.ranges
+    assert read(temp_path) == stub_file_server.data
+    assert hash_tracker.hexdigest() == hashlib.sha256(stub_file_server.data).hexdigest()
+    assert not os.path.exists(f"{temp_path}.segments")
+
+
+def test_segment_progress_takes_over_a_sequential_partial(models_prep, tmp_path):
+    temp_path = tmp_path / "model.safetensors.tmp"
+    temp_path.write_bytes(b"x" * 1500)
+    segment_progress = models_prep.SegmentProgress(str(temp_path), 5000)
+    assert segment_progress.segments()[-1] == (4096, 4999)
+    assert segment_progress.done == {0: 1024, 1: 476, 2: 0, 3: 0, 4: 0}
@@ -0,0 +1,28 @@
+import json, threading, time
+import action
+
+
+def test_no_stop_file_without_a_prefetch(tmp_path, monkeypatch):
+    monkeypatch.setattr(action, "prefetch_running", lambda: False)
+    report_path = tmp_path / "model-prefetch.json"
+    assert action.stop_model_prefetch(str(report_path)) is None
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_stop_waits_for_the_final_report_and_cleans_up(tmp_path):
+    report_path = tmp_path / "model-prefetch.json"
+    report_path.write_text(json.dumps({"finished": False}))
+    stop_path = tmp_path / "model-prefetch.json.stop"
+
+    def prefetch():
+        # Stands in for default-models-prep.py --prefetch noticing the stop file
+        while not stop_path.exists():
+            time.sleep(0.01)
+        report_path.write_text(json.dumps({"finished": True, "stopped": True, "warmed_bytes": 0, "not_reached": ["a"]}))
+
+    thread = threading.Thread(target=prefetch)
+    thread.start()
+    report = action.stop_model_prefetch(str(report_path), timeout=5)
+    thread.join()
+    assert report["stopped"] and report["not_reached"] == ["a"]
+    assert not stop_path.exists()
@@ -0,0 +1,19 @@
+from resource_sampler import ResourceSamples
+
+
+def time_series_keys(interval, count):
+    samples = ResourceSamples(interval)
+    for i in range(count):
+        samples.append(i * interval, 1024.0, 50.0, 2048.0, 12.5)
+    return list(samples.to_time_series())
+
+
+def test_time_series_keys_keep_the_baseline_format():
+    assert time_series_keys(0.5, 3) == ["0.0 seconds", "0.5 seconds", "1.0 seconds"]
+    assert time_series_keys(0.1, 4) == ["0.0 seconds", "0.1 seconds", "0.2 seconds", "0.3 seconds"]
+
+
+def test_time_series_values():
+    samples = ResourceSamples(0.5)
+    samples.append(0.0, 1024.0, 50.0, 2048.0, 12.5)
+    assert samples.to_time_series() == {"0.0 seconds": "1024.0 MiB,50.0,2048.0 MiB,12.50"}
@@ -0,0 +1,22 @@
+import json, os, types
+from result_cache import get_workflow_input_files, workflow_fingerprint
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ARGS = types.SimpleNamespace(commit_hash="abc", os="linux", python_version="3.10", torch_version="2.5", cuda_version="12.4", comfy_run_flags="")
+
+
+def test_the_sketch_workflow_reads_its_scribble_input():
+    with open(os.path.join(REPO_DIR, "workflows", "xl_sketch_control.json"), "r", encoding="utf-8") as f:
+        workflow = json.load(f)
+    assert get_workflow_input_files(workflow) == {"input_scribble_example.png"}
+
+
+def test_fingerprint_changes_with_the_input_images(tmp_path):
+    workflow = {"11": {"class_type": "LoadImage", "inputs": {"image": "sketch.png [input]", "upload": "image"}}}
+    missing = workflow_fingerprint(workflow, ARGS, {}, input_dir=str(tmp_path))
+    (tmp_path / "sketch.png").write_bytes(b"first sketch")
+    first = workflow_fingerprint(workflow, ARGS, {}, input_dir=str(tmp_path))
+    assert first == workflow_fingerprint(workflow, ARGS, {}, input_dir=str(tmp_path))
+    (tmp_path / "sketch.png").write_bytes(b"second sketch")
+    second = workflow_fingerprint(workflow, ARGS, {}, input_dir=str(tmp_path))
+    assert len({missing, first, second}) == 3
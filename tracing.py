@@ -0,0 +1,109 @@
+"""
+Trace of a whole action run in the Trace Event Format, loads in https://ui.perfetto.dev and chrome://tracing.
+
+Spans are recorded per thread with monotonic timestamps, so nested spans on the same thread show up nested.
+Recording is off until enable() is called, span() then costs next to nothing.
+Reference: https://docs.google.com/document/d/1CvAClvFfyA5R-PhYUmn5OOQtYMH4h6I0nSsKchNAySU
+"""
+import contextlib, json, os, threading, time
+
+PROCESS_NAME = "comfy-action"
+# Thread ids of named tracks start here, above the OS thread ids of real threads
+SYNTHETIC_TID_BASE = 1 << 30
+
+
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        # Timestamps are microseconds since the epoch, taken from the monotonic clock anchored once at this wall time
+        self.wall_origin = time.time()
+        self.monotonic_origin = time.monotonic()
+        self.named_threads = set()
+        self.tracks = {}
+
+    def to_us(self, monotonic_time):
+        return round((self.wall_origin + monotonic_time - self.monotonic_origin) * 1e6, 1)
+
+    def wall_to_us(self, wall_time):
+        return round(wall_time * 1e6, 1)
+
+    def _thread_id(self):
+        thread = threading.current_thread()
+        tid = thread.native_id
+        if tid not in self.named_threads:
+            self.named_threads.add(tid)
+            self.events.append({"ph": "M", "name": "thread_name", "pid": self.pid, "tid": tid, "args": {"name": thread.name}})
+        return tid
+
+    def add_event(self, event, track=None):
+        with self.lock:
+            event.setdefault("pid", self.pid)
+            if track is not None:
+                # Named tracks get their own synthetic thread, e.g. events that were recorded by another process
+                if track not in self.tracks:
+                    self.tracks[track] = SYNTHETIC_TID_BASE + len(self.tracks)
+                    self.events.append({"ph": "M", "name": "thread_name", "pid": self.pid, "tid": self.tracks[track], "args": {"name": track}})
+                event["tid"] = self.tracks[track]
+            else:
+                event["tid"] = self._thread_id()
+            self.events.append(event)
+
+    def complete(self, name, start_us, end_us, category="action", args=None, track=None):
+        if not self.enabled:
+            return
+        event = {"ph": "X", "name": name, "cat": category, "ts": start_us, "dur": round(max(end_us - start_us, 0), 1)}
+        if args:
+            event["args"] = args
+        self.add_event(event, track)
+
+    @contextlib.contextmanager
+    def span(self, name, category="action", **args):
+        if not self.enabled:
+            yield args
+            return
+        start = time.monotonic()
+        try:
+            # Callers can add to args while the span is open, e.g. the outcome of what it measures
+            yield args
+        except BaseException as e:
+            args["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self.complete(name, self.to_us(start), self.to_us(time.monotonic()), category, args)
+
+    def counters(self, name, timestamps, columns):
+        """
+            One counter track per column, timestamps on the monotonic clock.
+        """
+        if not self.enabled:
+            return
+        for column, values in columns.items():
+            with self.lock:
+                self.events.extend(
+                    {"ph": "C", "name": f"{name} {column}", "pid": self.pid, "ts": self.to_us(timestamp), "args": {column: value}}
+                    for timestamp, value in zip(timestamps, values)
+                )
+
+    def write(self, path):
+        with self.lock:
+            events = [{"ph": "M", "name": "process_name", "pid": self.pid, "args": {"name": PROCESS_NAME}}] + self.events
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        os.replace(temp_path, path)
+        return len(events)
+
+
+# One tracer for the whole action, shared by every module that records spans
+tracer = Tracer()
+
+
+def enable():
+    tracer.enabled = True
+
+
+def span(name, category="action", **args):
+    return tracer.span(name, category, **args)
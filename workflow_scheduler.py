@@ -0,0 +1,133 @@
+import itertools, json, math, os
+
+# Loader node inputs that name a model file, and the models/ subdirectory the file lives in
+LOADER_INPUTS = {
+    "CheckpointLoaderSimple": {"ckpt_name": "checkpoints"},
+    "CheckpointLoader": {"ckpt_name": "checkpoints"},
+    "LoraLoader": {"lora_name": "loras"},
+    "LoraLoaderModelOnly": {"lora_name": "loras"},
+    "CLIPLoader": {"clip_name": "clip"},
+    "DualCLIPLoader": {"clip_name1": "clip", "clip_name2": "clip"},
+    "TripleCLIPLoader": {"clip_name1": "clip", "clip_name2": "clip", "clip_name3": "clip"},
+    "ControlNetLoader": {"control_net_name": "controlnet"},
+    "DiffControlNetLoader": {"control_net_name": "controlnet"},
+    "UNETLoader": {"unet_name": "unet"},
+    "VAELoader": {"vae_name": "vae"},
+}
+# SD3 and Flux need the most RAM, so they always run after everything else
+LATE_WORKFLOW_PREFIXES = ("sd3", "flux")
+# Above this many candidate orders the scheduler falls back to a greedy nearest-neighbour order
+MAX_EXHAUSTIVE_ORDERS = 50000
+# Run when the workflow names are "auto"
+DEFAULT_WORKFLOWS = ["sd15_default.json", "sd15_lora.json", "xl_default.json", "xl_sketch_control.json", "mixed_15_xl_addrefine.json"]
+# Note: SD3 and Flux are intentionally Linux-only (due to RAM limits on other main machines) and also intentionally at the end
+LINUX_ONLY_WORKFLOWS = ["sd3_default.json", "sd3_multi_prompt.json", "sd3-single-t5.json", "flux_schnell_fp8_default.json"]
+
+
+def get_workflow_models(workflow):
+    """
+        Models a workflow loads, as paths relative to the models directory (the same keys as MODELS in default-models-prep.py).
+    """
+    models = set()
+    for node in workflow.values():
+        for input_name, model_dir in LOADER_INPUTS.get(node.get("class_type"), {}).items():
+            model_name = node.get("inputs", {}).get(input_name)
+            if isinstance(model_name, str):
+                models.add(f"{model_dir}/{model_name}")
+    return models
+
+
+def model_size(models_dir, model):
+    try:
+        return os.path.getsize(os.path.join(models_dir, model))
+    except (OSError, TypeError):
+        return None
+
+
+def reload_cost(order, workflow_models, sizes):
+    """
+        Sum of the sizes of the models loaded from disk when running workflows in order, assuming the server keeps exactly the previous
+        workflow's models loaded, like ComfyUI's default cache keeps the previous prompt's loader outputs.
+    """
+    cost = 0
+    resident = set()
+    for workflow_name in order:
+        models = workflow_models[workflow_name]
+        cost += sum(sizes[model] for model in models - resident)
+        resident = models
+    return cost
+
+
+def _greedy_order(workflow_names, workflow_models, sizes, resident):
+    remaining = list(workflow_names)
+    order = []
+    while remaining:
+        best = min(remaining, key=lambda name: sum(sizes[model] for model in workflow_models[name] - resident))
+        remaining.remove(best)
+        order.append(best)
+        resident = workflow_models[best]
+    return order
+
+
+def schedule_workflows(workflow_files, workflows_dir="workflows", models_dir=None):
+    """
+        Reorders workflow_files to minimise the bytes of models reloaded between consecutive workflows (or the number of
+        reloads when not every model file can be found in models_dir), keeping SD3 and Flux last.
+        Returns (order, estimate) where estimate holds the reloads and reloaded bytes of the given and the new order.
+    """
+    workflow_models = {}
+    for workflow_file_name in workflow_files:
+        with open(os.path.join(workflows_dir, workflow_file_name), "r", encoding="utf-8") as f:
+            workflow_models[workflow_file_name] = get_workflow_models(json.load(f))
+    all_models = set().union(*workflow_models.values()) if workflow_models else set()
+    sizes = {model: model_size(models_dir, model) for model in all_models}
+    counts = {model: 1 for model in all_models}
+    sizes_known = all(size is not None for size in sizes.values())
+    weights = sizes if sizes_known else counts
+
+    late = [name for name in workflow_files if name.startswith(LATE_WORKFLOW_PREFIXES)]
+    early = [name for name in workflow_files if name not in late]
+    if math.factorial(len(early)) * math.factorial(len(late)) <= MAX_EXHAUSTIVE_ORDERS:
+        candidates = (list(e) + list(l) for e in itertools.permutations(early) for l in itertools.permutations(late))
+        # min() keeps the first of equally good orders, so ties keep the given order
+        order = min(candidates, key=lambda candidate: reload_cost(candidate, workflow_models, weights))
+    else:
+        order = _greedy_order(early, workflow_models, weights, set())
+        order += _greedy_order(late, workflow_models, weights, workflow_models[order[-1]] if order else set())
+
+    estimate = {
+        "original_reloads": reload_cost(workflow_files, workflow_models, counts),
+        "scheduled_reloads": reload_cost(order, workflow_models, counts),
+        "original_bytes": reload_cost(workflow_files, workflow_models, sizes) if sizes_known else None,
+        "scheduled_bytes": reload_cost(order, workflow_models, sizes) if sizes_known else None,
+    }
+    return order, estimate
+
+
+def select_workflows(names, os_name, workflow_order="auto", workflows_dir="workflows", models_dir=None):
+    """
+        The workflows of a run in the order they run. names is comma separated or "auto" for the default set on os_name;
+        workflow_order is "given", "model-affinity" or "auto" (reorder only the default set).
+        Returns (given, order, estimate), estimate being None when the given order is kept.
+    """
+    if names == "auto":
+        given = DEFAULT_WORKFLOWS + (LINUX_ONLY_WORKFLOWS if os_name == "linux" else [])
+    else:
+        given = names.split(",")
+    if workflow_order == "model-affinity" or (workflow_order == "auto" and names == "auto"):
+        order, estimate = schedule_workflows(given, workflows_dir, models_dir)
+        return given, order, estimate
+    return given, given, None
+
+
+def models_in_use_order(workflow_files, workflows_dir="workflows", models_dir=None):
+    """
+        Every model the workflows load, in the order they are first needed. Within a workflow the largest come first.
+    """
+    ordered = []
+    for workflow_file_name in workflow_files:
+        with open(os.path.join(workflows_dir, workflow_file_name), "r", encoding="utf-8") as f:
+            models = get_workflow_models(json.load(f))
+        for model in sorted(models - set(ordered), key=lambda model: -(model_size(models_dir, model) or 0)):
+            ordered.append(model)
+    return ordered